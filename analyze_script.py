@@ -0,0 +1,46 @@
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+from state_machine.helpers import LoggerUtils
+from state_machine.script_analyzer import INDEX_FILE_NAME, REPORT_ERRORS, REPORT_WARNINGS, analyze_script, has_errors, save_transition_index
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Check a script directory and build its transition index')
+    parser.add_argument('--script_dir', type=Path, default='scripts/friendly-fires', help='Path to the script directory')
+    parser.add_argument('--report', type=Path, default=None, help='Write the full report to this JSON file')
+    parser.add_argument('--index', type=Path, default=None, help=f'Transition index path (default: <script_dir>/{INDEX_FILE_NAME})')
+    parser.add_argument('--typeform_path', type=Path, default='output/typeform.json', help='Typeform data defining the visitor placeholders')
+    parser.add_argument('--log', type=str, default='WARNING', help='Log level')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=args.log)
+
+    report, index = analyze_script(args.script_dir, args.typeform_path)
+
+    print(f"Script '{args.script_dir}': {report['scenes']} scenes, {len(report['reachable'])} reachable from the initial scene\n{LoggerUtils.HR}")
+    for key in REPORT_ERRORS + REPORT_WARNINGS:
+        if report[key]:
+            level = "ERROR" if key in REPORT_ERRORS else "WARNING"
+            print(f"{level} {key}:\n{json.dumps(report[key], indent=2)}")
+    for key in ["unused_behaviors", "unused_personas", "unused_few_shots"]:
+        if report[key]:
+            print(f"INFO {key}: {', '.join(report[key])}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to '{args.report}'")
+
+    if index is not None:
+        index_path = args.index or Path(args.script_dir, INDEX_FILE_NAME)
+        save_transition_index(index_path, index, report["fingerprint"])
+        print(f"Transition index written to '{index_path}'")
+
+    sys.exit(1 if has_errors(report) else 0)
@@ -2,36 +2,15 @@ import logging
 
 
 from .defaults import available_llms, default_llm, DICT_LLMS
-from .groq_chat import configure_groq, get_groq_llm_response
-from .ollama_chat import configure_ollama, get_ollama_llm_response
-from .openai_chat import configure_openai, get_llm_instruct_response, get_gpt_response
-from .openrouter_chat import configure_openrouter, get_openrouter_response
-from .xai_chat import configure_incel, get_incel_response
+from .registry import get_provider
 
 
 class LLM:
 
   def __init__(self, name_model):
-    if name_model in available_llms("gpt3"):
-      self._client = configure_openai()
-      self._name_model = name_model
-    elif name_model in available_llms("gpt4"):
-      self._client = configure_openai()
-      self._name_model = name_model
-    elif name_model in available_llms("groq"):
-      self._client = configure_groq()
-      self._name_model = name_model
-    elif name_model in available_llms("ollama"):
-      configure_ollama()
-      self._name_model = name_model
-    elif name_model in available_llms("xai"):
-      self._client = configure_incel()
-      self._name_model = name_model
-    elif name_model in available_llms("openrouter"):
-      self._client = configure_openrouter()
-      self._name_model = name_model
-    else:
-      raise Exception(f"Unknown LLM: {name_model}")
+    self._provider   = get_provider(name_model)
+    self._client     = self._provider.configure()
+    self._name_model = name_model
     logging.info(f"[LLM] Initialising {name_model}")
 
 
@@ -49,20 +28,7 @@ class LLM:
 
 
   def call(self, prompt, timestamp, callback, personae = None, take_first_line: bool = True):
-    if self._name_model in available_llms("gpt3"):
-      return get_llm_instruct_response(self._client, callback, personae, model_name=self._name_model, prompt=prompt, timestamp=timestamp, take_first_line=take_first_line)
-    elif self._name_model in available_llms("gpt4"):
-      return get_gpt_response(self._client, callback, personae, model_name=self._name_model, prompt=prompt, timestamp=timestamp, take_first_line=take_first_line)
-    elif self._name_model in available_llms("groq"):
-      return get_groq_llm_response(self._client, callback, personae, model_name=self._name_model, prompt=prompt, timestamp=timestamp, take_first_line=take_first_line)
-    elif self._name_model in available_llms("ollama"):
-      return get_ollama_llm_response(callback, personae, model_name=self._name_model, prompt=prompt, timestamp=timestamp, take_first_line=take_first_line)
-    elif self._name_model in available_llms("xai"):
-      return get_incel_response(self._client, callback, personae, model_name=self._name_model, prompt=prompt, timestamp=timestamp, take_first_line=take_first_line)
-    elif self._name_model in available_llms("openrouter"):
-      return get_openrouter_response(self._client, callback, personae, model_name=self._name_model, prompt=prompt, timestamp=timestamp, take_first_line=take_first_line)
-    else:
-      raise Exception(f"Unknown LLM: {self._name_model}")
+    return self._provider.respond(self._client, callback, personae, model_name=self._name_model, prompt=prompt, timestamp=timestamp, take_first_line=take_first_line)
 
 
 def test_llms():
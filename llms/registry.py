@@ -0,0 +1,94 @@
+import importlib
+import logging
+import threading
+
+from .defaults import DICT_LLMS
+
+
+class Provider:
+  """A family of models served by one client module, imported on first use."""
+
+  def __init__(self, family: str, module: str, configure: str, respond: str, uses_client: bool = True):
+    self.family      = family
+    self.module      = module
+    self.uses_client = uses_client
+    self._names      = (configure, respond)
+    self._functions  = None
+    self._lock       = threading.Lock()
+
+
+  def _load(self):
+    with self._lock:
+      if self._functions is None:
+        logging.info(f"[LLM] Loading provider '{self.family}' from '{self.module}'")
+        module = importlib.import_module(self.module, __package__)
+        self._functions = tuple(getattr(module, name) for name in self._names)
+    return self._functions
+
+
+  def configure(self):
+    configure, _ = self._load()
+    return configure()
+
+
+  def respond(self, client, callback, personae=None, **kwargs):
+    _, respond = self._load()
+    if self.uses_client:
+      return respond(client, callback, personae, **kwargs)
+    return respond(callback, personae, **kwargs)
+
+
+
+PROVIDERS: dict[str, Provider] = {}
+_MODEL_FAMILIES: dict[str, str] = {}
+# Model serving every LLM request, see `override_llms`.
+_override_model: str = None
+
+
+def register_provider(family: str, module: str, configure: str, respond: str, uses_client: bool = True, models: list[str] = None):
+  """Register the client module of a family of models.
+
+  `module` is only imported when a model of the family is first requested.
+  `models` are added to `DICT_LLMS[family]`.
+  """
+  PROVIDERS[family] = Provider(family, module, configure, respond, uses_client)
+  if models:
+    DICT_LLMS.setdefault(family, [])
+    DICT_LLMS[family].extend(m for m in models if m not in DICT_LLMS[family])
+  _MODEL_FAMILIES.clear()
+
+
+def override_llms(name_model: str = None):
+  """Serve every model with the provider of `name_model`, e.g. a stub model to run offline, None to stop."""
+  global _override_model
+  _override_model = None
+  if name_model is not None:
+    get_provider(name_model)
+    logging.info(f"[LLM] All models are served by '{name_model}'")
+  _override_model = name_model
+
+
+def get_provider(name_model: str) -> Provider:
+  name_model = _override_model or name_model
+  if not _MODEL_FAMILIES:
+    for family, names in DICT_LLMS.items():
+      for name in names:
+        _MODEL_FAMILIES.setdefault(name, family)
+  family = _MODEL_FAMILIES.get(name_model, None)
+  if family not in PROVIDERS:
+    raise Exception(f"Unknown LLM: {name_model}")
+  return PROVIDERS[family]
+
+
+register_provider("gpt3",       ".openai_chat",     "configure_openai",     "get_llm_instruct_response")
+register_provider("gpt4",       ".openai_chat",     "configure_openai",     "get_gpt_response")
+register_provider("groq",       ".groq_chat",       "configure_groq",       "get_groq_llm_response")
+register_provider("ollama",     ".ollama_chat",     "configure_ollama",     "get_ollama_llm_response", uses_client=False)
+register_provider("xai",        ".xai_chat",        "configure_incel",      "get_incel_response")
+register_provider("openrouter", ".openrouter_chat", "configure_openrouter", "get_openrouter_response")
+
+# Local models answering without any API key, for benchmarks and tests (see `stub_chat`).
+register_provider("stub-echo",     ".stub_chat",       "configure_stub",       "get_stub_echo_response",     models=["stub-echo"])
+register_provider("stub-canned",   ".stub_chat",       "configure_stub",       "get_stub_canned_response",   models=["stub-canned"])
+register_provider("stub-template", ".stub_chat",       "configure_stub",       "get_stub_template_response", models=["stub-template"])
+STUB_LLMS = ["stub-echo", "stub-canned", "stub-template"]
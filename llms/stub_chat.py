@@ -0,0 +1,142 @@
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from .defaults import extract_response
+
+
+CANNED_RESPONSES = [
+  "I see. Tell me more about that.",
+  "That is very interesting, please go on.",
+  "How does that make you feel?",
+  "I understand. What happened next?",
+  "Let us take a moment to think about this.",
+]
+
+DEFAULT_TEMPLATE = "{speaker} answers message {count} after: {last_line}"
+
+SPEAKER_EXPR = re.compile(r'\*\*(.+?):\*\*\s*$')
+
+
+def parse_latency(spec: str):
+  """Return a function sampling a latency in seconds from `spec`.
+
+  `spec` is `<seconds>`, `constant:<seconds>`, `uniform:<min>,<max>`,
+  `normal:<mean>,<std>`, `lognormal:<median>,<sigma>` or `exponential:<mean>`.
+  """
+  name, _, params = spec.partition(":") if ":" in spec else ("constant", "", spec)
+  params = [float(param) for param in params.split(",") if param.strip()]
+
+  if name == "constant" and len(params) == 1:
+    return lambda rng: params[0]
+  elif name == "uniform" and len(params) == 2:
+    return lambda rng: rng.uniform(params[0], params[1])
+  elif name == "normal" and len(params) == 2:
+    return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+  elif name == "lognormal" and len(params) == 2:
+    return lambda rng: rng.lognormvariate(math.log(params[0]), params[1])
+  elif name == "exponential" and len(params) == 1:
+    return lambda rng: rng.expovariate(1 / params[0]) if params[0] > 0 else 0.0
+  raise ValueError(f"Invalid stub LLM latency '{spec}'")
+
+
+class StubClient:
+  """Latency, failures and responses of the stub models, drawn from a seeded generator."""
+
+  def __init__(self, latency: str = "0", failure_rate: float = 0.0, seed: int = 0, canned: list[str] = None, template: str = DEFAULT_TEMPLATE):
+    self.latency      = parse_latency(latency)
+    self.failure_rate = failure_rate
+    self.canned       = canned or CANNED_RESPONSES
+    self.template     = template
+    self.calls        = 0
+    self._rng         = random.Random(seed)
+    self._lock        = threading.Lock()
+
+
+  def draw(self):
+    """Return the call number, its latency and whether it fails."""
+    with self._lock:
+      self.calls += 1
+      return self.calls, self.latency(self._rng), self._rng.random() < self.failure_rate
+
+
+  def choice(self, items):
+    with self._lock:
+      return self._rng.choice(items)
+
+
+def configure_stub():
+  canned_path = os.environ.get("STUB_LLM_CANNED")
+  canned = None
+  if canned_path:
+    with open(canned_path, "r", encoding="utf-8") as f:
+      canned = [line.strip() for line in f if line.strip()]
+
+  client = StubClient(
+    latency      = os.environ.get("STUB_LLM_LATENCY", "0"),
+    failure_rate = float(os.environ.get("STUB_LLM_FAILURE_RATE", "0")),
+    seed         = int(os.environ.get("STUB_LLM_SEED", "0")),
+    canned       = canned,
+    template     = os.environ.get("STUB_LLM_TEMPLATE", DEFAULT_TEMPLATE),
+  )
+  logging.info(f"[LLM] Configured stub LLM, latency {os.environ.get('STUB_LLM_LATENCY', '0')}, failure rate {client.failure_rate}")
+  return client
+
+
+def get_prompt_fields(prompt: str):
+  """Speaker asked to answer and last line of the transcript, from the end of the prompt."""
+  lines = [line.strip() for line in prompt.strip().split("\n") if line.strip()]
+  speaker = "Bot"
+  if lines and SPEAKER_EXPR.search(lines[-1]):
+    speaker = SPEAKER_EXPR.search(lines[-1]).group(1)
+    lines = lines[:-1]
+  return speaker, lines[-1] if lines else ""
+
+
+def _respond(stub_client, callback, model_name, prompt, timestamp, take_first_line, get_response):
+  count, latency, fails = stub_client.draw()
+  time.sleep(latency)
+  if fails:
+    logging.warning(f"[Stub LLM] Simulated failure of call {count} to {model_name}")
+    return callback(prompt, None, timestamp)
+
+  response = extract_response(get_response(count), take_first_line)
+  return callback(prompt, response, timestamp)
+
+
+def get_stub_echo_response(stub_client,
+                           callback,
+                           personae = None,
+                           model_name: str = "stub-echo",
+                           prompt: str = "",
+                           timestamp: int = 0,
+                           take_first_line: bool = True):
+  _, last_line = get_prompt_fields(prompt)
+  return _respond(stub_client, callback, model_name, prompt, timestamp, take_first_line, lambda count: last_line)
+
+
+def get_stub_canned_response(stub_client,
+                             callback,
+                             personae = None,
+                             model_name: str = "stub-canned",
+                             prompt: str = "",
+                             timestamp: int = 0,
+                             take_first_line: bool = True):
+  return _respond(stub_client, callback, model_name, prompt, timestamp, take_first_line, lambda count: stub_client.choice(stub_client.canned))
+
+
+def get_stub_template_response(stub_client,
+                               callback,
+                               personae = None,
+                               model_name: str = "stub-template",
+                               prompt: str = "",
+                               timestamp: int = 0,
+                               take_first_line: bool = True):
+  speaker, last_line = get_prompt_fields(prompt)
+  fields = {"speaker": speaker, "last_line": last_line, "count": None, "model": model_name, "prompt_chars": len(prompt)}
+  return _respond(stub_client, callback, model_name, prompt, timestamp, take_first_line,
+                  lambda count: stub_client.template.format(**dict(fields, count=count)))
@@ -0,0 +1,62 @@
+import argparse
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from llms.registry import STUB_LLMS, override_llms
+from state_machine.benchmark import compare_reports, run_benchmarks
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the scene engine on a script, headless and with a stub LLM')
+    parser.add_argument('--script_dir', type=Path, default='scripts/friendly-fires', help='Path to the script directory')
+    parser.add_argument('--output_root', type=Path, default='output', help='Output directory root')
+    parser.add_argument('--start_scene', type=str, default=None, help='Start scene')
+    parser.add_argument('--turns', type=int, default=200, help='User messages of the benchmarked session')
+    parser.add_argument('--reps', type=int, default=5, help='Repetitions of the cold start measurements')
+    parser.add_argument('--stub_llm', type=str, default='stub-template', choices=STUB_LLMS, help='Stub model answering every LLM call, see STUB_LLM_* variables')
+    parser.add_argument('--compare', type=Path, default=None, help='benchmark.json of a previous run to compare with')
+    parser.add_argument('--log', type=str, default='CRITICAL', help='Log level')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    FORMAT = '%(asctime)s %(levelname)s: %(message)s [%(filename)s:%(lineno)s]'
+    logging.basicConfig(format=FORMAT, level=args.log)
+
+    override_llms(args.stub_llm)
+
+    output_path = Path(args.output_root, "benchmark", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    report = run_benchmarks(args.script_dir, output_path, args.turns, args.reps, args.start_scene, args.stub_llm)
+
+    report_path = Path(output_path, "benchmark.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Cold start {report['cold_start']['cold']['mean']:.1f} ms, warm {report['cold_start']['warm']['mean']:.1f} ms")
+    print(f"{report['frames']['count']} frames: {report['frames']['mean']:.2f} ms mean, {report['frames']['p95']:.2f} ms p95, {report['frames']['max']:.1f} ms max")
+    print(f"StatusObject: {report['status_object']['mean']:.2f} ms mean, {report['status_object']['max']:.2f} ms max")
+    for length, ms in report['placeholders'].items():
+        print(f"Prompt with {length:>4} chat lines: {ms['mean']:.3f} ms")
+    print(f"Memory: {report['memory']['growth_mb']:.2f} MB over {args.turns} turns in {report['sessions']} sessions")
+    for scene, ms in report['scene_enter'].items():
+        print(f"{ms['mean']:9.1f} ms {ms['max']:9.1f} ms max  {scene}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} ({baseline.get('commit')})")
+        for row in compare_reports(baseline, report):
+            change = f"{row['change']:+.1%}" if row['change'] is not None else "-"
+            print(f"{row['metric']:32} {row['baseline'] or 0:10.2f} {row['value'] or 0:10.2f} {change:>8}")
+
+    print(f"Report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
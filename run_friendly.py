@@ -1,12 +1,21 @@
 import argparse
 import logging
+import sys
 from pathlib import Path
 
+from state_machine.helpers import ImportProfiler, LoggerUtils, SessionLogFilter, get_log_session
+# The imports are only timed for `--import_report`, before the arguments are parsed.
+import_profiler = ImportProfiler().start() if "--import_report" in sys.argv else None
+
 from llms import llm
+from llms.registry import STUB_LLMS, override_llms
 from state_machine import scenemanager
 from state_machine.flask_app import run_flask
+from state_machine.session_manager import DEFAULT_SESSION
 from datetime import datetime
-from state_machine.helpers import LoggerUtils
+
+if import_profiler:
+    import_profiler.stop()
 
 from pathlib import Path
 
@@ -29,6 +38,7 @@ def parse_args():
     parser.add_argument('--wait_for_speak_callback', action='store_true', help='Wait for speak callback, test mode only')
 
     parser.add_argument('--server_name', type=str, default='127.0.0.1:5050', help='Server hostname and port')
+    parser.add_argument('--hub_url', type=str, default=scenemanager.HUB_URL, help='Message hub URL of the default session')
 
     parser.add_argument('--llm_name', type=str, default=llm.LLM.default_name(), help='LLM name for simulation')
     parser.add_argument('--few_shots', type=str, default='', help='Name of few-shots prompts')
@@ -37,27 +47,38 @@ def parse_args():
 
     parser.add_argument('--exit_on_complete', action='store_true', help='Exit on completion')
     parser.add_argument('--auto_think', action='store_true', help='Auto Think')
+    parser.add_argument('--hot_reload', action='store_true', help='Reload edited behaviors, personas and scenes without restarting')
+    parser.add_argument('--lazy_scenes', action='store_true', help='Load the first scenes up front and prefetch the others in the background')
+    parser.add_argument('--import_report', action='store_true', help='Print the import time of each module at startup')
+    parser.add_argument('--llm_workers', type=int, default=4, help='Threads generating the character responses, 0 to generate them in the update loop')
+    parser.add_argument('--speculative', action='store_true', help='Generate the next bot response from the partial transcript while the user speaks')
+    parser.add_argument('--speculative_similarity', type=float, default=0.8, help='Minimum similarity between the partial and final transcript to use a speculative response')
+    parser.add_argument('--transcript_keep_turns', type=int, default=20, help='Chat lines kept verbatim in the prompts with a transcript_budget')
+    parser.add_argument('--transcript_summary_every', type=int, default=10, help='Chat lines after which the summary of the earlier lines is updated')
+    parser.add_argument('--summary_llm_name', type=str, default=None, help='LLM name of the transcript summaries, defaults to --llm_name')
+    parser.add_argument('--record', action='store_true', help='Record the session in recording.jsonl, to replay it with run_replay.py')
+    parser.add_argument('--stub_llm', type=str, default=None, choices=STUB_LLMS, help='Answer every LLM call with a local stub model, see STUB_LLM_* variables')
     
     parser.add_argument('--patient_data_path', type=Path, default="data/patient_template_examples/patient_template-hans.json", help='Path to patient persona')
 
     return parser.parse_args()
 
 def setup_logging(output_path):
+    """Log file of the session being created, the scene manager removes it when it is closed.
+
+    Each session has its own handler, that only keeps the records of the
+    threads of the session (see `SessionLogFilter`). The default session also
+    gets the records of the Flask requests.
+    """
     FORMAT = '%(asctime)s %(levelname)s: %(message)s [%(filename)s:%(lineno)s]'
     # logging.basicConfig(format=FORMAT, level="INFO")
 
-    log_file = Path(output_path, "friendly-bot.log")
-
-    # If no filehandler attached
-    if not any(isinstance(handler, logging.FileHandler) for handler in logging.getLogger().handlers):
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setFormatter(logging.Formatter(FORMAT))
-        logging.getLogger().addHandler(file_handler)
-    # Update path if different
-    else:
-        for handler in logging.getLogger().handlers:
-            if isinstance(handler, logging.FileHandler):
-                handler.baseFilename = log_file
+    session_id = get_log_session()
+    file_handler = logging.FileHandler(Path(output_path, "friendly-bot.log"), encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(FORMAT))
+    file_handler.addFilter(SessionLogFilter(session_id, others=session_id in (None, DEFAULT_SESSION)))
+    logging.getLogger().addHandler(file_handler)
+    return file_handler
 
                 
 def get_output_path(output_root):
@@ -69,7 +90,7 @@ def get_output_path(output_root):
 
 def get_simulation_scene_manager(mode, **kwargs):
     output_path = get_output_path(kwargs['output_root'])
-    setup_logging(output_path)
+    kwargs['log_handler'] = setup_logging(output_path)
     logging.info("Running in '{}' mode\n{}\n{}".format('simulation', LoggerUtils.pretty_format_args(kwargs), LoggerUtils.HR))
 
     model = scenemanager.SceneManagerData()
@@ -85,7 +106,7 @@ def get_simulation_scene_manager(mode, **kwargs):
 
 def get_scene_manager_test(**kwargs):
     output_path = get_output_path(kwargs['output_root'])
-    setup_logging(output_path)
+    kwargs['log_handler'] = setup_logging(output_path)
     logging.info("Running in '{}' mode\n{}\n{}".format('test', LoggerUtils.pretty_format_args(kwargs), LoggerUtils.HR))
 
     model = scenemanager.SceneManagerData()
@@ -98,7 +119,7 @@ def get_scene_manager_test(**kwargs):
 
 def get_scene_manager_perform(**kwargs):
     output_path = get_output_path(kwargs['output_root'])
-    setup_logging(output_path)
+    kwargs['log_handler'] = setup_logging(output_path)
 
     logging.info("Running in '{}' mode\n{}\n{}".format('perform', LoggerUtils.pretty_format_args(kwargs), LoggerUtils.HR))
     model = scenemanager.SceneManagerData()
@@ -118,6 +139,11 @@ def main():
     FORMAT = '%(asctime)s %(levelname)s: %(message)s [%(filename)s:%(lineno)s]'
     logging.basicConfig(format=FORMAT, level=args.log)
 
+    if import_profiler:
+        print(import_profiler.report())
+
+    if args.stub_llm:
+        override_llms(args.stub_llm)
 
     args = dict(args._get_kwargs())
     if args['mode'] == 'simulation':
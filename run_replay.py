@@ -0,0 +1,50 @@
+import argparse
+import cProfile
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from state_machine.replay import replay_session
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay a recorded session without calling any LLM')
+    parser.add_argument('recording', type=Path, help='Path to the recording.jsonl of a session recorded with --record')
+    parser.add_argument('--output_root', type=Path, default='output', help='Output directory root')
+    parser.add_argument('--script_dir', type=Path, default=None, help='Path to the script directory, defaults to the recorded one')
+    parser.add_argument('--profile', action='store_true', help='Profile the replay, the stats are written in replay.prof')
+    parser.add_argument('--log', type=str, default='WARNING', help='Log level')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    FORMAT = '%(asctime)s %(levelname)s: %(message)s [%(filename)s:%(lineno)s]'
+    logging.basicConfig(format=FORMAT, level=args.log)
+
+    output_path = Path(args.output_root, "replay", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    report = replay_session(args.recording, output_path, args.script_dir)
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(Path(output_path, "replay.prof"))
+
+    with open(Path(output_path, "replay.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Replayed {report['virtual_seconds']:.1f}s of session in {report['wall_seconds']:.2f}s ({report['frames']} frames)")
+    print(f"LLM responses: {report['llm']['hits']} matched, {report['llm']['misses']} not matched ({report['llm']['unanswered']} without any response left), {report['llm']['unused']} unused")
+    print(f"Scene path {'diverged from' if report['diverged'] else 'matches'} the recording: {' > '.join(report['scene_path'])}")
+    for scene, ms in report['scene_enter_ms'].items():
+        print(f"{ms['mean']:9.1f} ms {ms['max']:9.1f} ms max  {scene}")
+    print(f"Report written to {Path(output_path, 'replay.json')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,141 @@
-import subprocess
+import argparse
+import itertools
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
 
+import yaml
 
-test_schedule = [
-    ("test_user_whitehat", "Test Patient Whitehat")
-    ("test_user", "Test Patient Whitehat")
-    ("test_user", "Test Patient 2")
-    ("test_user", "Test Patient 3")
+from llms import llm
+from llms.registry import STUB_LLMS, override_llms
+from state_machine.behavior_schema import validate_behavior_yaml, validate_overrides_yaml
+from state_machine.script_bundle import compile_script
+from state_machine.simulation import LOG_FORMAT, run_simulation, summarize_simulations
+
+
+# (user behaviour, persona name) pairs simulated by default.
+DEFAULT_SCHEDULE = [
+    ("test_user_whitehat", "Test Patient Whitehat"),
+    ("test_user", "Test Patient Whitehat"),
+    ("test_user", "Test Patient 2"),
+    ("test_user", "Test Patient 3"),
 ]
 
-reps = 1
-
-for i in range(reps):
-    for user_behaviour, persona_name in test_schedule:
-        print(f"Running simulation for {persona_name} with user behaviour {user_behaviour}")
-        args = [
-            ".\venv_win\Scripts\python.exe", ".\run_friendly.py",
-            "--mode=simulation",
-            "--script_dir=scripts/friendly-fires",
-            f"--user_behaviour={user_behaviour}",
-            f"--persona_name={persona_name}"
-        ]
-
-        subprocess.run(args)
-        print("Simulation complete")
\ No newline at end of file
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run a schedule of simulations in parallel, without the web interface')
+    parser.add_argument('--script_dir', type=Path, default='scripts/friendly-fires', help='Path to the script directory')
+    parser.add_argument('--output_root', type=Path, default='output', help='Output directory root')
+    parser.add_argument('--schedule', type=Path, default=None, help='YAML list of {user_behaviour, persona_name} to simulate')
+    parser.add_argument('--user_behaviours', type=str, nargs='+', default=None, help='User behaviours, simulated with each of --personas')
+    parser.add_argument('--personas', type=str, nargs='+', default=None, help='Persona names, simulated with each of --user_behaviours')
+    parser.add_argument('--reps', type=int, default=1, help='Repetitions of the schedule')
+    parser.add_argument('--workers', type=int, default=4, help='Simulations running in parallel')
+    parser.add_argument('--max_duration', type=float, default=1800, help='Seconds after which a simulation is stopped')
+
+    parser.add_argument('--user_name', type=str, default='Patient', help='User name')
+    parser.add_argument('--start_scene', type=str, default=None, help='Start scene')
+    parser.add_argument('--llm_name', type=str, default=llm.LLM.default_name(), help='LLM name of the simulated user')
+    parser.add_argument('--few_shots', type=str, default='', help='Name of few-shots prompts')
+    parser.add_argument('--llm_workers', type=int, default=4, help='Threads generating the character responses of each simulation')
+    parser.add_argument('--stub_llm', type=str, default=None, choices=STUB_LLMS, help='Answer every LLM call with a local stub model, see STUB_LLM_* variables')
+    parser.add_argument('--log', type=str, default='INFO', help='Log level of the simulation logs')
+    return parser.parse_args()
+
+
+def get_schedule(args):
+    if args.schedule:
+        with open(args.schedule, "r", encoding="utf-8") as f:
+            return [(entry['user_behaviour'], entry['persona_name']) for entry in yaml.safe_load(f)]
+    if args.user_behaviours or args.personas:
+        user_behaviours = args.user_behaviours or [DEFAULT_SCHEDULE[0][0]]
+        personas        = args.personas or [DEFAULT_SCHEDULE[0][1]]
+        return list(itertools.product(user_behaviours, personas))
+    return DEFAULT_SCHEDULE
+
+
+def init_worker(log_level, stub_llm):
+    # Each simulation logs in its own output directory, see `run_job`.
+    logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    # Without any handler, `logging.info()` would add a console handler.
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(log_level)
+    override_llms(stub_llm)
+
+
+def run_job(job):
+    file_handler = logging.FileHandler(Path(job['output_path'], "friendly-bot.log"), encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logging.getLogger().addHandler(file_handler)
+    try:
+        report = run_simulation(**job)
+    finally:
+        logging.getLogger().removeHandler(file_handler)
+        file_handler.close()
+    report["run"] = job['output_path'].name
+    return report
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(format=LOG_FORMAT, level="INFO")
+
+    # Compiled once here, the simulations then only read the bundle.
+    bundle = compile_script(args.script_dir, validators={
+        "behaviors": validate_behavior_yaml,
+        "overrides": validate_overrides_yaml
+    })
+    if bundle.errors:
+        raise Exception(f"Invalid script files: {', '.join(bundle.errors.keys())}")
+
+    output_root = Path(args.output_root, "simulation", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    jobs = []
+    for rep in range(args.reps):
+        for user_behaviour, persona_name in get_schedule(args):
+            output_path = Path(output_root, f"{len(jobs):03d}-{user_behaviour}-{persona_name.replace(' ', '_')}")
+            output_path.mkdir(parents=True, exist_ok=True)
+            jobs.append({
+                "output_path"   : output_path,
+                "script_dir"    : args.script_dir,
+                "start_scene"   : args.start_scene,
+                "user_behaviour": user_behaviour,
+                "persona_name"  : persona_name,
+                "user_name"     : args.user_name,
+                "llm_name"      : args.llm_name,
+                "few_shots"     : args.few_shots,
+                "llm_workers"   : args.llm_workers,
+                "max_duration"  : args.max_duration,
+            })
+
+    logging.info(f"Running {len(jobs)} simulations on {args.workers} workers in {output_root}")
+    reports = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.log, args.stub_llm)) as executor:
+        futures = {executor.submit(run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                # The worker process died, e.g. out of memory.
+                report = {"run": job['output_path'].name, "user_behaviour": job['user_behaviour'], "persona_name": job['persona_name'],
+                          "output_path": job['output_path'].as_posix(), "status": "error", "duration": 0.0, "frames": 0,
+                          "scene_path": [], "llm": {"calls": 0}, "llm_errors": 0, "errors": [str(e)]}
+            reports.append(report)
+            logging.info(f"[{len(reports)}/{len(jobs)}] {report['run']}: {report['status']} in {report['duration']:.1f}s, "
+                         f"{len(report['scene_path'])} scenes, {report['llm']['calls']} LLM calls, {len(report['errors'])} errors")
+
+    reports.sort(key=lambda report: report["run"])
+    summary = {"summary": summarize_simulations(reports), "runs": reports}
+    summary_path = Path(output_root, "summary.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    logging.info(f"Summary written to {summary_path}\n{json.dumps(summary['summary'], indent=2)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from typing import Any
 
 import statemachine
 from statemachine import StateMachine, State
+from statemachine.event import BoundEvent
+from statemachine.event_data import TriggerData
 from datetime import datetime, timedelta
 import yaml
 from pathlib import Path
@@ -56,6 +58,23 @@ class OverrideEvents(EventClass):
 
 
 
+def import_behavior_events(behaviour_yaml, default_overrides):
+  """Parse the events of a behavior, `(init, dynamics, ends, overrides)`.
+
+  The events are not modified by the behaviors, so that characters with the
+  same behavior can share them.
+  """
+  metadata = behaviour_yaml["meta"]
+  init      = InitEvents(behaviour_yaml["init"], **metadata)       if "init"    in behaviour_yaml else None
+  ends      = EndEvents(behaviour_yaml["end"], **metadata)         if "end"     in behaviour_yaml else None
+  dynamics  = DynamicEvents(behaviour_yaml["dynamic"], **metadata) if "dynamic" in behaviour_yaml else None
+  overrides = OverrideEvents(default_overrides, **metadata)
+  if "override" in behaviour_yaml:
+    overrides += OverrideEvents(behaviour_yaml["override"], **metadata)
+  return init, dynamics, ends, overrides
+
+
+
 class Response(object):
   def __init__(self, text, emotion_args, speak_immediate, log_path=None):
     self.text            = text
@@ -76,11 +95,14 @@ class BehaviorData(object):
     self._events           = []
     self._responses        = [] 
     self._speaking   = False
+    self._pending    = None  # Response being generated by the LLM, see `StateMachineCharacter.llm_callback`.
+    self._speculation = None  # Response generated ahead of the next dynamic prompt, see `StateMachineCharacter.speculate`.
 
     self.next_process_time = None
     
     self.speak_counter   = 0
     self.dynamic_counter   = 0
+    self.dynamic_order     = None
     # self.last_heard_time = 0
     # self.last_speak_time = 0
     self.scene_metadata  = {}
@@ -93,6 +115,7 @@ class BehaviorData(object):
     return {
       "response"       : [str(r.text) for r in self._responses],
       "speaking"       : self._speaking,
+      "generating"     : self._pending is not None,
       "speak_counter"  : self.speak_counter,
       # "last_heard_time": self.last_heard_time,
       # "last_speak_time": self.last_speak_time,
@@ -153,7 +176,11 @@ class Behavior(StateMachine):
     return len(self.data._events) > 0
 
   def is_speaking(self):
-    return self.data._speaking
+    # A behavior generating a response waits for it like for its speech.
+    return self.data._speaking or self.data._pending is not None
+
+  def is_generating(self):
+    return self.data._pending is not None
 
 
   def no_pending_responses(self):
@@ -167,6 +194,7 @@ class Behavior(StateMachine):
                behaviour_yaml: str,
                auto_speak: bool = True,
                default_overrides: dict[str, dict[str, Any]] = {},
+               events: tuple = None,
                **kwargs):
     
     self.name  = behaviour_name
@@ -180,13 +208,27 @@ class Behavior(StateMachine):
     self.data = BehaviorData(self)
     self.data.auto_speak = auto_speak
     try:
-      self._import_yaml(default_overrides)
+      self._import_yaml(default_overrides, events)
       super(Behavior, self).__init__(allow_event_without_transition=True, **kwargs)
     except Exception as e:
       logging.error(f"Error creating Behavior {self.name}: {e}")
       raise e
 
 
+  def reset(self):
+    """Go back to `s_init` with new data, to be used again for a new scene."""
+    auto_speak = self.data.auto_speak
+    self.data = BehaviorData(self)
+    self.data.auto_speak     = auto_speak
+    self.data.scene_metadata = self._yaml["meta"]
+    self.data.dynamic_order  = self._dynamics.get_order("automatic") if self._dynamics else None
+
+    # Activate `s_init` as the constructor does, so that its enter callbacks run as for a new behavior.
+    setattr(self.model, self.state_field, None)
+    self._put_nonblocking(TriggerData(machine=self, event=BoundEvent("__initial__", _sm=self)))
+    self.activate_initial_state()
+
+
   def on_enter_state(self, event, state):
       logging.debug(f"{self.name} | Entering '{state.id}' state from '{event}' event.")
 
@@ -208,7 +250,7 @@ class Behavior(StateMachine):
     if event == "e_speak":
       return
     
-    new_events = self._dynamics.get("automatic", self.data.dynamic_counter) if self._dynamics else None
+    new_events = self._dynamics.get("automatic", self.data.dynamic_counter, self.data.dynamic_order) if self._dynamics else None
     if new_events is None:
       logging.debug(f"Flagging stop in Behavior {self.name}, event {event}")
       self.data.flag_stop = True
@@ -326,28 +368,9 @@ class Behavior(StateMachine):
       logging.warning(f"Unknown override {name_override}")
 
 
-  def _import_yaml(self, default_overrides):
+  def _import_yaml(self, default_overrides, events=None):
     # logging.info(f"Importing YAML from {_yaml_path}")
-    # Parse the YAML.
+    # Parse the YAML, unless the events are shared with other behaviors.
     self.data.scene_metadata = self._yaml["meta"]
-
-    if "init" in self._yaml:
-      self._init      = InitEvents(self._yaml["init"], **self.data.scene_metadata)
-    else:
-      self._init = None
-      # raise Exception(f"State Machine {self.name}: missing 'init' state")
-
-    if "end" in self._yaml:
-      self._ends      = EndEvents(self._yaml["end"], **self.data.scene_metadata)
-    else:
-      self._ends = None
-
-
-    if "dynamic" in self._yaml:
-      self._dynamics  = DynamicEvents(self._yaml["dynamic"], **self.data.scene_metadata)
-    else:
-      self._dynamics = None
-
-    self._overrides = OverrideEvents(default_overrides, **self.data.scene_metadata)
-    if "override" in self._yaml:
-      self._overrides += OverrideEvents(self._yaml["override"], **self.data.scene_metadata)
+    self._init, self._dynamics, self._ends, self._overrides = events or import_behavior_events(self._yaml, default_overrides)
+    self.data.dynamic_order = self._dynamics.get_order("automatic") if self._dynamics else None
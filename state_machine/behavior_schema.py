@@ -0,0 +1,135 @@
+from typing import Any
+
+from state_machine.entity import Event
+
+
+# Top level sections of a behavior file, all but `meta` hold events.
+BEHAVIOR_SECTIONS = ["meta", "init", "dynamic", "end", "override"]
+
+# Keys read from `meta` by the dynamic events.
+REQUIRED_DYNAMIC_META = ["loop", "randomize"]
+
+
+def _check_prompt(value, where, errors):
+  if not isinstance(value, list):
+    errors.append(f"{where}: prompt needs to be a list")
+    return
+  for element in value:
+    if isinstance(element, list):
+      if not all(isinstance(n, str) or n is None for n in element):
+        errors.append(f"{where}: prompt element needs to be a list of strings: {element}")
+    elif not isinstance(element, str):
+      errors.append(f"{where}: prompt element needs to be a string or a list of strings: {element}")
+
+
+def _check_speak(value, where, errors):
+  if isinstance(value, list):
+    if not all(isinstance(n, str) for n in value):
+      errors.append(f"{where}: speak sentences need to be a list of strings")
+  elif not isinstance(value, str):
+    errors.append(f"{where}: speak sentence(s) need to be a string or a list of strings")
+
+
+def _check_play(value, where, errors):
+  try:
+    int(value)
+  except (TypeError, ValueError):
+    errors.append(f"{where}: play id '{value}' is not an integer")
+
+
+def _check_glitch(value, where, errors):
+  if not isinstance(value, dict) or "active" not in value:
+    errors.append(f"{where}: glitch needs to be a dictionary with an 'active' key")
+
+
+# Checks on the value of the tag of each event type, mirroring the event constructors.
+EVENT_VALUE_CHECKS = {
+  "prompt": _check_prompt,
+  "speak" : _check_speak,
+  "play"  : _check_play,
+  "glitch": _check_glitch,
+}
+
+
+def _check_event(yaml_obj, where, errors):
+  if not isinstance(yaml_obj, dict):
+    errors.append(f"{where}: event must be a dictionary: {yaml_obj}")
+    return
+
+  tag = Event.get_event_tag(yaml_obj)
+  if not tag:
+    errors.append(f"{where}: not a valid event tag, expected exactly one of {sorted(Event.get_event_types_lookup().keys())}")
+    return
+
+  if tag in EVENT_VALUE_CHECKS:
+    EVENT_VALUE_CHECKS[tag](yaml_obj[tag], f"{where}.{tag}", errors)
+
+  budget = yaml_obj.get("transcript_budget", None)
+  if budget is not None and (tag != "prompt" or isinstance(budget, bool) or not isinstance(budget, int) or budget <= 0):
+    errors.append(f"{where}.transcript_budget: needs to be a positive number of tokens, on a prompt event")
+
+  for component in Event.get_event_types_lookup()[tag].components:
+    value = yaml_obj.get(component.tag, None)
+    if value and isinstance(value, str) and value not in component.allowed:
+      errors.append(f"{where}.{component.tag}: '{value}' not in {component.allowed}")
+
+
+def _check_events(yaml_obj, where, errors):
+  """Mirror the structures accepted by `EventClass`."""
+  if isinstance(yaml_obj, list):
+    for i, _yaml_obj in enumerate(yaml_obj):
+      _check_event(_yaml_obj, f"{where}[{i}]", errors)
+
+  elif isinstance(yaml_obj, dict):
+    if Event.get_event_tag(yaml_obj):
+      _check_event(yaml_obj, where, errors)
+      return
+
+    for key, _yaml_obj in yaml_obj.items():
+      if isinstance(_yaml_obj, list):
+        for i, __yaml_obj in enumerate(_yaml_obj):
+          _check_event(__yaml_obj, f"{where}.{key}[{i}]", errors)
+      elif isinstance(_yaml_obj, dict):
+        _check_event(_yaml_obj, f"{where}.{key}", errors)
+      else:
+        errors.append(f"{where}.{key}: event must be a dictionary or a list of dictionaries")
+
+  else:
+    errors.append(f"{where}: events need to be a dict or a list of dicts")
+
+
+def validate_behavior_yaml(behaviour_name: str, behaviour_yaml: dict[str, Any]) -> list[str]:
+  """Validate a parsed behavior file without building a `Behavior`.
+
+  Returns the list of all errors found, empty if the behavior is valid.
+  """
+  if not isinstance(behaviour_yaml, dict):
+    return [f"{behaviour_name}: behavior needs to be a dictionary"]
+
+  errors = []
+  for key in behaviour_yaml.keys():
+    if key not in BEHAVIOR_SECTIONS:
+      errors.append(f"{behaviour_name}: unknown section '{key}', expected one of {BEHAVIOR_SECTIONS}")
+
+  meta = behaviour_yaml.get("meta", None)
+  if not isinstance(meta, dict):
+    errors.append(f"{behaviour_name}.meta: missing or not a dictionary")
+  elif "dynamic" in behaviour_yaml:
+    for key in REQUIRED_DYNAMIC_META:
+      if key not in meta:
+        errors.append(f"{behaviour_name}.meta: missing '{key}' required by 'dynamic'")
+
+  for section in BEHAVIOR_SECTIONS[1:]:
+    if section in behaviour_yaml:
+      _check_events(behaviour_yaml[section], f"{behaviour_name}.{section}", errors)
+
+  return errors
+
+
+def validate_overrides_yaml(name: str, overrides_yaml: dict[str, Any]) -> list[str]:
+  """Validate the default override events shared by all behaviors."""
+  if not overrides_yaml:
+    return []
+  errors = []
+  _check_events(overrides_yaml, name, errors)
+  return errors
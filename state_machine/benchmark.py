@@ -0,0 +1,290 @@
+import gc
+import logging
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from flask import Flask
+
+from state_machine import scenemanager
+from state_machine.clock import VirtualClock
+from state_machine.flask_app import StatusObject
+from state_machine.replay import run_until
+
+
+# Chat lengths at which the prompts are timed.
+PLACEHOLDER_CHAT_LENGTHS = [0, 50, 100, 200, 400, 800]
+
+# Options of the benchmarked sessions: headless, and every LLM call is made in the update loop.
+SESSION_OPTIONS = {
+    "mode"                   : "simulation",
+    "use_hub"                : False,
+    "wait_for_speak_callback": False,
+    "auto_speak"             : True,
+    "llm_workers"            : 0,
+    "prefetch_bots"          : False,
+    "speculative"            : False,
+    "hot_reload"             : False,
+}
+
+# Metrics printed by `compare_reports`, as paths in the report.
+HEADLINE_METRICS = [
+    "cold_start.cold.mean",
+    "cold_start.warm.mean",
+    "frames.mean",
+    "frames.p95",
+    "frames.max",
+    "scene_enter.all.mean",
+    "scene_enter.all.max",
+    "status_object.mean",
+    "status_object.max",
+    f"placeholders.{PLACEHOLDER_CHAT_LENGTHS[-1]}.mean",
+    "memory.growth_mb",
+]
+
+
+def get_distribution(seconds):
+    """Distribution of durations given in seconds, in milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    ms = sorted(s * 1000 for s in seconds)
+    return {
+        "count" : len(ms),
+        "mean"  : statistics.mean(ms),
+        "median": statistics.median(ms),
+        "p95"   : ms[min(len(ms) - 1, int(len(ms) * 0.95))],
+        "p99"   : ms[min(len(ms) - 1, int(len(ms) * 0.99))],
+        "max"   : ms[-1],
+    }
+
+
+def get_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def new_session(script_dir, output_path, start_scene=None, clock=None):
+    Path(output_path).mkdir(parents=True, exist_ok=True)
+    model = scenemanager.SceneManagerData(clock)
+    sm = scenemanager.get_scene_manager(model, output_path, script_dir, start_scene, **SESSION_OPTIONS)
+    return model, sm
+
+
+def bench_cold_start(script_dir, output_path, reps=5):
+    """Time of `get_scene_manager`.
+
+    `cold` builds the scene manager type again each time, as for the first
+    session of a process, `warm` reuses it as the next sessions do.
+    """
+    durations = {"cold": [], "warm": []}
+    for kind in ["cold", "warm"]:
+        for rep in range(reps):
+            if kind == "cold":
+                with scenemanager._scene_sm_types_lock:
+                    scenemanager._scene_sm_types.clear()
+            srt_time = time.perf_counter()
+            _, sm = new_session(script_dir, Path(output_path, f"{kind}-{rep}"))
+            durations[kind].append(time.perf_counter() - srt_time)
+            sm.close()
+    return {kind: get_distribution(seconds) for kind, seconds in durations.items()}
+
+
+def run_turns(script_dir, output_path, turns, start_scene=None, turn_seconds=5.0, frame_times=None, on_turn=None, on_close=None):
+    """Play `turns` user messages, `turn_seconds` apart on a virtual clock.
+
+    A session that reaches its final scene is closed and the next turns are
+    played in a new one, so that long runs go through the script several times.
+    Calls `on_turn(turn, sm)` after each turn and `on_close(sm)` when a session
+    is closed, returns the number of sessions.
+    """
+    sessions = 0
+    sm = None
+
+    def close():
+        sm.close()
+        if on_close:
+            on_close(sm)
+
+    try:
+        for turn in range(turns):
+            if sm is None or sm.current_state.final:
+                if sm is not None:
+                    close()
+                clock = VirtualClock()
+                _, sm = new_session(script_dir, Path(output_path, f"session-{sessions}"), start_scene, clock)
+                sm.add_web_user("Patient", "Test Patient")
+                sessions += 1
+                run_until(sm, clock, 1.0, frame_times=frame_times)
+
+            sm.put_message({"command": "chat", "data": {"user": "Patient", "message": f"This is what I have to say at turn {turn}."}})
+            run_until(sm, clock, clock.monotonic() + turn_seconds, frame_times=frame_times)
+            if on_turn:
+                on_turn(turn, sm)
+    finally:
+        if sm is not None:
+            close()
+    return sessions
+
+
+def bench_session(script_dir, output_path, turns=200, start_scene=None):
+    """Frame times, time to enter each scene and `StatusObject` build time of a session of `turns` user messages."""
+    app = Flask(__name__, static_folder=Path(output_path).absolute().__str__())
+    frame_times  = []
+    status_times = []
+    enter_times  = defaultdict(list)
+    summary      = {"scene_path": [], "chat_lines": [], "llm_calls": 0}
+
+    def build_status(turn, sm):
+        srt_time = time.perf_counter()
+        StatusObject(app, sm).json()
+        status_times.append(time.perf_counter() - srt_time)
+
+    def add_session(sm):
+        for scene, ms in sm.scene_enter_ms:
+            enter_times[scene].append(ms / 1000)
+        summary["scene_path"] += sm.scene_path
+        summary["chat_lines"].append(len(sm.model.chat_history))
+        summary["llm_calls"]  += len(sm.llm_calls)
+
+    sessions = run_turns(script_dir, output_path, turns, start_scene, frame_times=frame_times, on_turn=build_status, on_close=add_session)
+
+    scene_enter = {"all": get_distribution([s for seconds in enter_times.values() for s in seconds])}
+    scene_enter.update({scene: get_distribution(seconds) for scene, seconds in enter_times.items()})
+
+    return {
+        "sessions"     : sessions,
+        "scene_path"   : summary["scene_path"],
+        "chat_lines"   : summary["chat_lines"],
+        "llm_calls"    : summary["llm_calls"],
+        "frames"       : get_distribution(frame_times),
+        "scene_enter"  : scene_enter,
+        "status_object": get_distribution(status_times),
+    }
+
+
+def bench_memory(script_dir, output_path, turns=200, start_scene=None, sample_every=20):
+    """Memory allocated by Python, sampled every `sample_every` turns of a session of `turns` user messages.
+
+    The closed sessions are not referenced anymore, memory they still hold shows as a leak.
+    """
+    samples = []
+
+    def sample(turn, sm):
+        if turn % sample_every == 0 or turn == turns - 1:
+            gc.collect()
+            current, peak = tracemalloc.get_traced_memory()
+            samples.append({"turn": turn + 1, "scene": sm.current_state.id, "chat_lines": len(sm.model.chat_history),
+                            "current_mb": current / 2**20, "peak_mb": peak / 2**20})
+
+    tracemalloc.start()
+    try:
+        sessions = run_turns(script_dir, output_path, turns, start_scene, on_turn=sample)
+    finally:
+        tracemalloc.stop()
+
+    growth = samples[-1]["current_mb"] - samples[0]["current_mb"] if samples else 0.0
+    return {
+        "sessions"   : sessions,
+        "samples"    : samples,
+        "growth_mb"  : growth,
+        "per_turn_kb": growth * 1024 / max(1, samples[-1]["turn"] - samples[0]["turn"]) if samples else 0.0,
+    }
+
+
+def get_chat_prompt(sm):
+    """A character of the script and a dynamic prompt of its behavior that includes the chat history."""
+    marker = "Benchmark marker line."
+    sm.model.add_message_to_chat_history("Patient", "Test Patient", marker)
+    try:
+        for scene_params in sm.scene_params.values():
+            for character in scene_params['characters']:
+                bot = sm._create_bot(sm._get_bot_definition(character))
+                for event in (bot._dynamics.event_sequences["automatic"] if bot._dynamics else []):
+                    if event.tag == "prompt" and marker in bot.get_llm_prompt(event):
+                        return bot, event
+    finally:
+        del sm.model.chat_history[-1:]
+    raise Exception("No prompt with the chat history in the script")
+
+
+def bench_placeholders(script_dir, output_path, chat_lengths=PLACEHOLDER_CHAT_LENGTHS, reps=20):
+    """Time of `get_llm_prompt` on a prompt of the script with the chat history, for each chat length.
+
+    Each rep adds a chat line before rendering the prompt, as in a session, so
+    that the transcript is not served from the cache of the previous render.
+    """
+    model, sm = new_session(script_dir, output_path)
+    try:
+        bot, event = get_chat_prompt(sm)
+        names = [("Patient", "Test Patient"), ("Dr. Stanley", "Dr. Stanley Regular")]
+        results = {}
+        for length in chat_lengths:
+            while model.chat_history.lines < length:
+                name, persona = names[model.chat_history.lines % 2]
+                model.add_message_to_chat_history(name, persona, f"Message {model.chat_history.lines} of the conversation, about as long as a spoken line.")
+
+            durations = []
+            for _ in range(reps):
+                model.add_message_to_chat_history("Patient", "Test Patient", "One more line of the conversation, about as long as a spoken line.")
+                srt_time = time.perf_counter()
+                bot.get_llm_prompt(event)
+                durations.append(time.perf_counter() - srt_time)
+                del model.chat_history[-1:]
+            results[str(length)] = get_distribution(durations)
+        return results
+    finally:
+        sm.close()
+
+
+def run_benchmarks(script_dir, output_path, turns=200, reps=5, start_scene=None, llm_name=None):
+    """Run the scene engine benchmarks on the script in `script_dir`, returns the report."""
+    output_path = Path(output_path)
+    report = {
+        "date"       : datetime.now().isoformat(timespec="seconds"),
+        "commit"     : get_commit(),
+        "python"     : platform.python_version(),
+        "script_dir" : Path(script_dir).as_posix(),
+        "start_scene": start_scene,
+        "llm_name"   : llm_name,
+        "turns"      : turns,
+    }
+
+    logging.info(f"Benchmark | Cold start")
+    report["cold_start"] = bench_cold_start(script_dir, Path(output_path, "cold_start"), reps)
+
+    logging.info(f"Benchmark | Session of {turns} turns")
+    report.update(bench_session(script_dir, Path(output_path, "session"), turns, start_scene))
+
+    logging.info(f"Benchmark | Placeholders")
+    report["placeholders"] = bench_placeholders(script_dir, Path(output_path, "placeholders"))
+
+    logging.info(f"Benchmark | Memory over {turns} turns")
+    report["memory"] = bench_memory(script_dir, Path(output_path, "memory"), turns, start_scene)
+    return report
+
+
+def get_metric(report, path):
+    value = report
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare_reports(baseline, report):
+    """Headline metrics of two reports, with the relative change from `baseline`."""
+    rows = []
+    for path in HEADLINE_METRICS:
+        before, after = get_metric(baseline, path), get_metric(report, path)
+        change = (after - before) / before if before and after is not None else None
+        rows.append({"metric": path, "baseline": before, "value": after, "change": change})
+    return rows
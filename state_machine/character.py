@@ -1,12 +1,15 @@
+import difflib
 import logging
+import threading
+import time
+from collections import defaultdict
 from pathlib import Path
 
 import re
 
 from llms import llm
-from state_machine.behavior import Behavior, Response
+from state_machine.behavior import Behavior, Response, import_behavior_events
 from state_machine.diagrams import save_behavior_diagram
-from state_machine.emotion_processor import EmotionProcessor
 
 
 class Character:
@@ -42,6 +45,28 @@ class ExternalCharacter(Character):
 
 
 
+class Speculation:
+    """A response generated before the user finished speaking."""
+
+    def __init__(self, future, event, text, chat_length, cancelled):
+        self.future      = future
+        self.event       = event
+        self.text        = text
+        self.chat_length = chat_length
+        # Set when the speculation is dropped, a call already running then discards its response.
+        self.cancelled   = cancelled
+
+
+    def matches(self, text, similarity):
+        return difflib.SequenceMatcher(None, self.text, text).ratio() >= similarity
+
+
+    def cancel(self):
+        self.cancelled.set()
+        self.future.cancel()
+
+
+
 class StateMachineCharacter(Character, Behavior):
 
     def __init__(self, 
@@ -55,6 +80,7 @@ class StateMachineCharacter(Character, Behavior):
                  behaviour_name:  str,
                  auto_speak: bool,
                  default_overrides = {},
+                 events = None,
             ):
         
         self.diagram_path = Path(scene_manager.output_path, f"{display_name}_behavior.svg").absolute().__str__()
@@ -66,40 +92,88 @@ class StateMachineCharacter(Character, Behavior):
         self.llm_name = llm_name
         self.prompt_counter = 0
 
-        Behavior.__init__(self, behaviour_name, behaviour_yaml, auto_speak, default_overrides)
+        Behavior.__init__(self, behaviour_name, behaviour_yaml, auto_speak, default_overrides, events)
         self._llm_callback    = self.llm_callback
         self._speech_callback = self.speech_callback
 
         self._llm = self.scene_manager.get_llm(llm_name)
 
 
+    def reset(self):
+        """Forget the previous scene, see `CharacterPool`."""
+        self.cancel_response()
+        self.cancel_speculation()
+        Behavior.reset(self)
+        self.emotion        = "neutral"
+        self.speech_style   = "Default"
+        self.observations   = []
+
+
     def replace_placeholders(self, text):
-        if self.persona:
-            text = text.replace("_PERSONA", self.persona)
-        if self.few_shots:
-            text = text.replace("_FEW_SHOTS", self.few_shots)
-        emotion = self.emotion.split("|")[0]
-        text = text.replace("_EMOTION_ELIZA", str(emotion))
+        template = self.scene_manager.prompt_compiler.compile(text)
+        return template.render(self, self.scene_manager.model)
 
-        text = self.scene_manager.replace_placeholders(text)
-        return text
+
+    def render_prompt(self, elements, transcript_budget=None, pending_line=None):
+        """Render the sampled elements of a prompt in a single join."""
+        parts = []
+        for element in elements:
+            if parts:
+                parts.append('\n\n')
+            self.scene_manager.prompt_compiler.compile(element).render(self, self.scene_manager.model, parts, transcript_budget, pending_line)
+        return ''.join(parts).strip()
 
 
     def get_chat_history(self):
         return self.scene_manager.model.get_chat_history()
 
 
+    def get_llm_prompt(self, event, pending_line=None):
+        prompt = self.render_prompt(event.prompt.sample(), event.transcript_budget, pending_line)
+        prompt += f"\n\n**{self.display_name}:**\n"
+        return prompt.strip()
+
+
     def llm_callback(self, event):
-        prompt = event.prompt.get()
+        # A new prompt replaces the response being generated.
+        self.cancel_response()
 
-        prompt = self.replace_placeholders(prompt)
-        prompt += f"\n\n**{self.display_name}:**\n"
-        prompt = prompt.strip()
+        speculation = self._take_speculation(event)
+        if speculation:
+            self.data._pending = (speculation.future, event)
+            return
+
+        prompt = self.get_llm_prompt(event)
         logging.debug(f"[{self.display_name}] Prompt:\n{'-'*64}\n{prompt}\n{'-'*64}")
-        
+
+        executor = self.scene_manager.llm_executor
+        if executor is None:
+            try:
+                response, log_path = self._generate(prompt)
+            except Exception as e:
+                logging.error(f"Character | {self.display_name} | LLM call failed: {e}")
+                return
+            self._add_llm_response(event, response, log_path)
+            return
+
+        # The response is added by `collect_response()` on a later frame,
+        # the behavior waits for it in its current state (see `is_speaking`).
+        future = executor.submit(self._generate, prompt)
+        self.data._pending = (future, event)
+        future.add_done_callback(lambda future: self.scene_manager.notify())
+
+
+    def _generate(self, prompt, cancelled=None):
+        """Call the LLM, this runs on a worker thread of the scene manager.
+
+        A response generated after `cancelled` is set is neither logged nor counted in the LLM calls.
+        """
+
         # Define the callback to be called after calling the LLM.
         def end_callback(prompt, response, timestamp):
             self.prompt_counter += 1
+            if response is None:
+                raise Exception(f"No response from {self.llm_name}")
             original_response = response
             response = re.sub(r'(\*\*\S.+?\*\*)', '', response)
             if original_response != response:
@@ -107,7 +181,19 @@ class StateMachineCharacter(Character, Behavior):
             return response
 
         # Call the LLM using the prompt.
-        response = self._llm.call(prompt, 0, end_callback)
+        srt_time = time.perf_counter()
+        error = None
+        try:
+            response = self._llm.call(prompt, 0, end_callback)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            if cancelled is None or not cancelled.is_set():
+                self.scene_manager.record_llm_call(self.display_name, self.llm_name, time.perf_counter() - srt_time, error)
+        if cancelled is not None and cancelled.is_set():
+            logging.info(f"Character | {self.display_name} | Discarded the response of a dropped speculation")
+            return response, None
         logging.info(f'Character | {self.display_name} | LLM Response: "{response}"')
         
         # log_path = Path(self.scene_manager.output_path, "prompts")
@@ -117,7 +203,10 @@ class StateMachineCharacter(Character, Behavior):
         #     self.scene_manager.model.prompt_counter += 1
 
         log_path = self.scene_manager.save_prompt(self.display_name, prompt, response, self.llm_name, self.prompt_counter)
+        return response, log_path
+
 
+    def _add_llm_response(self, event, response, log_path):
         if getattr(self.scene_manager, "emotion_processor", None):
             self.scene_manager.emotion_processor.classify_text(response)
             meat_event_args = event.get_meat_event_args()
@@ -130,6 +219,98 @@ class StateMachineCharacter(Character, Behavior):
         self.data._responses += [Response(response, meat_event_args, False, log_path)]
 
 
+    def collect_response(self, wait=False):
+        """Add the generated response and speak it, returns False if there is none (yet)."""
+        if self.data._pending is None:
+            return False
+        future, event = self.data._pending
+        if not wait and not future.done():
+            return False
+
+        self.data._pending = None
+        try:
+            response, log_path = future.result()
+        except Exception as e:
+            logging.error(f"Character | {self.display_name} | LLM call failed: {e}")
+            return False
+
+        self._add_llm_response(event, response, log_path)
+        self._process_responses()
+        return True
+
+
+    def speculate(self, user_name, user_persona, text=None):
+        """Generate the response to the next dynamic prompt of the behavior while the user speaks.
+
+        `text` is the partial transcript of the user. A speculation is kept as
+        long as the partial text stays similar to the one it was started with.
+        Without text, nothing could match the final transcript, so nothing is generated.
+        """
+        event = self._get_next_prompt_event()
+        if not text or event is None or self.scene_manager.llm_executor is None:
+            return False
+
+        similarity  = self.scene_manager.speculative_similarity
+        speculation = self.data._speculation
+        if speculation and speculation.event is event and speculation.matches(text, similarity):
+            return False
+        self.cancel_speculation()
+
+        # The partial text is rendered at the end of the transcript, it is not added to the chat history.
+        model       = self.scene_manager.model
+        chat_length = len(model.chat_history)
+        prompt      = self.get_llm_prompt(event, model.get_chat_entry(user_name, user_persona, text))
+
+        logging.info(f"Character | {self.display_name} | Speculating on '{text}'")
+        cancelled   = threading.Event()
+        future      = self.scene_manager.llm_executor.submit(self._generate, prompt, cancelled)
+        future.add_done_callback(lambda future: self.scene_manager.notify())
+        self.data._speculation = Speculation(future, event, text, chat_length, cancelled)
+        return True
+
+
+    def _get_next_prompt_event(self):
+        """The prompt event the next `e_advance` will process, if it is known."""
+        if (self.current_state.id not in ["s_start", "s_dynamic"] or self.is_speaking() or self.data.flag_stop
+                or self.data._events or self.data._responses or self._dynamics is None):
+            return None
+        event = self._dynamics.peek("automatic", self.data.dynamic_counter, self.data.dynamic_order)
+        return event if event is not None and event.tag == "prompt" else None
+
+
+    def _take_speculation(self, event):
+        """The speculation for `event`, if the user said what it was generated for."""
+        speculation, self.data._speculation = self.data._speculation, None
+        if speculation is None:
+            return None
+
+        model = self.scene_manager.model
+        lines = model.chat_history.chat_lines(start=speculation.chat_length)
+        if (speculation.event is event and len(lines) == 1 and lines[0]["name"] in model.users
+                and speculation.matches(lines[0]["message"], self.scene_manager.speculative_similarity)):
+            logging.info(f"Character | {self.display_name} | Using speculative response for '{lines[0]['message']}'")
+            return speculation
+
+        logging.info(f"Character | {self.display_name} | Dropping speculative response for '{speculation.text}'")
+        speculation.cancel()
+        return None
+
+
+    def cancel_speculation(self):
+        if self.data._speculation is not None:
+            self.data._speculation.cancel()
+            self.data._speculation = None
+
+
+    def cancel_response(self):
+        """Drop the response being generated, a call already running finishes in the background."""
+        if self.data._pending is not None:
+            future, _ = self.data._pending
+            future.cancel()
+            self.data._pending = None
+            logging.info(f"Character | {self.display_name} | Cancelled pending LLM response")
+
+
 
     def speech_callback(self, event):
         """Callback used by the doctor state machine for speech generation."""
@@ -201,4 +382,59 @@ class StateMachineCharacter(Character, Behavior):
 
     def after_transition(self, event, state):
         logging.debug(f"Character | {self.display_name} | After '{event}', on the '{state.id}' state.")
-        
\ No newline at end of file
+        
+
+
+
+class CharacterPool:
+    """Characters of the finished scenes, reset and used again by the next scenes.
+
+    Characters are pooled by definition, `(display_name, persona_name,
+    behavior, few_shots, llm_name)`. The parsed events of a behavior are
+    shared by all its characters.
+    """
+
+    def __init__(self, max_per_definition=2):
+        self.max_per_definition = max_per_definition
+        # Incremented by `clear()`, characters built before are not pooled anymore.
+        self.generation  = 0
+        self._characters = defaultdict(list)
+        self._events     = {}
+        self._lock       = threading.Lock()
+
+
+    def get_events(self, behaviour_name, behaviour_yaml, default_overrides):
+        with self._lock:
+            cached = self._events.get(behaviour_name, None)
+        if cached and cached[0] is behaviour_yaml and cached[1] is default_overrides:
+            return cached[2]
+
+        events = import_behavior_events(behaviour_yaml, default_overrides)
+        with self._lock:
+            self._events[behaviour_name] = (behaviour_yaml, default_overrides, events)
+        return events
+
+
+    def acquire(self, definition):
+        with self._lock:
+            characters = self._characters.get(definition, None)
+            character  = characters.pop() if characters else None
+        if character is not None:
+            character.reset()
+        return character
+
+
+    def release(self, definition, character, generation=None):
+        """Pool a character, unless it was built before the pool was last cleared (`generation`)."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if len(self._characters[definition]) < self.max_per_definition:
+                self._characters[definition].append(character)
+
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._characters = defaultdict(list)
+            self._events     = {}
@@ -0,0 +1,183 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+
+TRANSCRIPT_HEADER = '--- Beginning of transcript ---\n\n'
+TRANSCRIPT_FOOTER = '--- End of transcript ---'
+
+
+def render_chat_line(entry):
+    return f'**{entry["name"]}:**\n{entry["message"]}\n\n'
+
+
+class ChatHistory(list):
+    """Chat history entries, with the positions of each entry type.
+
+    A list of the entry dicts as before (`chat`, `scene-change`, `meatstate`,
+    `bot-instantiation`), that also keeps the positions of the entries of each
+    type, so that the number of chat lines, the last speaker and the last chat
+    lines are known without scanning the history.
+
+    The transcript of the chat lines used in the prompts is rendered line by
+    line as they are added. `transcript()` joins the rendered lines of the
+    full transcript or of the last-N windows, and keeps the joined texts until
+    the next chat line.
+
+    `append()` and the removal of the last entries (`del history[n:]`, `pop()`)
+    update the positions and the transcript in place, other changes index the
+    history again.
+    """
+
+    def __init__(self, entries=()):
+        super().__init__(entries)
+        self._reindex()
+
+
+    def _reindex(self):
+        self._positions   = defaultdict(list)
+        # Rendered chat lines, their offsets in the transcript body and its length.
+        self._rendered    = []
+        self._offsets     = []
+        self._length      = 0
+        # Joined transcripts, cleared when a chat line is added or removed.
+        self._transcripts = {}
+        for position, entry in enumerate(self):
+            self._index(position, entry)
+
+
+    def _index(self, position, entry):
+        self._positions[entry["type"]].append(position)
+        if entry["type"] == "chat":
+            line = render_chat_line(entry)
+            self._rendered.append(line)
+            self._offsets.append(self._length)
+            self._length += len(line)
+            self._transcripts.clear()
+
+
+    def _truncate(self, length):
+        """Remove the entries from `length` on."""
+        while len(self) > max(0, length):
+            entry = super().pop()
+            self._positions[entry["type"]].pop()
+            if entry["type"] == "chat":
+                self._rendered.pop()
+                self._length = self._offsets.pop()
+                self._transcripts.clear()
+
+
+    # Queries
+    @property
+    def lines(self):
+        """Number of chat lines."""
+        return len(self._positions["chat"])
+
+
+    @property
+    def last_speaker(self):
+        """Name of the author of the last chat line, `None` before the first one."""
+        positions = self._positions["chat"]
+        return self[positions[-1]]["name"] if positions else None
+
+
+    def of_type(self, type, limit=None, start=0):
+        """Entries of a type, the last `limit` ones of those from position `start`."""
+        positions = self._positions[type]
+        first = bisect_left(positions, start) if start else 0
+        if limit:
+            first = max(first, len(positions) - limit)
+        return [self[position] for position in positions[first:]]
+
+
+    def chat_lines(self, limit=None, start=0):
+        return self.of_type("chat", limit, start)
+
+
+    def transcript(self, limit=None, first_line=0, max_chars=None):
+        """Transcript of the chat lines, of the last `limit` ones if it is given.
+
+        Lines before `first_line` are left out, and so are the oldest lines
+        that do not fit in `max_chars` characters with the header and footer.
+        """
+        key = (limit or None, first_line, max_chars)
+        if key in self._transcripts:
+            return self._transcripts[key]
+
+        first = max(first_line, len(self._offsets) - limit) if limit else first_line
+        if max_chars is not None and first < len(self._offsets):
+            srt = max(self._offsets[first], self._length - max(0, max_chars - len(TRANSCRIPT_HEADER) - len(TRANSCRIPT_FOOTER)))
+            # Whole lines only.
+            first = bisect_left(self._offsets, srt)
+
+        text = TRANSCRIPT_HEADER + "".join(self._rendered[first:]) + TRANSCRIPT_FOOTER
+        self._transcripts[key] = text
+        return text
+
+
+    def render_lines(self, start, end):
+        """Rendered chat lines from `start` to `end`, without the header and footer."""
+        return "".join(self._rendered[start:end])
+
+
+    # Changes
+    def append(self, entry):
+        self._index(len(self), entry)
+        super().append(entry)
+
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+
+    def __iadd__(self, entries):
+        self.extend(entries)
+        return self
+
+
+    def pop(self, index=-1):
+        if index in (-1, len(self) - 1) and len(self) > 0:
+            entry = self[-1]
+            self._truncate(len(self) - 1)
+            return entry
+        entry = super().pop(index)
+        self._reindex()
+        return entry
+
+
+    def __delitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1) and (key.stop is None or key.stop >= len(self)):
+            self._truncate(key.indices(len(self))[0])
+            return
+        super().__delitem__(key)
+        self._reindex()
+
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._reindex()
+
+
+    def insert(self, index, entry):
+        super().insert(index, entry)
+        self._reindex()
+
+
+    def remove(self, entry):
+        super().remove(entry)
+        self._reindex()
+
+
+    def clear(self):
+        super().clear()
+        self._reindex()
+
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._reindex()
+
+
+    def reverse(self):
+        super().reverse()
+        self._reindex()
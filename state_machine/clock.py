@@ -0,0 +1,40 @@
+import time
+from datetime import datetime, timedelta
+
+
+class Clock:
+    """Time source of a session, `VirtualClock` replaces it in replays."""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+
+
+class VirtualClock(Clock):
+    """Clock that only moves when the replay advances it.
+
+    `now()` starts at `wall_start`, the wall time of the recorded session.
+    """
+
+    def __init__(self, wall_start=None):
+        self._time       = 0.0
+        self._wall_start = wall_start or datetime.now()
+
+
+    def monotonic(self):
+        return self._time
+
+
+    def now(self):
+        return self._wall_start + timedelta(seconds=self._time)
+
+
+    def advance(self, seconds):
+        self._time += max(0.0, seconds)
+
+
+    def advance_to(self, t):
+        self._time = max(self._time, t)
@@ -0,0 +1,59 @@
+import functools
+
+
+# Model inputs read by the exit conditions, and how to get their current version.
+CONDITION_INPUTS = {
+    "chat" : lambda model: len(model.chat_history),
+    "users": lambda model: tuple((name, getattr(user, "emotion", None)) for name, user in model.users.items()),
+    "bots" : lambda model: tuple((name, bot.current_state.id, bot.is_speaking(), len(bot.data._responses)) for name, bot in model.bots.items()),
+    "clock": lambda model: model.timers.version,
+    # Wall time to the minute, as in the `_DATE` and `_TIME` placeholders.
+    "time" : lambda model: model.clock.now().strftime("%Y-%m-%d %H:%M"),
+    # Fake media, typeform and inferred values, see `SceneManagerData.media_version`.
+    "media": lambda model: model.media_version,
+}
+
+
+def depends_on(*inputs):
+    """Declare the `CONDITION_INPUTS` read by a condition.
+
+    While the `condition_cache` of the model is set, i.e. while the automatic
+    transitions of a frame are evaluated, the condition is only computed once.
+    """
+    for name in inputs:
+        if name not in CONDITION_INPUTS:
+            raise Exception(f"Unknown condition input '{name}'")
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, "condition_cache", None)
+            if cache is None or args or kwargs:
+                return func(self, *args, **kwargs)
+            if func not in cache:
+                cache[func] = func(self)
+            return cache[func]
+
+        wrapper.depends_on = frozenset(inputs)
+        return wrapper
+    return decorator
+
+
+def get_condition_dependencies(condition_names, *owners):
+    """Inputs read by the conditions, looked up on `owners` in order.
+
+    Returns None if one of the conditions does not declare its inputs, it must
+    then be evaluated at every frame.
+    """
+    inputs = set()
+    for name in condition_names:
+        func = next((getattr(owner, name) for owner in owners if hasattr(owner, name)), None)
+        dependencies = getattr(func, "depends_on", None)
+        if dependencies is None:
+            return None
+        inputs |= dependencies
+    return frozenset(inputs)
+
+
+def get_input_versions(model, inputs):
+    return tuple(CONDITION_INPUTS[name](model) for name in sorted(inputs))
@@ -1,4 +1,5 @@
 import logging
+import threading
 import time
 
 from transformers import AutoTokenizer, pipeline
@@ -14,6 +15,26 @@ EMOTION_MODEL_ID = "SamLowe/roberta-base-go_emotions-onnx"
 EMOTION_FILE_NAME = "onnx/model_quantized.onnx"
 MAX_LEN_TEXT_EMOTION = 1500
 
+# The classifier is loaded once and shared by the emotion processors of all sessions.
+_classifier      = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+  global _classifier
+  with _classifier_lock:
+    if _classifier is None:
+      model     = ORTModelForSequenceClassification.from_pretrained(EMOTION_MODEL_ID, file_name=EMOTION_FILE_NAME)
+      tokenizer = AutoTokenizer.from_pretrained(EMOTION_MODEL_ID)
+      _classifier = pipeline(
+          task="text-classification",
+          model=model,
+          tokenizer=tokenizer,
+          top_k=None,
+          function_to_apply="sigmoid",
+      )
+    return _classifier
+
 
 class EmotionProcessor:
 
@@ -30,18 +51,7 @@ class EmotionProcessor:
     self._non_neutral_thres_medium = non_neutral_thres_medium
     self._non_neutral_thres_high = non_neutral_thres_high
 
-    self._model = ORTModelForSequenceClassification.from_pretrained(
-        EMOTION_MODEL_ID, file_name=EMOTION_FILE_NAME)
-
-
-    self._tokenizer = AutoTokenizer.from_pretrained(EMOTION_MODEL_ID)
-    self._onnx_classifier = pipeline(
-        task="text-classification",
-        model=self._model,
-        tokenizer=self._tokenizer,
-        top_k=None,
-        function_to_apply="sigmoid",
-    )
+    self._onnx_classifier = get_classifier()
 
 
   def reset(self):
@@ -155,7 +165,8 @@ class EmotionProcessor:
     t0 = time.time()
     try:
       text = text[(-min(len(text), MAX_LEN_TEXT_EMOTION)):]
-      res = self._onnx_classifier([text])[0]
+      with _classifier_lock:
+        res = self._onnx_classifier([text])[0]
       t1 = time.time()
       logging.info(f"Text classified as {res[0]['label']} with score {res[0]['score']:.2} in {t1-t0:.3}s")
       for elem in res:
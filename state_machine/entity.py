@@ -1,4 +1,5 @@
 from enum import Enum
+import copy
 import logging
 from typing import Any
 
@@ -324,17 +325,22 @@ class Prompt(object):
     self.elements = elements
 
 
-  def get(self):
-    """Assemble the prompt, sampling from any nested list."""
-    prompt = ''
+  def sample(self):
+    """Sample from any nested list, returning the elements of the prompt."""
+    elements = []
     for item in self.elements:
       if isinstance(item, str):
-        prompt += item + '\n\n'
+        elements.append(item)
       if isinstance(item, list):
         instruction = random.choice(item)
         if instruction:
-          prompt += instruction + '\n\n'
-    return prompt.strip()
+          elements.append(instruction)
+    return elements
+
+
+  def get(self):
+    """Assemble the prompt, sampling from any nested list."""
+    return '\n\n'.join(self.sample()).strip()
 
 
 
@@ -396,6 +402,7 @@ class Event(object):
 
 class GlitchEvent(Event):
   tag = "glitch"
+  components = ()
   def __init__(self, yaml_obj):
     super().__init__(GlitchEvent.tag)
     self.glitch = {
@@ -407,6 +414,7 @@ class GlitchEvent(Event):
 
 class StateEvent(Event):
   tag = "meatstate"
+  components = (MeatState,)
   def __init__(self, yaml_obj):
     super().__init__(StateEvent.tag)
     self.meatstate = yaml_obj["meatstate"]
@@ -415,6 +423,7 @@ class StateEvent(Event):
 
 class PlayEvent(Event):
   tag = "play"
+  components = (Emotion, PreAnimation, PostAnimation, SG_Mood)
   def __init__(self, yaml_obj):
     super().__init__(PlayEvent.tag)
     self.id             = int(yaml_obj["play"])
@@ -424,16 +433,18 @@ class PlayEvent(Event):
     self.sg_mood        = SG_Mood(yaml_obj)
 
   def get_meat_event_args(self):
+    # Copies, the emotion processor updates the values and events are shared between characters.
     return {
       "channel": "play",
-      "emotion": self.emotion,
-      "pre_animation": self.pre_animation,
-      "post_animation": self.post_animation,
-      "sg_mood": self.sg_mood
+      "emotion": copy.copy(self.emotion),
+      "pre_animation": copy.copy(self.pre_animation),
+      "post_animation": copy.copy(self.post_animation),
+      "sg_mood": copy.copy(self.sg_mood)
     }
 
 
 class MeatEvent(Event):
+  components = (Emotion, SpeakingStyle, PreAnimation, PostAnimation, SG_Mood, Role)
   def __init__(self, tag, yaml_obj):
     super().__init__(tag)
     self.emotion        = Emotion(yaml_obj)
@@ -444,14 +455,15 @@ class MeatEvent(Event):
     self.role           = Role(yaml_obj)
 
   def get_meat_event_args(self):
+    # Copies, the emotion processor updates the values and events are shared between characters.
     return {
       "channel": "say",
-      "emotion": self.emotion,
-      "azure_style": self.azure_style,
-      "pre_animation": self.pre_animation,
-      "post_animation": self.post_animation,
-      "sg_mood": self.sg_mood,
-      "role": self.role
+      "emotion": copy.copy(self.emotion),
+      "azure_style": copy.copy(self.azure_style),
+      "pre_animation": copy.copy(self.pre_animation),
+      "post_animation": copy.copy(self.post_animation),
+      "sg_mood": copy.copy(self.sg_mood),
+      "role": copy.copy(self.role)
     }
 
 
@@ -460,6 +472,8 @@ class PromptEvent(MeatEvent):
   def __init__(self, yaml_obj):
     super().__init__(PromptEvent.tag, yaml_obj)
     self.prompt = Prompt(yaml_obj["prompt"])
+    # Tokens `_CHAT_HISTORY` can take in the prompt, the whole transcript if None.
+    self.transcript_budget = yaml_obj.get("transcript_budget", None)
 
 
 
@@ -556,7 +570,12 @@ class DynamicEventsClass(EventClass):
     super().__init__(default_event, yaml_obj, *args, **kwargs)
 
 
-  def get(self, key: str = None, counter: int = None) -> Event:
+  def get_order(self, key: str = None) -> list[int]:
+    """Initial order of the events of `key`, for `get()` to shuffle instead of the shared events."""
+    return list(range(len(self.event_sequences.get(key or self.default_event, []))))
+
+
+  def get(self, key: str = None, counter: int = None, order: list[int] = None) -> Event:
     event = super().get(key)
     if not event:
       return None
@@ -571,11 +590,28 @@ class DynamicEventsClass(EventClass):
 
     # logging.info(f"Getting event '{key}'[{counter}/{len(event)}] from '{self.name}'")
     if counter == 0 and self.randomize:
-      random.shuffle(event)
+      random.shuffle(event if order is None else order)
 
     if counter >= len(event):
       # logging.warning(f"Event has no events")
       return None
     
-    return event[counter]
+    return event[counter] if order is None else event[order[counter]]
+
 
+
+  def peek(self, key: str = None, counter: int = None, order: list[int] = None) -> Event:
+    """The event `get()` will return for `counter`, None if it is not known yet (e.g. before shuffling)."""
+    event = super().get(key)
+    if not event:
+      return None
+    if self.max_iterations and counter and counter >= self.max_iterations:
+      return None
+    if self.looping and counter >= len(event):
+      counter = counter % len(event)
+    # `get()` shuffles the events again at the start of each loop.
+    if counter == 0 and self.randomize:
+      return None
+    if counter >= len(event):
+      return None
+    return event[counter] if order is None else event[order[counter]]
@@ -6,7 +6,7 @@ from urllib.parse import unquote
 from flask import Flask, render_template, jsonify, request, send_from_directory
 from flask_cors import CORS, cross_origin
 # from flask import url_for
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 from threading import Thread
 from pathlib import Path
 import logging
@@ -15,6 +15,12 @@ import requests
 
 from state_machine import scenemanager
 from state_machine.character import StateMachineCharacter
+from state_machine.helpers import get_log_session, set_log_session
+from state_machine.session_manager import DEFAULT_SESSION, SessionManager, is_valid_session_id
+
+
+def get_static_uri(app, path):
+    return app.static_url_path + "/" + str(Path(path).relative_to(Path(app.static_folder))).replace("\\", "/")
 
 
 class StatusObject:
@@ -26,18 +32,7 @@ class StatusObject:
                 if isinstance(user, StateMachineCharacter):
                     all_bots[name] = user
             
-            automatic_conditions = []
-            try:
-                for t in sm.states_map[sm.current_state.id].transitions:
-                    if t.event == "e_automatic":
-                        for c in t.cond.list.items:
-                            if not c.is_convention:
-                                automatic_conditions.append({
-                                    "condition": str(c),
-                                    "target": t.target.id
-                                })
-            except IndexError:
-                automatic_conditions = []
+            transitions = sm.transition_index.get(sm.current_state.id, {"automatic": [], "manual": []})
 
             self.status = {
                 'scene-manager': {
@@ -49,9 +44,9 @@ class StatusObject:
                     'time-since-last-scene-change':  f'{sm.model.time_since_last_scene_change.total_seconds():.1f}s',
                     'output-path': sm.output_path,
                     'state'      : sm.current_state.id,
-                    'available-transitions': [t.event for t in sm.states_map[sm.current_state.id].transitions if t.event.startswith("manual_")],
-                    'automatic-conditions': automatic_conditions, 
-                    'diagram-uri': "/" + str(Path.relative_to(Path(sm.diagram_path), Path(sm.output_path).parent.parent)).replace("\\", "/") + "?v=" + sm.model.svg_version,
+                    'available-transitions': transitions["manual"],
+                    'automatic-conditions': transitions["automatic"], 
+                    'diagram-uri': get_static_uri(app, sm.diagram_path) + "?v=" + sm.model.svg_version,
                     "current-scene-file": sm.model.scene_params['file_path'].absolute().__str__(),
                     "cached-infered-values": { k: str(v) for k, v in sm.model.inferred_values.items()},
                     "fake_media": sm.model.fake_media,
@@ -65,7 +60,7 @@ class StatusObject:
                         "llm-name" : bot.llm_name,
                         'state'    : bot.current_state.id,
                         "current-behavior-file": sm.behavior_paths[bot.name].absolute().__str__(),
-                        'diagram-uri': "/" + str(Path.relative_to(Path(bot.diagram_path), Path(sm.output_path).parent.parent)).replace("\\", "/"),
+                        'diagram-uri': get_static_uri(app, bot.diagram_path),
                         'overrides': [ k for k in bot._overrides.event_sequences.keys()],
                         'persona': bot.persona,
                         'emotion': bot.emotion,
@@ -96,6 +91,7 @@ class SMThread(Thread):
         logging.info(f"Creating SMThread")
 
         self.fr        = 10
+        self.max_fr    = 50
         self.last_time = datetime.now()
         self.app = app
         self.sm_factory = sm_factory
@@ -125,25 +121,35 @@ class SMThread(Thread):
 
 
     def run(self):
+        set_log_session(getattr(self, "session_id", None))
+
+        # Sleep until the scene manager is notified (message, hub callback,
+        # scene change) or its wake-up timeout, at most `max_fr` updates per second.
         while self._running:
-            if datetime.now() - self.last_time > timedelta(seconds=1/self.fr):
-                self.lock.acquire()
-                try:
-                    self.update()
-                finally:
-                    self.lock.release()
-                if self.status_callback:
-                    self.status_callback()
-                self.last_time = datetime.now()
-            else:
-                time.sleep(0.2/self.fr)
+            self.sm.wakeup_event.wait(self.sm.get_wakeup_timeout())
+            self.sm.wakeup_event.clear()
+            if not self._running:
+                break
+
+            self.last_time = datetime.now()
+            self.lock.acquire()
+            try:
+                self.update()
+            finally:
+                self.lock.release()
+            if self.status_callback:
+                self.status_callback()
+
+            elapsed = (datetime.now() - self.last_time).total_seconds()
+            if elapsed < 1/self.max_fr:
+                time.sleep(1/self.max_fr - elapsed)
 
 
     def update(self):
         self.sm.update()
 
     def send_message(self, message):
-        self.sm.msg_in.put(scenemanager.MessageIn(message))
+        self.sm.put_message(message)
 
     def get_status_message(self, app):
         if self.lock.acquire(timeout=1/self.fr):
@@ -161,6 +167,8 @@ class SMThread(Thread):
         #     self.sm.client.disconnect()
 
         self._running = False
+        self.sm.notify()
+        self.sm.close()
 
 
 
@@ -185,62 +193,64 @@ def run_flask(sm_factory, *args, **kwargs):
 
     logging.getLogger('werkzeug').disabled = True
 
-    sm_thread = None
-
     def shutdown_callback():
         requests.post(f"http://{kwargs['server_name']}/shutdown")
 
+    def get_session_id():
+        return request.args.get('session', DEFAULT_SESSION)
+
     @socketio.on('connect')
     def connect():      
-        nonlocal sm_thread
-        logging.debug('run_flask | Client connected')
-        sm_thread  = get_sm()
+        session_id = get_session_id()
+        logging.debug(f'run_flask | Client connected to session {session_id}')
+        join_room(session_id)
+        sessions.get(session_id)
 
     @socketio.on('disconnect')
     def disconnect():
         logging.debug('run_flask | Client disconnected')
 
 
-    def emit_status():
-        if sm_thread is not None and sm_thread._running:
+    def emit_status(session_id):
+        try:
+            sm_thread = sessions.get(session_id, create=False)
+        except KeyError:
+            return
+        if sm_thread._running:
             data = sm_thread.get_status_message(app)
             try:
-                socketio.emit('stream-status', data)
+                socketio.emit('stream-status', data, to=session_id)
                 pass
             except Exception as e:
                 logging.error(f"Error emitting stream status: {e}")
                 raise
 
-    def get_sm():
-        nonlocal sm_thread
-        if sm_thread is None:
-            restart_sm_thread()
-        return sm_thread
-
-    def restart_sm_thread():
-        nonlocal sm_thread
-        if sm_thread is not None:
-            sm_thread.stop()
-            sm_thread.join()
-
+    def create_sm_thread(session_id, **session_kwargs):
+        if session_id == DEFAULT_SESSION:
+            try:
+                x = requests.post("http://127.0.0.1:8005/clear-messages")
+                if x.status_code == 200:
+                    logging.info("Cleared chat history")
+                else:
+                    logging.error(f"Failed to clear chat history: {x.text}")
+            except requests.exceptions.ConnectionError as e:
+                logging.error(f"Failed to clear chat history: {e}")
+
+        # The scene manager is built with the log session set, see `setup_logging` of run_friendly.py.
+        log_session = get_log_session()
+        set_log_session(session_id)
         try:
-            x = requests.post("http://127.0.0.1:8005/clear-messages")
-            if x.status_code == 200:
-                logging.info("Cleared chat history")
-            else:
-                logging.error(f"Failed to clear chat history: {x.text}")
-        except requests.exceptions.ConnectionError as e:
-            logging.error(f"Failed to clear chat history: {e}")
-
-
-        sm_thread = SMThread(
-            sm_factory=sm_factory,
-            app=app,
-            status_callback=lambda: socketio.start_background_task(emit_status),
-            exit_callback=shutdown_callback,
-            *args, **kwargs
-        )
-        sm_thread.start()
+            return SMThread(
+                sm_factory=sm_factory,
+                app=app,
+                status_callback=lambda: socketio.start_background_task(emit_status, session_id),
+                exit_callback=shutdown_callback,
+                *args, **dict(kwargs, **session_kwargs)
+            )
+        finally:
+            set_log_session(log_session)
+
+    sessions = SessionManager(create_sm_thread, output_root)
 
     @app.route('/')
     @cross_origin()
@@ -289,15 +299,57 @@ def run_flask(sm_factory, *args, **kwargs):
     @app.route('/status', methods=['GET'])
     @cross_origin()
     def status():
-        sm_thread = get_sm()
-        if sm_thread is None:
-            return jsonify({"error": "Scene manager not initialized"})
+        try:
+            sm_thread = sessions.get(get_session_id())
+        except KeyError as e:
+            return jsonify({"error": e.args[0]})
         return sm_thread.get_status_message(app)
-        return jsonify({"error": "Scene manager not initialized"})
 
     @app.route('/restart', methods=['GET'])
     def restart():
-        restart_sm_thread()
+        session_id = get_session_id()
+        if not is_valid_session_id(session_id):
+            return jsonify({"status": "error", "message": f"Invalid session id '{session_id}'"}), 400
+        try:
+            sessions.restart(session_id)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        except Exception as e:
+            logging.error(f"Cannot restart session '{session_id}': {e}")
+            return jsonify({"status": "error", "message": str(e)}), 500
+        return jsonify({"status": "success"})
+
+    @app.route('/sessions', methods=['GET'])
+    @cross_origin()
+    def list_sessions():
+        return jsonify(sessions.json())
+
+    # Test with curl -X POST -H "Content-Type: application/json" -d '{"session": "booth-2", "hub_url": "http://127.0.0.1:8006"}' http://localhost:5000/sessions
+    @app.route('/sessions', methods=['POST'])
+    @cross_origin()
+    def create_session():
+        data = request.get_json(silent=True) or {}
+        session_kwargs = { k: v for k, v in data.items() if k in ["hub_url", "start_scene", "user_name", "persona_name", "user_behaviour", "llm_name"] }
+        session_id = data.get("session", None)
+        if session_id is not None and not is_valid_session_id(session_id):
+            return jsonify({"status": "error", "message": f"Invalid session id '{session_id}'"}), 400
+        try:
+            session_id = sessions.create(session_id, **session_kwargs)
+        except ValueError as e:
+            # The id is invalid or taken, or there are too many sessions.
+            return jsonify({"status": "error", "message": str(e)}), 400
+        except Exception as e:
+            logging.error(f"Cannot create session '{session_id}': {e}")
+            return jsonify({"status": "error", "message": str(e)}), 500
+        return jsonify({"status": "success", "session": session_id})
+
+    @app.route('/sessions/<session_id>', methods=['DELETE'])
+    @cross_origin()
+    def stop_session(session_id):
+        try:
+            sessions.stop(session_id)
+        except KeyError as e:
+            return jsonify({"status": "error", "message": e.args[0]}), 404
         return jsonify({"status": "success"})
 
     @app.route('/files/<root>/<path:path>')
@@ -319,11 +371,14 @@ def run_flask(sm_factory, *args, **kwargs):
     @cross_origin()
     def messageIn():
         try:
-            sm_thread = get_sm()
             data = request.get_json()
-            logging.info(f"Received message: {data}")
+            sm_thread = sessions.get(data.pop('session', None) or get_session_id())
+        except KeyError as e:
+            return jsonify({"status": "error", "message": e.args[0]})
+
+        try:
+            logging.info(f"Received message for session '{sm_thread.session_id}': {data}")
             sm_thread.send_message(data)
-            sm_thread.update()
             return jsonify({"status": "success"})
         except Exception as e:
             logging.error(e)
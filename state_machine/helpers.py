@@ -1,4 +1,9 @@
+import builtins
+import importlib.util
 import logging
+import sys
+import threading
+import time
 from datetime import datetime
 
 class PerformanceMetrics:
@@ -56,3 +61,91 @@ class LoggerUtils:
         return text
     
 
+
+
+
+# Session of the current thread, its log records are written in the log file of the session.
+_log_session = threading.local()
+
+
+def set_log_session(session_id):
+    _log_session.id = session_id
+
+
+def get_log_session():
+    return getattr(_log_session, "id", None)
+
+
+class SessionLogFilter(logging.Filter):
+    """Keep the log records of the threads of a session, see `set_log_session()`.
+
+    With `others`, also keep the records of the threads of no session (e.g. the
+    Flask requests), for the log file of the default session.
+    """
+
+    def __init__(self, session_id, others=False):
+        super().__init__()
+        self.session_id = session_id
+        self.others     = others
+
+
+    def filter(self, record):
+        session_id = get_log_session()
+        return session_id == self.session_id or (self.others and session_id is None)
+
+
+
+class ImportProfiler:
+    """Measure the time spent importing each module between `start()` and `stop()`.
+
+    Only the first import of a module is timed, `self` excludes the time spent
+    importing its own dependencies.
+    """
+
+    def __init__(self):
+        self.timings   = {}
+        self._stack    = []
+        self._import   = None
+
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        try:
+            module_name = importlib.util.resolve_name("." * level + name, (globals or {}).get("__package__")) if level else name
+        except (ImportError, ValueError):
+            module_name = name
+        if module_name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+
+        self._stack.append(0.0)
+        srt_time = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            total    = time.perf_counter() - srt_time
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += total
+            self.timings[module_name] = {"total": total, "self": total - children, "depth": len(self._stack)}
+
+
+    def start(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+        return self
+
+
+    def stop(self):
+        if self._import:
+            builtins.__import__ = self._import
+            self._import = None
+        return self
+
+
+    def report(self, limit=20):
+        text = f"Import times (ms, top {limit} by total time):\n{LoggerUtils.HR}\n"
+        timings = sorted(self.timings.items(), key=lambda item: item[1]["total"], reverse=True)
+        for module_name, timing in timings[:limit]:
+            text += f"{timing['total'] * 1000:9.1f} {timing['self'] * 1000:9.1f}  {'  ' * timing['depth']}{module_name}\n"
+        top_level = sum(timing["total"] for timing in self.timings.values() if timing["depth"] == 0)
+        text += f"{LoggerUtils.HR}\n{top_level * 1000:9.1f} ms total"
+        return text
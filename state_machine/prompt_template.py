@@ -0,0 +1,135 @@
+import logging
+import re
+import threading
+
+
+PLACEHOLDER_EXPR = re.compile(r'\b_(?<=_)[A-Z_]+\b')
+
+# Segment kinds
+TEXT      = "text"       # Static text, including the expanded script placeholders.
+PERSONA   = "persona"    # `_PERSONA` of the character.
+FEW_SHOTS = "few_shots"  # `_FEW_SHOTS` of the character.
+EMOTION   = "emotion"    # `_EMOTION_ELIZA`, the emotion of the character.
+DYNAMIC   = "dynamic"    # Model values (`_CHAT_HISTORY`, `_DATE`, fake texts...) resolved at each render.
+
+CHARACTER_SLOTS = {
+    "_PERSONA"      : PERSONA,
+    "_FEW_SHOTS"    : FEW_SHOTS,
+    "_EMOTION_ELIZA": EMOTION,
+}
+
+# Script placeholders can contain placeholders, expanded up to this depth.
+MAX_STATIC_DEPTH = 2
+
+
+class PromptTemplate:
+    """A text compiled into a list of static text and placeholder slots."""
+
+    def __init__(self, segments, compiler):
+        self.segments = segments
+        self.compiler = compiler
+
+
+    def render(self, character, model, parts=None, transcript_budget=None, pending_line=None):
+        """Append the rendered segments to `parts`, and return them joined if `parts` is not given.
+
+        `transcript_budget` is the number of tokens of the chat history placeholders,
+        `pending_line` a chat line added at the end of them (see `SceneManagerData.get_chat_history`).
+        """
+        join  = parts is None
+        parts = [] if join else parts
+        for kind, value in self.segments:
+            if kind == TEXT:
+                parts.append(value)
+            elif kind == DYNAMIC:
+                match_value = model.get_placeholder_value(value, transcript_budget, pending_line)
+                if match_value is None:
+                    logging.warning(f"Placeholder {value} not found")
+                    match_value = value
+                parts.append(match_value)
+            elif kind == EMOTION:
+                parts.append(str(character.emotion.split("|")[0]))
+            else:
+                text = character.persona if kind == PERSONA else character.few_shots
+                if text:
+                    self.compiler.compile(text, nested=True).render(character, model, parts, transcript_budget, pending_line)
+                else:
+                    parts.append(value)
+        return ''.join(parts) if join else parts
+
+
+
+class PromptCompiler:
+    """Compile prompt and speak texts against the placeholders of a script.
+
+    Templates are cached per text, so that each text is only scanned for
+    placeholders once.
+    """
+
+    def __init__(self, placeholders):
+        self.placeholders = placeholders
+        self._templates   = {}
+        self._lock        = threading.Lock()
+
+
+    def _compile_segments(self, text, nested, depth, segments):
+        srt = 0
+        for match in PLACEHOLDER_EXPR.finditer(text):
+            name = match.group(0)
+            segments.append((TEXT, text[srt:match.start()]))
+            srt = match.end()
+
+            if name in self.placeholders and depth < MAX_STATIC_DEPTH:
+                self._compile_segments(self.placeholders[name], nested, depth + 1, segments)
+            elif name in CHARACTER_SLOTS:
+                kind = CHARACTER_SLOTS[name]
+                segments.append((TEXT, name) if nested and kind != EMOTION else (kind, name))
+            else:
+                segments.append((DYNAMIC, name))
+        segments.append((TEXT, text[srt:]))
+        return segments
+
+
+    def compile(self, text, nested=False):
+        """Compile `text`, `nested` texts (personas and few-shots) do not get persona and few-shots slots."""
+        key = (text, nested)
+        template = self._templates.get(key, None)
+        if template is None:
+            segments = []
+            for kind, value in self._compile_segments(text, nested, 0, []):
+                if kind == TEXT and segments and segments[-1][0] == TEXT:
+                    segments[-1] = (TEXT, segments[-1][1] + value)
+                elif kind != TEXT or value:
+                    segments.append((kind, value))
+            template = PromptTemplate(segments, self)
+            with self._lock:
+                self._templates[key] = template
+        return template
+
+
+    def precompile(self, behavior_yamls, texts=()):
+        """Compile the prompt and speak texts of all behaviors, and other texts (e.g. personas)."""
+        def find_texts(obj, collect=False):
+            if isinstance(obj, str):
+                return [obj] if collect else []
+            if isinstance(obj, dict):
+                return [t for k, v in obj.items() for t in find_texts(v, collect or k in ["prompt", "speak"])]
+            if isinstance(obj, list):
+                return [t for v in obj for t in find_texts(v, collect)]
+            return []
+
+        count = 0
+        for behavior_yaml in behavior_yamls:
+            for text in find_texts(behavior_yaml):
+                self.compile(text)
+                count += 1
+        for text in texts:
+            if text:
+                self.compile(text, nested=True)
+                count += 1
+        return count
+
+
+    def clear(self):
+        with self._lock:
+            self._templates = {}
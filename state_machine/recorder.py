@@ -0,0 +1,116 @@
+import json
+import logging
+import threading
+from pathlib import Path
+
+
+RECORDING_FILE_NAME = "recording.jsonl"
+RECORDING_VERSION   = 1
+
+
+def get_json_options(options):
+    """Options of the scene manager that can be stored in a recording."""
+    return {key: value for key, value in options.items() if isinstance(value, (str, int, float, bool, type(None)))}
+
+
+class Recorder:
+    """Record the inputs of a session in a JSON lines file, to replay it with `state_machine.replay`.
+
+    The first line describes the session (script, start scene, random seed and
+    options), each following line is an event with its time `t` in seconds
+    since the recording started:
+
+    - `user`: a user added to the session.
+    - `message`: a message put in `msg_in` by the web interface.
+    - `hub`: a message received from the message hub.
+    - `llm`: an LLM call, its prompt, response and duration.
+    - `inferred`: the value of a set prompt.
+    - `scene`: a scene entered, and the time it took in ms.
+    """
+
+    def __init__(self, path, clock, script_dir, start_scene, seed, options):
+        self.path    = Path(path)
+        self.clock   = clock
+        self._start  = clock.monotonic()
+        self._lock   = threading.Lock()
+        self._file   = open(self.path, "w", encoding="utf-8")
+        logging.info(f"Recording session in {self.path}")
+
+        self._write({
+            "type"       : "start",
+            "version"    : RECORDING_VERSION,
+            "wall"       : clock.now().isoformat(),
+            "script_dir" : Path(script_dir).as_posix(),
+            "start_scene": start_scene,
+            "seed"       : seed,
+            "options"    : get_json_options(options),
+        })
+
+
+    def _write(self, event):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps(event, default=str) + "\n")
+            self._file.flush()
+
+
+    def elapsed(self):
+        return self.clock.monotonic() - self._start
+
+
+    def record(self, event_type, t=None, **data):
+        """Add an event, `t` defaults to now. Called from any thread."""
+        self._write(dict(type=event_type, t=self.elapsed() if t is None else t, **data))
+
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+
+class RecordingLLM:
+    """LLM client recording the prompts and responses of the calls."""
+
+    def __init__(self, llm, recorder):
+        self._llm        = llm
+        self._name_model = llm._name_model
+        self.recorder    = recorder
+
+
+    def call(self, prompt, timestamp, callback, personae = None, take_first_line = True):
+        responses = []
+        def record_callback(prompt, response, timestamp):
+            responses.append(response)
+            return callback(prompt, response, timestamp)
+
+        t = self.recorder.elapsed()
+        error = None
+        try:
+            return self._llm.call(prompt, timestamp, record_callback, personae, take_first_line)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.recorder.record("llm", t=t,
+                llm=self._name_model,
+                prompt=prompt,
+                response=responses[0] if responses else None,
+                seconds=self.recorder.elapsed() - t,
+                error=error
+            )
+
+
+
+def load_recording(path):
+    """Return the header and the events of a recording."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0]["type"] != "start":
+        raise Exception(f"Invalid recording {path}")
+    if lines[0]["version"] != RECORDING_VERSION:
+        raise Exception(f"Unsupported recording version {lines[0]['version']} in {path}")
+    return lines[0], lines[1:]
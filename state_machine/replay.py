@@ -0,0 +1,248 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from pathlib import Path
+
+from state_machine import scenemanager
+from state_machine.clock import VirtualClock
+from state_machine.recorder import RECORDING_FILE_NAME, load_recording
+
+
+# Recorded events fed back to the scene manager, the others are its outputs.
+INPUT_EVENTS = ["user", "message", "hub"]
+
+# Virtual seconds after the last recorded event given to the replay to reach
+# the recorded last scene, the timeouts fire a little later than recorded.
+TRAILING_SECONDS = 600.0
+
+
+class ReplayResponses:
+    """LLM responses of a recording, matched by LLM name and prompt.
+
+    A prompt that was not recorded, e.g. because the replay diverged, gets the
+    next unused response of the same LLM and is counted in `misses`. When none
+    is left, it is also counted in `unanswered`: the calls made by a session in
+    the background are not all made by the replay, and the other way round.
+    """
+
+    def __init__(self, calls):
+        self.calls      = calls
+        self.hits       = 0
+        self.misses     = 0
+        self.unanswered = 0
+        self._used      = set()
+        self._by_prompt = defaultdict(deque)
+        self._by_llm    = defaultdict(deque)
+        self._lock      = threading.Lock()
+        for index, call in enumerate(calls):
+            self._by_prompt[(call['llm'], call['prompt'])].append(index)
+            self._by_llm[call['llm']].append(index)
+
+
+    def _pop(self, indexes):
+        while indexes:
+            index = indexes.popleft()
+            if index not in self._used:
+                self._used.add(index)
+                return index
+        return None
+
+
+    def take(self, llm_name, prompt):
+        with self._lock:
+            index = self._pop(self._by_prompt.get((llm_name, prompt), None))
+            if index is not None:
+                self.hits += 1
+            else:
+                index = self._pop(self._by_llm.get(llm_name, None))
+                self.misses += 1
+                if index is None:
+                    self.unanswered += 1
+            return self.calls[index] if index is not None else None
+
+
+    def unused(self):
+        return len(self.calls) - len(self._used)
+
+
+
+class ReplayLLM:
+    """LLM client answering with the recorded responses, the call takes its recorded time on the virtual clock."""
+
+    def __init__(self, name_model, responses, clock):
+        self._name_model = name_model
+        self.responses   = responses
+        self.clock       = clock
+
+
+    def call(self, prompt, timestamp, callback, personae = None, take_first_line = True):
+        call = self.responses.take(self._name_model, prompt)
+        if call is None:
+            # Answered as a failed call, as the session would handle it.
+            logging.warning(f"Replay | No recorded response left for LLM {self._name_model}")
+            return callback(prompt, None, timestamp)
+        self.clock.advance(call['seconds'])
+        if call['error'] is not None:
+            raise Exception(call['error'])
+        return callback(prompt, call['response'], timestamp)
+
+
+
+class ReplayHubClient:
+    """Message hub client of a replay, the recorded hub messages are passed to `deliver()`."""
+
+    def __init__(self):
+        self.callbacks = {}
+        self.sent      = 0
+
+
+    def set_callback(self, channel, func):
+        self.callbacks[channel] = func
+
+
+    def send_message(self, channel, data):
+        self.sent += 1
+
+
+    def deliver(self, channel, data):
+        if channel in self.callbacks:
+            self.callbacks[channel](channel, data)
+
+
+
+def run_until(sm, clock, t, max_frames=10000, frame_times=None):
+    """Update the scene manager until it has nothing left to do before the virtual time `t`.
+
+    The wall time of each `update()` is appended to `frame_times` when it is given.
+    """
+    for _ in range(max_frames):
+        if sm.current_state.final:
+            break
+        sm.wakeup_event.clear()
+        srt_time = time.perf_counter()
+        sm.update()
+        if frame_times is not None:
+            frame_times.append(time.perf_counter() - srt_time)
+        if sm.wakeup_event.is_set():
+            continue
+        deadline = sm.model.timers.next_deadline()
+        if deadline is None or deadline > t:
+            break
+        clock.advance_to(deadline)
+    else:
+        logging.warning(f"Replay | Scene manager still busy after {max_frames} frames at {t:.3f}s")
+    clock.advance_to(t)
+
+
+def run_to_scene(sm, clock, scene, t, max_deadlines=1000):
+    """Fire the pending timer deadlines until the scene manager is in `scene`, a final scene or at the virtual time `t`."""
+    for _ in range(max_deadlines):
+        if sm.current_state.final or sm.current_state.id == scene:
+            return
+        deadline = sm.model.timers.next_deadline()
+        if deadline is None or deadline > t:
+            return
+        run_until(sm, clock, deadline)
+    logging.warning(f"Replay | Scene {scene} not reached after {max_deadlines} timer deadlines")
+
+
+def compare_recordings(recorded, replayed):
+    """Differences between the events of a recording and of its replay."""
+    def scenes(events):
+        return [event['scene'] for event in events if event['type'] == "scene"]
+
+    def inferred(events):
+        values = defaultdict(list)
+        for event in events:
+            if event['type'] == "inferred":
+                values[event['name']].append(event['value'])
+        return values
+
+    enter_ms = defaultdict(list)
+    for event in replayed:
+        if event['type'] == "scene":
+            enter_ms[event['scene']].append(event['enter_ms'])
+
+    recorded_inferred = inferred(recorded)
+    replayed_inferred = inferred(replayed)
+    return {
+        "scene_path"         : scenes(replayed),
+        "recorded_scene_path": scenes(recorded),
+        "diverged"           : scenes(replayed) != scenes(recorded),
+        "scene_enter_ms"     : {scene: {"mean": sum(ms) / len(ms), "max": max(ms), "count": len(ms)} for scene, ms in enter_ms.items()},
+        "inferred_mismatches": {
+            name: {"recorded": values, "replayed": replayed_inferred.get(name, [])}
+            for name, values in recorded_inferred.items() if values != replayed_inferred.get(name, [])
+        },
+    }
+
+
+def replay_session(recording_path, output_path, script_dir=None):
+    """Feed a recording through a new scene manager as fast as possible.
+
+    Time is a `VirtualClock` jumping from one recorded input or timer deadline
+    to the next, LLM calls are answered by `ReplayLLM`. Responses are generated
+    in the update loop and the characters are not prebuilt, so that replays of
+    a recording are deterministic. The replay is itself recorded in
+    `output_path`, returns the comparison with the original recording.
+    """
+    header, events = load_recording(recording_path)
+
+    recorded_scenes = [event['scene'] for event in events if event['type'] == "scene"]
+
+    clock      = VirtualClock(datetime.fromisoformat(header['wall']))
+    responses  = ReplayResponses([event for event in events if event['type'] == "llm"])
+    hub_client = ReplayHubClient()
+
+    options = dict(header['options'],
+        seed          = header['seed'],
+        record        = True,
+        llm_workers   = 0,
+        prefetch_bots = False,
+        speculative   = False,
+        hot_reload    = False,
+        hub_client    = hub_client,
+        llm_factory   = lambda llm_name: ReplayLLM(llm_name, responses, clock),
+    )
+    options.pop('exit_on_complete', None)
+
+    srt_time = time.perf_counter()
+    model = scenemanager.SceneManagerData(clock)
+    sm = scenemanager.get_scene_manager(model, output_path, script_dir or header['script_dir'], header['start_scene'], **options)
+
+    try:
+        for event in events:
+            if event['type'] not in INPUT_EVENTS:
+                continue
+            run_until(sm, clock, event['t'])
+            if sm.current_state.final:
+                break
+
+            if event['type'] == "user" and event['kind'] == "bot":
+                sm.add_bot_user(event['display_name'], event['persona_name'], event['behavior_name'], event['llm_name'], event['few_shots_name'])
+            elif event['type'] == "user":
+                sm.add_web_user(event['display_name'], event['persona_name'])
+            elif event['type'] == "message":
+                sm.put_message(event['message'])
+            elif event['type'] == "hub":
+                hub_client.deliver(event['channel'], event['data'])
+
+        end = events[-1]['t'] if events else 0.0
+        run_until(sm, clock, end)
+        run_to_scene(sm, clock, recorded_scenes[-1] if recorded_scenes else None, end + TRAILING_SECONDS)
+    finally:
+        sm.close()
+
+    _, replayed = load_recording(Path(output_path, RECORDING_FILE_NAME))
+    report = {
+        "recording"      : Path(recording_path).as_posix(),
+        "wall_seconds"   : time.perf_counter() - srt_time,
+        "virtual_seconds": clock.monotonic(),
+        "frames"         : model.frames,
+        "llm"            : {"hits": responses.hits, "misses": responses.misses, "unanswered": responses.unanswered, "unused": responses.unused()},
+        "hub_sent"       : hub_client.sent,
+    }
+    report.update(compare_recordings(events, replayed))
+    return report
@@ -1,17 +1,188 @@
 import re
-from collections import defaultdict
+from collections import defaultdict, deque
 import logging
+import threading
+import time
 from pathlib import Path
 import yaml
 import uuid 
-from state_machine.helpers import LoggerUtils
+from state_machine.helpers import LoggerUtils, get_log_session, set_log_session
+from state_machine.timers import get_scene_timeouts
+from state_machine.yaml_loader import load_yaml_files
 
-def load_scenes(script_dir, start_scene, behaviours, personas, few_shots, default_condition=None):
+SCENE_NAME_EXPR = re.compile(r"^(\d+[\.\d+]+)\_(.*)$")
+
+
+def get_scene_name(scene_yaml_path):
+    """Scene name of a scene file, e.g. `s_INTRO_start` for `1.0_s_INTRO_start.yaml`."""
+    return SCENE_NAME_EXPR.match(Path(scene_yaml_path).stem).group(2)
+
+
+def get_state_def(scene_yaml_path, scene_data, behaviours, personas, few_shots):
+    """Build the state definition of a single scene, raising `ValueError` if it is invalid."""
+    scene = scene_data['scene']
+
+    if 'characters' in scene_data:
+        characters = scene_data['characters']
+        for character in characters:
+            if 'display_name' not in character:
+                logging.warning(f"Character missing display_name")
+                character['display_name'] = uuid.uuid4().hex
+
+            if 'persona_name' not in character:
+                logging.warning(f"Character missing persona_name")
+                character['persona_name'] = ""
+            else:
+                if character['persona_name'] not in personas:
+                    logging.warning(f"Character '{character['persona_name']}' not defined in personas")
+                
+            if 'behavior' not in character:
+                raise ValueError(f"Character missing behavior")
+                
+            if character['behavior'] not in behaviours:
+                raise ValueError(f"Invalid behavior '{character['behavior']}'")
+
+            if 'few_shots' in character and character['few_shots'] not in few_shots:
+                logging.warning(f"Invalid few-shots '{character['few_shots']}'")
+    else:
+        characters = []
+
+    if 'internal_callbacks' in scene_data['scene']:
+        internal_callbacks = scene_data['scene']['internal_callbacks']
+    else:
+        internal_callbacks = []
+
+
+    playback = False    
+    if 'playback' in scene_data:
+        assert isinstance(scene_data['playback'], dict), f"Invalid playback value '{scene_data['playback']}'"
+        assert set(scene_data['playback'].keys()) == set([1,2,3])
+        playback = scene_data['playback']
+
+    return {
+        "meta"   : scene,
+        "initial": scene.get('initial', False),
+        "final"  : scene.get('final', False),
+        "force_mute"        : scene.get('force_mute', False),
+        "file_path"         : scene_yaml_path,
+        "characters"        : characters,
+        "internal_callbacks": internal_callbacks,
+        "playback"          : playback,
+        "auto_think"        : scene.get('auto_think', None),
+        "timeouts"          : get_scene_timeouts(scene, scene_data.get('exits', None)),
+    }
+
+
+def get_bfs_order(start_scene, state_defs):
+    """Scene names in breadth-first order of the exits, starting from `start_scene`."""
+    order, queue = [], deque([start_scene])
+    while queue:
+        scene_name = queue.popleft()
+        if scene_name in order or scene_name not in state_defs:
+            continue
+        order.append(scene_name)
+        queue.extend(exit['target'] for exit in state_defs[scene_name]['exits'])
+    return order + [scene_name for scene_name in state_defs if scene_name not in order]
+
+
+
+class LazySceneParams(dict):
+    """Scene parameters that are only resolved when a scene is first needed.
+
+    `loaders` maps every scene name to a callable building its parameters.
+    Scenes are resolved synchronously on first access, or ahead of time by
+    `prefetch()` in a background thread. Iterating over the scenes resolves
+    all of them.
+    """
+
+    def __init__(self, loaders, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaders = loaders
+        self._lock    = threading.RLock()
+
+
+    def __missing__(self, scene_name):
+        with self._lock:
+            if not dict.__contains__(self, scene_name):
+                logging.debug(f"Resolving scene '{scene_name}'")
+                self[scene_name] = self._loaders[scene_name]()
+            return dict.__getitem__(self, scene_name)
+
+
+    def __contains__(self, scene_name):
+        return scene_name in self._loaders
+
+
+    def __iter__(self):
+        return iter(self._loaders)
+
+
+    def __len__(self):
+        return len(self._loaders)
+
+
+    def keys(self):
+        return self._loaders.keys()
+
+
+    def values(self):
+        return [self[scene_name] for scene_name in self._loaders]
+
+
+    def items(self):
+        return [(scene_name, self[scene_name]) for scene_name in self._loaders]
+
+
+    def get(self, scene_name, default=None):
+        return self[scene_name] if scene_name in self else default
+
+
+    def resolve(self, scene_names):
+        for scene_name in scene_names:
+            self[scene_name]
+
+
+    def prefetch(self, scene_names):
+        log_session = get_log_session()
+
+        def prefetch_task():
+            set_log_session(log_session)
+            srt_time = time.perf_counter()
+            for scene_name in scene_names:
+                try:
+                    self[scene_name]
+                except Exception as e:
+                    # Reported again when a session enters the scene.
+                    logging.error(f"Error loading scene '{scene_name}': {e}")
+            logging.info(f"Prefetched {len(scene_names)} scenes in {(time.perf_counter() - srt_time) * 1000:.1f} ms")
+
+        prefetch_thread = threading.Thread(target=prefetch_task, daemon=True)
+        prefetch_thread.start()
+        return prefetch_thread
+
+
+    def copy(self):
+        with self._lock:
+            return LazySceneParams(self._loaders, dict(dict.items(self)))
+
+
+
+def load_scenes(script_dir, start_scene, behaviours, personas, few_shots, default_condition=None, scene_files=None, topology_only=False):
+    """Build the state, transition and automatic transition definitions of a script.
+
+    `scene_files` optionally maps scene file paths to already parsed scene data
+    (e.g. from a `ScriptBundle`), in which case the scene files are not read again.
+
+    With `topology_only`, the state definitions only hold the topology of each
+    scene (`initial`, `final`, `file_path`, `exits`, `timeouts` and the raw
+    `scene_data`), the characters are not validated. The script analyzer uses
+    it to report the errors of all scenes instead of stopping at the first
+    one, and the lazy scenes resolve each scene with `get_state_def` when it
+    is first needed.
+    """
     scene_dir      = Path(script_dir, "scenes")
     logging.info(f"Loading scenes from '{scene_dir}'\n{LoggerUtils.HR}")
 
-    name_expr = re.compile(r"^(\d+[\.\d+]+)\_(.*)$")
-
     state_defs      = {}
     transition_defs = defaultdict(list)
     automatic_defs  = []
@@ -20,22 +191,26 @@ def load_scenes(script_dir, start_scene, behaviours, personas, few_shots, defaul
         default_condition = "wait_for_manual"
 
     scenes = {}
-    candidates = list(Path(scene_dir).glob('*.yaml'))
+    if scene_files is not None:
+        candidates = list(scene_files.keys())
+    else:
+        candidates = list(Path(scene_dir).glob('*.yaml'))
     if not candidates:
         logging.error(f"No scenes found in '{scene_dir}'")
         exit(1)
 
+    if scene_files is None:
+        try:
+            scene_files = load_yaml_files(candidates)
+        except yaml.YAMLError as e:
+            logging.error(f"Error parsing scenes in '{scene_dir}': {e}")
+            exit(1)
+
     for scene_yaml_path in candidates:
         try:
-            with open(scene_yaml_path, "r", encoding="utf-8") as f:
-                try:
-                    scene_data = yaml.safe_load(f)
-                except yaml.parser.ParserError as e:
-                    logging.error(f"Error parsing scene '{scene_yaml_path}': {e}")
-                    exit(1)
-                
+            scene_data = scene_files[scene_yaml_path]
 
-            match = name_expr.match(scene_yaml_path.stem)
+            match = SCENE_NAME_EXPR.match(scene_yaml_path.stem)
             scene_name  = match.group(2)
             state_index = match.group(1)
             scenes[scene_name] = (scene_yaml_path, scene_data)
@@ -82,60 +257,29 @@ def load_scenes(script_dir, start_scene, behaviours, personas, few_shots, defaul
     logging.info(f"Generating state machine from {len(scenes)} scenes\n{LoggerUtils.HR}")
 
     for scene_name, (scene_yaml_path, scene_data) in scenes.items():
-        logging.info(f"Loading scene '{scene_name}' from '{scene_yaml_path}'")
+        logging.debug(f"Loading scene '{scene_name}' from '{scene_yaml_path}'")
 
         scene = scene_data['scene']
 
-        if 'characters' in scene_data:
-            characters = scene_data['characters']
-            for character in characters:
-                if 'display_name' not in character:
-                    logging.warning(f"Character missing display_name")
-                    character['display_name'] = uuid.uuid4().hex
-
-                if 'persona_name' not in character:
-                    logging.warning(f"Character missing persona_name")
-                    character['persona_name'] = ""
-                else:
-                    if character['persona_name'] not in personas:
-                        logging.warning(f"Character '{character['persona_name']}' not defined in personas")
-                    
-                if 'behavior' not in character:
-                    logging.error(f"Character missing behavior")
-                    exit(1)
-                    
-                if character['behavior'] not in behaviours:
-                    logging.error(f"Invalid behavior '{character['behavior']}'")
-                    exit(1)
-
-                if 'few_shots' in character and character['few_shots'] not in few_shots:
-                    logging.warning(f"Invalid few-shots '{character['few_shots']}'")
-        else:
-            characters = []
-
-        if 'internal_callbacks' in scene_data['scene']:
-            internal_callbacks = scene_data['scene']['internal_callbacks']
+        if topology_only:
+            state_defs[scene_name] = {
+                "initial"   : scene.get('initial', False),
+                "final"     : scene.get('final', False),
+                "file_path" : scene_yaml_path,
+                "scene_data": scene_data,
+            }
+            try:
+                state_defs[scene_name]["timeouts"] = get_scene_timeouts(scene, scene_data.get('exits', None))
+            except ValueError as e:
+                logging.error(f"{e}\n{scene_yaml_path}")
+                exit(1)
         else:
-            internal_callbacks = []
-
-
-        playback = False    
-        if 'playback' in scene_data:
-            assert isinstance(scene_data['playback'], dict), f"Invalid playback value '{scene_data['playback']}'"
-            assert set(scene_data['playback'].keys()) == set([1,2,3])
-            playback = scene_data['playback']
-
-        state_defs[scene_name] = {
-            "meta"   : scene,
-            "initial": scene.get('initial', False),
-            "final"  : scene.get('final', False),
-            "force_mute"        : scene.get('force_mute', False),
-            "file_path"         : scene_yaml_path,
-            "characters"        : characters,
-            "internal_callbacks": internal_callbacks,
-            "playback"          : playback,
-            "auto_think"        : scene.get('auto_think', None),
-        }
+            try:
+                state_defs[scene_name] = get_state_def(scene_yaml_path, scene_data, behaviours, personas, few_shots)
+            except ValueError as e:
+                logging.error(e)
+                exit(1)
+        state_defs[scene_name]["exits"] = scene_data.get('exits', None) or []
 
         if scene_name not in ["s_PREROLL_init", "s_unknown_fault", "s_FINAL"]:
             transition_name = f"manual_fault"
@@ -1,10 +1,12 @@
-import yaml
+import copy
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import logging
 from datetime import datetime, timedelta
 import queue
 
 import json
+import math
 import random
 from statemachine import StateMachine, State
 
@@ -14,16 +16,28 @@ from state_machine.messagehub import MessageHubClient, format_meat_message, form
 from state_machine.helpers import LoggerUtils
 
 from llms import llm
-from .behavior import Behavior
-from .character import StateMachineCharacter, ExternalCharacter
+from .behavior_schema import validate_behavior_yaml, validate_overrides_yaml
+from .character import CharacterPool, StateMachineCharacter, ExternalCharacter
+from .chat_history import TRANSCRIPT_FOOTER, TRANSCRIPT_HEADER, ChatHistory, render_chat_line
+from .clock import Clock
+from .conditions import depends_on, get_condition_dependencies, get_input_versions
 from .diagrams import save_sm_diagram
-from .emotion_processor import EmotionProcessor
-from .helpers import PerformanceMetrics
-from .scene_loader import load_scenes
+from .helpers import PerformanceMetrics, get_log_session, set_log_session
+from .prompt_template import PLACEHOLDER_EXPR, PromptCompiler
+from .recorder import RECORDING_FILE_NAME, Recorder, RecordingLLM
+from .script_analyzer import INDEX_FILE_NAME, build_transition_index, get_condition_names, load_transition_index
+from .scene_loader import load_scenes, get_scene_name, get_state_def, get_bfs_order, LazySceneParams
+from .script_bundle import compile_script
+from .script_watcher import ScriptWatcher
+from .timers import TimerWheel
+from .transcript import CHARS_PER_TOKEN, TranscriptProvider
 import threading
+import time
 
 MEATBOT_NAME = "Dr. Stanley"
-client = None
+# Longest time between two updates when nothing wakes the scene manager up.
+HEARTBEAT = 1.0
+HUB_URL   = "http://127.0.0.1:8005"
 
 def format_prompt(name, prompt, response, llm_name):
     text = ""
@@ -34,37 +48,99 @@ def format_prompt(name, prompt, response, llm_name):
     return text
         
 
+# Message hub clients, keyed by URL. A session keeps the connection of the
+# previous session on the same hub when it is restarted.
+_hub_clients      = {}
+_hub_clients_lock = threading.Lock()
+
+# LLM clients, shared by all the sessions of the process.
+_llms      = {}
+_llms_lock = threading.Lock()
+
+
+def get_hub_client(url):
+    with _hub_clients_lock:
+        if url in _hub_clients:
+            logging.warning(f"MessageHub already enabled")
+        else:
+            _hub_clients[url] = MessageHubClient(url)
+        return _hub_clients[url]
+
+
+# Generated SceneSM classes, keyed by (script_dir, start_scene, mode, lazy_scenes).
+_scene_sm_types      = {}
+_scene_sm_types_lock = threading.Lock()
+
+
 def get_scene_manager(model, output_path, script_dir, start_scene, **kwargs):
     logging.info(f"Creating Scene Manager with script {script_dir}\n{LoggerUtils.HR}")
 
-    behaviors_dir  = Path(script_dir, "behaviors")
-    behavior_paths = { p.stem : p for p in Path(behaviors_dir).glob('*.yaml')}
+    logging.info(f"Loading script bundle and validating behaviors\n{LoggerUtils.HR}")
+    bundle = compile_script(script_dir, validators={
+        "behaviors": validate_behavior_yaml,
+        "overrides": validate_overrides_yaml
+    })
+    if bundle.errors:
+        for file_name, errors in bundle.errors.items():
+            for error in errors:
+                logging.error(f"Invalid script file {file_name}: {error}")
+        raise Exception(f"Invalid script files: {', '.join(bundle.errors.keys())}")
+    logging.info(f"Validated {len(bundle.get('behaviors'))} behaviors\n{LoggerUtils.HR}")
+
+    lazy_scenes = kwargs.get('lazy_scenes', False)
+    key = (Path(script_dir).absolute().as_posix(), start_scene, kwargs['mode'], lazy_scenes)
+    with _scene_sm_types_lock:
+        fingerprint, SceneSM_Type = _scene_sm_types.get(key, (None, None))
+        if fingerprint != bundle.fingerprint():
+            SceneSM_Type = build_scene_sm_type(bundle, script_dir, start_scene, kwargs['mode'], lazy_scenes)
+            _scene_sm_types[key] = (bundle.fingerprint(), SceneSM_Type)
+        else:
+            logging.info(f"Reusing SceneSM definition for {key}")
 
-    persona_dir    = Path(script_dir, "persona")
-    persona_dict   = { p.stem : open(p, "r", encoding="utf-8").read()  for p in Path(persona_dir).glob('*.txt')}
-    
-    few_shots_dir  = Path(script_dir, "few-shots")
-    few_shots_dict = { p.stem : open(p, "r", encoding="utf-8").read()  for p in Path(few_shots_dir).glob('*.txt')}
+    # The fake media of a session are updated at runtime, so they must not be shared.
+    model.fake_media = copy.deepcopy(SceneSM_Type.static_fake_texts)
 
-    script_name = Path(script_dir).stem
+    # Dynamic events are shuffled, recordings and replays share the seed.
+    seed = kwargs.pop('seed', None)
+    record = kwargs.pop('record', False)
+    if record and seed is None:
+        seed = random.randrange(2**32)
+    if seed is not None:
+        random.seed(seed)
+    if record:
+        kwargs['recorder'] = Recorder(Path(output_path, RECORDING_FILE_NAME), model.clock, script_dir, start_scene, seed, kwargs)
 
-    behaviour_yamls = {}
-    logging.info(f"Validating behaviors\n{LoggerUtils.HR}")
-    for bname, bpath in behavior_paths.items():
-        name = Path(bpath).stem
-        with open(bpath, 'r', encoding="utf-8") as f:
-            _yaml_str = f.read()
-            try:
-                _yaml = yaml.safe_load(_yaml_str)
-            except yaml.YAMLError as e:
-                logging.error(f"Error parsing YAML file {bpath}: {e}")
-                raise e
-        Behavior(name, _yaml)
+    return SceneSM_Type(model, Path(output_path).absolute().__str__(), **kwargs)
 
-        behaviour_yamls[bname] = _yaml
 
-    logging.info(f"Validated {len(behavior_paths)} behaviors\n{LoggerUtils.HR}")
+def get_scene_params(state_def):
+    return {
+        'meta': state_def['meta'],
+        'auto_think': state_def['auto_think'],
+        'force_mute': state_def['force_mute'],
+        'file_path' : state_def['file_path'],
+        'characters': state_def['characters'],
+        'internal_callbacks': state_def['internal_callbacks'],
+        'timeouts'  : state_def['timeouts']
+    }
+
+
+def build_scene_sm_type(bundle, script_dir, start_scene, mode, lazy_scenes=False):
+    """Generate the SceneSM class (states, transitions and script data) of a script bundle.
+
+    The states and transitions are always built from the topology of every
+    scene. With `lazy_scenes`, the characters and parameters of a scene are
+    only resolved for the initial scene and its exit targets here, the other
+    scenes are prefetched in the background in BFS order, or resolved when a
+    session enters them first.
+    """
+    behavior_paths = { name : path for name, (path, _) in bundle.get("behaviors").items()}
+    behaviour_yamls = bundle.data("behaviors")
+    persona_dict   = bundle.data("persona")
+    few_shots_dict = bundle.data("few-shots")
 
+    script_name = Path(script_dir).stem
+    default_condition = "complete" if mode == "simulation" else None
 
     state_defs, transition_defs, automatic_defs = load_scenes(
         script_dir, 
@@ -72,10 +148,27 @@ def get_scene_manager(model, output_path, script_dir, start_scene, **kwargs):
         list(behavior_paths.keys()),
         list(persona_dict.keys()),
         list(few_shots_dict.keys()),
-        default_condition= "complete" if kwargs['mode'] == "simulation" else None
+        default_condition=default_condition,
+        scene_files={ path : copy.deepcopy(data) for path, data in bundle.get("scenes").values()},
+        topology_only=lazy_scenes
     )
 
-    states, scene_params = {}, {}
+    if lazy_scenes:
+        def get_scene_loader(state_def):
+            def load_scene():
+                return get_scene_params(get_state_def(
+                    state_def['file_path'],
+                    copy.deepcopy(state_def['scene_data']),
+                    list(behavior_paths.keys()),
+                    list(persona_dict.keys()),
+                    list(few_shots_dict.keys())
+                ))
+            return load_scene
+        scene_params = LazySceneParams({ sname : get_scene_loader(params) for sname, params in state_defs.items()})
+    else:
+        scene_params = {}
+
+    states = {}
     transitions = {}
     for sname, params in state_defs.items():
         assert sname not in states, f"State '{sname}' already defined"
@@ -84,14 +177,16 @@ def get_scene_manager(model, output_path, script_dir, start_scene, **kwargs):
         if not states[sname].final:
             states[sname].to.itself(internal=True, event="internal_update", on="_on_update")
 
-        scene_params[sname] = {
-            'meta': params['meta'],
-            'auto_think': params['auto_think'],
-            'force_mute': params['force_mute'],
-            'file_path' : params['file_path'],
-            'characters': params['characters'],
-            'internal_callbacks': params['internal_callbacks']
-        }
+        if not lazy_scenes:
+            scene_params[sname] = get_scene_params(params)
+
+    if lazy_scenes:
+        first_scene = next(sname for sname, params in state_defs.items() if params['initial'])
+        next_hops   = [first_scene] + [exit['target'] for exit in state_defs[first_scene]['exits']]
+        scene_order = [sname for sname in get_bfs_order(first_scene, state_defs) if sname not in next_hops]
+        scene_params.resolve(next_hops)
+        logging.info(f"Loaded scene '{first_scene}' and its {len(next_hops) - 1} exits, prefetching {len(scene_order)} scenes")
+        scene_params.prefetch(scene_order)
 
 
     for tname, params_list in transition_defs.items():
@@ -118,39 +213,40 @@ def get_scene_manager(model, output_path, script_dir, start_scene, **kwargs):
         source.to(target, cond=conditions, event="e_automatic")
     
 
-    custom_prompts = {}
-    for custom_prompt in Path(script_dir, "set-prompts").glob("prompt_*.yaml"):
-        with open(custom_prompt, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
-            custom_prompts[data['name']] = data
-
-    try:
-        with open(Path(script_dir, "fake_texts", "static_fake_texts.json"), "r", encoding="utf-8") as f:
-            static_fake_texts  = json.loads(f.read())
-    except FileNotFoundError as e:
-        static_fake_texts = {}
-    
-    try:
-        with open(Path(script_dir, "overrides", "default_overrides.yaml"), "r", encoding="utf-8") as f:
-            default_overrides  = yaml.safe_load(f)
-    except FileNotFoundError as e:
-        default_overrides = {}
-
-
-    placeholders = {}       
-    try:
-        for placeholder in Path(script_dir, "placeholders").glob("*.txt"):
-            placeholders["_" + placeholder.stem] = open(placeholder, "r").read()
-    except FileNotFoundError as e:
+    transition_index = load_transition_index(Path(script_dir, INDEX_FILE_NAME), bundle.fingerprint(), start_scene, default_condition)
+    if transition_index is None:
+        transition_index = build_transition_index(transition_defs, automatic_defs)
+    else:
+        logging.info(f"Loaded transition index from '{Path(script_dir, INDEX_FILE_NAME)}'")
+
+    custom_prompts = { data['name'] : data for data in bundle.data("set-prompts").values()}
+
+    static_fake_texts = bundle.data("fake_texts").get("static_fake_texts", {})
+    default_overrides = bundle.data("overrides").get("default_overrides", {})
+
+    placeholders = { "_" + name : text for name, text in bundle.data("placeholders").items()}
+    if not placeholders:
         logging.warning(f"No placeholders found in {script_dir}/placeholders")
 
-    model.fake_media = static_fake_texts
+    prompt_compiler = PromptCompiler(placeholders)
+    count = prompt_compiler.precompile(behaviour_yamls.values(), list(persona_dict.values()) + list(few_shots_dict.values()))
+    logging.info(f"Compiled {count} prompt templates")
 
-    SceneSM_Type = type("SceneSM", (SceneManager,), {
+    # Conditions for the `timeout_<N>` and scene level timeouts, e.g. `timeouts: {wait_for_answer: 12}`.
+    timeout_conditions = {}
+    for params in state_defs.values():
+        for name in params['timeouts']:
+            if not hasattr(SceneManagerData, name) and not hasattr(SceneManager, name):
+                timeout_conditions[name] = depends_on("clock")(lambda self, name=name: self.model.timers.expired(name))
+
+    return type("SceneSM", (SceneManager,), {
         **states,
         **transitions,
+        **timeout_conditions,
         "script_name"   : script_name,
+        "script_dir"    : Path(script_dir),
         "scene_params"  : scene_params, 
+        "transition_index": transition_index,
         "persona_dict"  : persona_dict,
         "behavior_paths": behavior_paths,
         "behavior_yamls" : behaviour_yamls,
@@ -158,9 +254,10 @@ def get_scene_manager(model, output_path, script_dir, start_scene, **kwargs):
         "custom_prompts": custom_prompts,
         "static_fake_texts": static_fake_texts,
         "default_overrides": default_overrides,
-        "placeholders"  : placeholders
+        "placeholders"  : placeholders,
+        "prompt_compiler": prompt_compiler
     })
-    return SceneSM_Type(model, Path(output_path).absolute().__str__(), **kwargs)
+
 
 class Message:
     def __init__(self):
@@ -168,6 +265,15 @@ class Message:
     def json(self):
         return self.model
 
+class NotifyingQueue(queue.Queue):
+    """Queue calling `on_put` after each message is added."""
+    def __init__(self, on_put):
+        super().__init__()
+        self.on_put = on_put
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        self.on_put()
+
 class MessageIn(Message):
     class CMD:
         EVENT   = "event"
@@ -199,6 +305,23 @@ class CachedInferredValue:
 
 
 
+# Condition inputs of the placeholders of the set prompts, the other placeholders are fake media,
+# typeform answers and inferred values ("media").
+PLACEHOLDER_INPUTS = {
+    "_CHAT_HISTORY"     : "chat",
+    "_CHAT_HISTORY_LAST": "chat",
+    "_DATE"             : "time",
+    "_TIME"             : "time",
+    "_EMOTION_USER"     : "users",
+}
+
+
+def get_placeholder_inputs(text):
+    """Condition inputs read by the placeholders of a prompt."""
+    return {PLACEHOLDER_INPUTS.get(match, "media") for match in PLACEHOLDER_EXPR.findall(text)}
+
+
+
 class InferredValuesManager():
 
     def __init__(self, scenemanager, model):
@@ -209,15 +332,26 @@ class InferredValuesManager():
 
         logging.info(f"Setting up inferred values")
         self.custom_prompts = scenemanager.custom_prompts
-        self.fake_media     = scenemanager.static_fake_texts
+        self.fake_media     = model.fake_media
         self.output_path    = scenemanager.output_path
 
         for custom_prompts_data in self.custom_prompts.values():
+            self.add_custom_prompt(custom_prompts_data)
+
 
-            self.add_inferred_value(**custom_prompts_data)
-            method_name = custom_prompts_data['name']
-            logging.info(f"Adding inferred value {method_name}")
-            setattr(self.model, method_name, lambda method_name=method_name: self.get_inferred_value(method_name))
+    def add_custom_prompt(self, custom_prompts_data):
+        self.add_inferred_value(**custom_prompts_data)
+        method_name = custom_prompts_data['name']
+        logging.info(f"Adding inferred value {method_name}")
+        setattr(self.model, method_name, self._get_condition(method_name))
+
+
+    def _get_condition(self, name):
+        # An inferred value only changes with the placeholders of its prompt.
+        @depends_on(*get_placeholder_inputs(self.prompts[name]))
+        def condition(model):
+            return self.get_inferred_value(name)
+        return condition.__get__(self.model)
 
 
 
@@ -239,6 +373,8 @@ class InferredValuesManager():
         
         val = self.cached_inferred_values[name].get(prompt)
         if val is not None:
+            if self.model.inferred_values.get(name) != val:
+                self.model.media_version += 1
             self.model.inferred_values[name] = val
         else:
             logging.error(f"Error getting inferred value {name}")
@@ -268,7 +404,15 @@ class InferredValuesManager():
                 log_file = self.save_prompt(name, prompt, response, llm_name)
                 return response
             
-            response = llm.call(prompt, 0, end_callback, take_first_line=False)
+            srt_time = time.perf_counter()
+            error = None
+            try:
+                response = llm.call(prompt, 0, end_callback, take_first_line=False)
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                self.scenemanager.record_llm_call(name, llm_name, time.perf_counter() - srt_time, error)
 
             if return_type == "bool":
                 response = bool(self._parse_response_bool(response))
@@ -277,6 +421,8 @@ class InferredValuesManager():
             else:
                 pass
             logging.info(f"Response: {response}")
+            if self.scenemanager.recorder:
+                self.scenemanager.recorder.record("inferred", name=name, value=response)
             return response
 
         self.cached_inferred_values[name] = CachedInferredValue(lambda x: process_prompt(x))
@@ -313,14 +459,18 @@ class InferredValuesManager():
 
 
 class SceneManagerData:   
-    def __init__(self):  
+    def __init__(self, clock=None):
+        # Source of the session time, a `VirtualClock` in replays.
+        self.clock = clock or Clock()  
 
-        self.chat_history = []
+        self.chat_history = ChatHistory()
+        # Set by the scene manager, serves the transcripts of the prompts with a token budget.
+        self.transcripts  = None
         self.scene_params = None
         self.bots  = {}
         self.users = {}
         self.last_scene_change = None 
-        self.init_time = datetime.now() 
+        self.init_time = self.clock.now() 
         self.start_time = None
         self.end_time   = None
         self.listening = False
@@ -330,6 +480,8 @@ class SceneManagerData:
 
         self.metrics       = None   
         self.frames = 0
+        self.timers = TimerWheel(self.clock)
+        self.condition_cache = None
         self.glitch = {
             "active": False,
             "duration": 0.5,
@@ -343,6 +495,8 @@ class SceneManagerData:
         self.custom_prompts = {}
         self.inferred_values = {}
         self.typeform = {}
+        # Incremented when the fake media, typeform or inferred values change.
+        self.media_version = 0
         
         self.update_typeform()
 
@@ -351,70 +505,81 @@ class SceneManagerData:
     def time_since_last_scene_change(self):
         if self.last_scene_change is None:
             return 0
-        return datetime.now() - self.last_scene_change
-
-
-    def replace_placeholders(self, text):        
-        pattern = r'\b_(?<=_)[A-Z_]+\b'
-        matches = re.findall(pattern, text)[::-1]
-        for match in matches:
-            if match == "_DATE":
-                text = text.replace("_DATE", datetime.now().strftime("%A, %B %d, %Y"))
-            elif match == "_TIME":
-                text = text.replace("_TIME", datetime.now().strftime("%H:%M"))
-            elif match == "_CHAT_HISTORY":
-                text = text.replace("_CHAT_HISTORY", self.get_chat_history())
-            elif match == "_CHAT_HISTORY_LAST":
-                text = text.replace("_CHAT_HISTORY", self.get_chat_history(limit=10))
-
-            elif match == "_EMOTION_USER":
-                text = text.replace("_EMOTION_USER", self.users['Patient'].emotion)
-            elif match == "_ISSUE":
-                if "derive_issue" in self.inferred_values:
-                    issue = self.inferred_values["derive_issue"]
-                    text = text.replace("_ISSUE", issue["problem"] if issue else "_ISSUE")
-
-            elif match == "_HALLUCINATION":
-                if "derive_hallucination" in self.inferred_values:
-                    hallucination = self.inferred_values["derive_hallucination"]
-                    text = text.replace("_HALLUCINATION", hallucination["therapist"] if hallucination else "_HALLUCINATION")
-
-            elif match == "_HALLUCINATION_DEEPFAKE":
-                if "derive_hallucination" in self.inferred_values:
-                    hallucination = self.inferred_values["derive_hallucination"]
-                    text = text.replace("_HALLUCINATION_DEEPFAKE", hallucination["deepfake"] if hallucination else "_HALLUCINATION")
-
-            elif match[1:] in self.fake_media:
-                text = text.replace(match, self.fake_media[match[1:]]["text"])
-            else:
-                match_value = None
-                for name, v in self.typeform.items():
-                    value = v[0]
-                    placeholder = v[1]
-                    if match == placeholder:
-                        match_value = value
-                        break
-                
-                if match_value:
-                    text = text.replace(match, match_value)
-                else:
-                    logging.warning(f"Placeholder {match} not found")
+        return self.clock.now() - self.last_scene_change
+
+
+    def get_placeholder_value(self, match, transcript_budget=None, pending_line=None):
+        """Value of a placeholder filled in from the session data, `None` if it is unknown.
+
+        The chat history placeholders take at most `transcript_budget` tokens, see `TranscriptProvider`,
+        and end with `pending_line` if it is given.
+        """
+        if match == "_DATE":
+            return self.clock.now().strftime("%A, %B %d, %Y")
+        elif match == "_TIME":
+            return self.clock.now().strftime("%H:%M")
+        elif match == "_CHAT_HISTORY":
+            return self.get_chat_history(budget=transcript_budget, pending_line=pending_line)
+        elif match == "_CHAT_HISTORY_LAST":
+            return self.get_chat_history(limit=10, budget=transcript_budget, pending_line=pending_line)
+
+        elif match == "_EMOTION_USER":
+            return self.users['Patient'].emotion
+        elif match == "_ISSUE":
+            if "derive_issue" in self.inferred_values:
+                issue = self.inferred_values["derive_issue"]
+                return issue["problem"] if issue else "_ISSUE"
+            return match
+
+        elif match == "_HALLUCINATION":
+            if "derive_hallucination" in self.inferred_values:
+                hallucination = self.inferred_values["derive_hallucination"]
+                return hallucination["therapist"] if hallucination else "_HALLUCINATION"
+            return match
+
+        elif match == "_HALLUCINATION_DEEPFAKE":
+            if "derive_hallucination" in self.inferred_values:
+                hallucination = self.inferred_values["derive_hallucination"]
+                return hallucination["deepfake"] if hallucination else "_HALLUCINATION"
+            return match
+
+        elif match[1:] in self.fake_media:
+            return self.fake_media[match[1:]]["text"]
+        else:
+            for name, v in self.typeform.items():
+                value = v[0]
+                placeholder = v[1]
+                if match == placeholder:
+                    return value or None
+            return None
 
-        return text    
 
-    def add_message_to_chat_history(self, display_name, persona_name, message, log_file=None):
-        # logging.info(f"Adding message from {display_name} (persona {persona_name}): {message}")
+    def replace_placeholders(self, text):
+        def replace(match):
+            match_value = self.get_placeholder_value(match.group(0))
+            if match_value is None:
+                logging.warning(f"Placeholder {match.group(0)} not found")
+                return match.group(0)
+            return match_value
+        return PLACEHOLDER_EXPR.sub(replace, text)
+
+    def get_chat_entry(self, display_name, persona_name, message, log_file=None):
+        """Chat history entry of a message, with the stage directions removed."""
         message = message.encode('utf-8').decode('utf-8')
         message = re.sub(r'(\[\S.+?\])', '', message)
         message = re.sub(r'(\*\*\S.+?\*\*)', '', message)
-        self.chat_history.append({
-            "line" : len([l for l in self.chat_history if l["type"] == "chat"]),
+        return {
+            "line" : self.chat_history.lines,
             "type" : "chat",
             "name": display_name,
             "persona": persona_name,
             "message": message,
             "log_file": log_file.absolute().__str__() if log_file else None
-        })
+        }
+
+    def add_message_to_chat_history(self, display_name, persona_name, message, log_file=None):
+        # logging.info(f"Adding message from {display_name} (persona {persona_name}): {message}")
+        self.chat_history.append(self.get_chat_entry(display_name, persona_name, message, log_file))
 
     def add_scene_change_to_chat_history(self, scene, params):
         # logging.info(f"Adding scene change: {scene}")
@@ -442,45 +607,48 @@ class SceneManagerData:
             "message": f"MeatState {meatstate}"
         })
         
-    def get_chat_history(self, limit=None):
-        chat_history = [ c for c in self.chat_history if c["type"] == "chat"]
-        srt = 0
-        end = len(chat_history)
-        if limit:
-            srt = max(0, end - limit)
-
-        s = '--- Beginning of transcript ---\n\n'
-        for msg in chat_history[srt:end]:
-            s += f'**{msg["name"]}:**\n{msg["message"]}\n\n'
-        s += '--- End of transcript ---'
-        return s  
+    def get_chat_history(self, limit=None, budget=None, pending_line=None):
+        """Transcript of the last `limit` chat lines in `budget` tokens.
+
+        `pending_line` is a chat entry that is not in the history, e.g. the
+        partial text of the user, rendered as the last line of the transcript.
+        """
+        if pending_line is not None:
+            line = render_chat_line(pending_line)
+            if limit == 1:
+                text = TRANSCRIPT_HEADER + TRANSCRIPT_FOOTER
+            else:
+                budget = max(1, budget - math.ceil(len(line) / CHARS_PER_TOKEN)) if budget else budget
+                text = self.get_chat_history(limit - 1 if limit else None, budget)
+            return text[:-len(TRANSCRIPT_FOOTER)] + line + TRANSCRIPT_FOOTER
+        if budget and self.transcripts:
+            return self.transcripts.get(budget, limit)
+        return self.chat_history.transcript(limit)
 
     # Turn taking
+    @depends_on("chat", "users")
     def user_spoke_last(self):
-        chat_history = [ c for c in self.chat_history if c["type"] == "chat"]
-        try:
-            return chat_history[-1]['name'] in self.users
-        except (IndexError, KeyError) as e:
-            return False
+        return self.chat_history.last_speaker in self.users
         
-    def bot_spoke_last(self):  
-        chat_history = [ c for c in self.chat_history if c["type"] == "chat"]
-        try:
-            return chat_history[-1]['name'] in self.bots
-        except (IndexError, KeyError) as e:
-            return False
+    @depends_on("chat", "bots")
+    def bot_spoke_last(self):
+        return self.chat_history.last_speaker in self.bots
         
+    @depends_on("bots")
     def no_waiting_responses(self):
         return not any([len(bot.data._responses) > 0 for bot in self.bots.values()])
     
+    @depends_on("bots")
     def bot_speaking(self):
         return any([bot.is_speaking() for bot in self.bots.values()])
 
+    @depends_on("bots")
     def bots_complete(self):
         if len(self.bots) == 0:
             return True
         return all([bot.current_state.id == "s_final" and not bot.is_speaking() for bot in self.bots.values()])
 
+    @depends_on("bots")
     def complete(self):
         complete = self.bots_complete() 
         return complete           
@@ -488,27 +656,40 @@ class SceneManagerData:
     # Timeouts
     def timeout(self, T):
         return self.time_since_last_scene_change > timedelta(seconds=T)
+
+    def scene_timeout(self, name, T):
+        # Timers are armed when entering a scene for the timeouts of its exits.
+        if self.timers.is_armed(name):
+            return self.timers.expired(name)
+        return self.timeout(T)
     
+    @depends_on("clock")
     def timeout_2(self):
-        return self.timeout(2)
+        return self.scene_timeout("timeout_2", 2)
         
+    @depends_on("clock")
     def timeout_3(self):
-        return self.timeout(3)
+        return self.scene_timeout("timeout_3", 3)
     
+    @depends_on("clock")
     def timeout_exit(self):
-        return self.timeout(10)
+        return self.scene_timeout("timeout_exit", 10)
     
+    @depends_on("clock")
     def timeout_preroll(self):
-        return self.timeout(7)
+        return self.scene_timeout("timeout_preroll", 7)
 
+    @depends_on("clock")
     def short_timeout(self):
-        return self.timeout(30)
+        return self.scene_timeout("short_timeout", 30)
     
+    @depends_on("clock")
     def tiny_timeout(self):
-        return self.timeout(1)
+        return self.scene_timeout("tiny_timeout", 1)
     
+    @depends_on("clock")
     def long_timeout(self):
-        return self.timeout(45)
+        return self.scene_timeout("long_timeout", 45)
     
     # Custom prompts
 
@@ -516,13 +697,17 @@ class SceneManagerData:
         try:
             with open("output/typeform.json") as f:
                 self.typeform = json.loads(f.read())
+                self.media_version += 1
                 logging.info("Loaded typeform information: %s", self.typeform)
         except:
             logging.warning("Cannot read typeform data.")
 
 
     def update_fake_texts(self):
+        log_session = get_log_session()
+
         def update_fake_texts_task():
+            set_log_session(log_session)
             self.derive_issue()
             hallucination = self.derive_hallucination()
         
@@ -533,6 +718,7 @@ class SceneManagerData:
                     "audio": "user",
                     "video": "user"
                 }
+                self.media_version += 1
                 logging.info(f"Updating fake texts: {hallucination}")
             else:
                 logging.error(f"Error updating fake texts: {hallucination}")
@@ -557,14 +743,31 @@ class SceneManager(StateMachine):
                  auto_think = False,
                  use_emotions = False,
                  llm_name = None,
+                 hot_reload = False,
+                 llm_workers = 4,
+                 speculative = False,
+                 speculative_similarity = 0.8,
+                 prefetch_bots = True,
+                 hub_url = HUB_URL,
+                 hub_client = None,
+                 recorder = None,
+                 llm_factory = None,
+                 transcript_keep_turns = 20,
+                 transcript_summary_every = 10,
+                 summary_llm_name = None,
+                 log_handler = None,
                  *args, **kwargs):
         
         logging.info(f"Creating SceneManager\n{LoggerUtils.HR}")
 
         self.wait_for_speak_callback = wait_for_speak_callback
         self.use_hub                 = use_hub        
+        self.hub_url                 = hub_url
+        self.hub_client              = hub_client
+        self.client                  = None
         self.auto_speak              = auto_speak
-        self.msg_in                  = queue.Queue()
+        self.wakeup_event            = threading.Event()
+        self.msg_in                  = NotifyingQueue(self.notify)
         self.performance_metrics     = PerformanceMetrics()
         self.output_path             = output_path
         self.exit_on_complete        = exit_on_complete
@@ -572,12 +775,45 @@ class SceneManager(StateMachine):
         self.auto_think              = auto_think   
         self.use_emotions            = use_emotions
         self.llm_name                = llm_name or llm.LLM.default_name()
-
-        self._llms = {} 
+        self.speculative             = speculative
+        self.speculative_similarity  = speculative_similarity
+        self.log_handler             = log_handler
+
+        # Scenes entered, time to enter them and LLM calls made during the session, reported by the simulation runner and the benchmarks.
+        self.scene_path     = []
+        self.scene_enter_ms = []
+        self.llm_calls      = []
+
+        # Inputs of the session are recorded by `recorder`, replays answer the LLM calls with `llm_factory`.
+        self.recorder    = recorder
+        self.llm_factory = llm_factory
+
+        # Characters of the exit targets of the scene, built in the background, `{scene: future}`.
+        # The worker threads log in the log file of the session creating them.
+        log_session = (get_log_session(),)
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch", initializer=set_log_session, initargs=log_session) if prefetch_bots else None
+        self._prebuilt_bots    = {}
+        self.character_pool    = CharacterPool()
+        # Characters of the previous scenes still generating or saying the response to their end prompt.
+        self._ending_bots      = []
+
+        # Character responses are generated on these threads, `llm_workers=0` calls the LLM in `update()`.
+        self.llm_executor = ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="llm", initializer=set_log_session, initargs=log_session) if llm_workers > 0 else None
+
+        # Prompts with a `transcript_budget` get the last turns and a summary of the earlier ones, updated on the LLM threads.
+        self.summary_llm_name = summary_llm_name or self.llm_name
+        model.transcripts    = TranscriptProvider(model.chat_history, self._summarize_transcript,
+                                                transcript_keep_turns, transcript_summary_every, executor=self.llm_executor)
+
+        # Inputs of the automatic conditions of each scene, and their versions at the last evaluation.
+        self._automatic_dependencies = {}
+        self._automatic_inputs       = None
 
         self.inferred_values_manager = InferredValuesManager(self, model)
 
         if use_emotions:
+            # Imported here, transformers and onnxruntime take seconds to import.
+            from .emotion_processor import EmotionProcessor
             self.emotion_processor = EmotionProcessor()
 
         if self.wait_for_speak_callback and not self.use_hub:
@@ -589,43 +825,135 @@ class SceneManager(StateMachine):
         if use_hub:
             self._setup_message_hub()
 
+        self.script_watcher = None
+        if hot_reload:
+            self._setup_hot_reload()
+
         super().__init__(model)
         self.set_listening(False)
 
 
-    def replace_placeholders(self, text):
-        pattern = r'\b_(?<=_)[A-Z_]+\b'
-        for _ in range(2):
-            matches = re.findall(pattern, text)[::-1]
-            for match in matches:
-                if match in self.placeholders:
-                    text = text.replace(match, self.placeholders[match])
+    def close(self):
+        if self.recorder:
+            self.recorder.close()
+        if self.script_watcher:
+            self.script_watcher.stop()
+        if self.llm_executor:
+            self.llm_executor.shutdown(wait=False, cancel_futures=True)
+        if self.prefetch_executor:
+            self.prefetch_executor.shutdown(wait=False, cancel_futures=True)
+        if self.log_handler:
+            logging.getLogger().removeHandler(self.log_handler)
+            self.log_handler.close()
+
+
+    def notify(self):
+        """Wake up the thread running `update()`, there is work to do."""
+        self.wakeup_event.set()
+
+
+    def get_wakeup_timeout(self):
+        """Seconds the thread running `update()` can sleep if nothing notifies it."""
+        deadline = self.model.timers.next_deadline()
+        if deadline is None:
+            return HEARTBEAT
+        return max(0.0, min(HEARTBEAT, deadline - self.model.clock.monotonic()))
 
-        return self.model.replace_placeholders(text)
 
+    def _get_frame_key(self):
+        bots = tuple((bot.current_state.id, bot.is_speaking(), len(bot.data._responses)) for bot in self.model.bots.values())
+        return (self.current_state.id, len(self.model.chat_history), self.model.listening, bots)
 
+
+    def _get_automatic_inputs(self):
+        """Versions of the inputs of the automatic conditions of the scene, None if some are unknown."""
+        state = self.current_state.id
+        if state not in self._automatic_dependencies:
+            names = [name for params in self.transition_index.get(state, {}).get("automatic", []) for name in get_condition_names(params['condition'])]
+            self._automatic_dependencies[state] = get_condition_dependencies(names, self.model, self)
+            logging.debug(f"SceneManager | Inputs of the automatic conditions of '{state}': {self._automatic_dependencies[state]}")
+
+        dependencies = self._automatic_dependencies[state]
+        if dependencies is None:
+            return None
+        return (state, get_input_versions(self.model, dependencies))
+
+
+    @depends_on()
     def wait_for_manual(self):
         return False
     
+    def record_llm_call(self, name, llm_name, seconds, error=None):
+        # Called from the LLM worker threads, `list.append` is atomic.
+        self.llm_calls.append({"name": name, "llm": llm_name, "seconds": seconds, "error": error})
+
     def get_llm(self, llm_name):
-        if llm_name not in self._llms:
-            logging.info(f"Creating LLM {llm_name}")
-            self._llms[llm_name] = llm.LLM(llm_name)
+        if self.llm_factory:
+            llm_client = self.llm_factory(llm_name)
+        else:
+            # Characters are also created by the prefetch thread, and other sessions.
+            with _llms_lock:
+                if llm_name not in _llms:
+                    logging.info(f"Creating LLM {llm_name}")
+                    _llms[llm_name] = llm.LLM(llm_name)
+            llm_client = _llms[llm_name]
+
+        if self.recorder:
+            return RecordingLLM(llm_client, self.recorder)
+        return llm_client
+
+
+    def _summarize_transcript(self, prompt):
+        """Call the summary LLM of `TranscriptProvider`, returns `None` if it gave no response."""
+        llm_name = self.summary_llm_name
+        srt_time = time.perf_counter()
+        error = None
+        try:
+            return self.get_llm(llm_name).call(prompt, 0, lambda prompt, response, timestamp: response, take_first_line=False)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.record_llm_call("transcript_summary", llm_name, time.perf_counter() - srt_time, error)
+
 
-        return self._llms[llm_name]
+    def put_message(self, message_data):
+        """Queue a message of the web interface, see `MessageIn`."""
+        message = MessageIn(message_data)
+        if self.recorder:
+            self.recorder.record("message", message=message_data)
+        self.msg_in.put(message)
 
     def update(self):
         self.performance_metrics.register_frame_start()
+        frame_key = self._get_frame_key()
+        if self.script_watcher:
+            self._apply_script_changes()
+
+        for name in self.model.timers.advance():
+            logging.debug(f"SceneManager | Timeout '{name}'")
+
         try:
             self.internal_update()
         except TransitionNotAllowed as e:
             if self.current_state.id != "s_FINAL":
                 logging.warning(f"SceneManager | No more transitions available {self.current_state.id}")
         
-        try:
-            self.e_automatic()
-        except TransitionNotAllowed as e:
-            logging.debug(f"SceneManager | {e}")
+        # Automatic conditions are only evaluated again when one of their inputs changed.
+        inputs = self._get_automatic_inputs()
+        if inputs is None or inputs != self._automatic_inputs:
+            self._automatic_inputs     = inputs
+            self.model.condition_cache = {}
+            try:
+                self.e_automatic()
+            except TransitionNotAllowed as e:
+                logging.debug(f"SceneManager | {e}")
+            finally:
+                self.model.condition_cache = None
+
+        # Something changed, the next frame may have more to do.
+        if self._get_frame_key() != frame_key:
+            self.notify()
 
         self.performance_metrics.register_frame_end() 
         self.model.metrics = self.performance_metrics.get_metrics()
@@ -658,15 +986,20 @@ class SceneManager(StateMachine):
         )
         self.model.users[display_name].e_init()
 
+        if self.recorder:
+            self.recorder.record("user", kind="bot", display_name=display_name, persona_name=persona_name, behavior_name=behavior_name, llm_name=llm_name, few_shots_name=few_shots_name)
+
 
     def add_web_user(self, display_name, persona_name):
         self.model.users[display_name] = ExternalCharacter(self, display_name, persona_name)
 
+        if self.recorder:
+            self.recorder.record("user", kind="web", display_name=display_name, persona_name=persona_name)
+
 
     def add_meatstate(self, display_name, persona_name, meatstate):
-        global client
-        if display_name in self.model.bots:
-            bot = self.model.bots[display_name]
+        bot = self._getBot(display_name)
+        if bot is not None:
 
             self.model.add_meatstate_to_chat_history(display_name, persona_name, meatstate)
 
@@ -678,10 +1011,10 @@ class SceneManager(StateMachine):
 
             # self._advanceUsers()
             
-            if display_name == MEATBOT_NAME and client:
+            if display_name == MEATBOT_NAME and self.client:
                 logging.info(f"Sending meat message {display_name} (persona {persona_name}): {meatstate}")
                 data = format_meat_meatstate(meatstate)
-                client.send_message("meat-command", data)
+                self.client.send_message("meat-command", data)
 
         else:
             logging.warning(f"Unknown character '{display_name}'")
@@ -690,7 +1023,6 @@ class SceneManager(StateMachine):
 
 
     def add_message(self, display_name, persona_name, message, emotion_args = None, external=False, log_file=None): 
-        global client
         logging.debug(f"Processing message from {display_name} (persona {persona_name}): {message}")
         if display_name in self.model.users:
             user = self.model.users[display_name]
@@ -707,8 +1039,8 @@ class SceneManager(StateMachine):
                 
             self._advanceBots()
                 
-        elif display_name in self.model.bots:
-            bot = self.model.bots[display_name]
+        elif self._getBot(display_name) is not None:
+            bot = self._getBot(display_name)
 
             if not self.wait_for_speak_callback or external or display_name != MEATBOT_NAME :
                 bot.data._speaking = False
@@ -724,7 +1056,7 @@ class SceneManager(StateMachine):
                         self._advanceUsers()
 
             else:
-                if client and display_name == MEATBOT_NAME :
+                if self.client and display_name == MEATBOT_NAME :
                     self.set_listening(False)
                     logging.info(f"Sending meat message {display_name} (persona {persona_name}): {message}")
 
@@ -740,7 +1072,7 @@ class SceneManager(StateMachine):
                     else:
                         raise Exception(f"Unknown channel {emotion_args['channel']}")
                     
-                    client.send_message("meat-command", data)
+                    self.client.send_message("meat-command", data)
                 else:
                     if self.use_hub:
                         raise Exception("MessageHub not enabled")
@@ -790,16 +1122,26 @@ class SceneManager(StateMachine):
     def on_enter_state(self, event, state):
         srt_time = datetime.now()
         logging.info(f"SceneManager |\n{LoggerUtils.SHR}\n\tScene [{state.id}] from '{event}'\n{LoggerUtils.SHR}")
-        self.model.last_scene_change = datetime.now()
+        # A final scene has no updates, the end prompts of the previous scene are answered before it.
+        if state.final:
+            self._collectEndingBots(wait=True)
+        self.model.last_scene_change = self.model.clock.now()
 
         self.model.scene_params = self.scene_params[state.id]
+        self.scene_path.append(state.id)
+
+        self.model.timers.clear()
+        for name, seconds in self.model.scene_params['timeouts'].items():
+            self.model.timers.arm(name, seconds)
 
         # logging.info(f"SceneManager | Scene callbacks: {self.model.scene_params['internal_callbacks']}")
 
         
         self.model.add_scene_change_to_chat_history(state.id, self.model.scene_params)
+        self._automatic_inputs = None
+        self.notify()
 
-        self._populate_bots()
+        self._populate_bots(state.id)
 
 
         # logging.info(f"SceneManager | Bots: {','.join(self.model.bots.keys())}")
@@ -826,7 +1168,7 @@ class SceneManager(StateMachine):
             raise Exception(f"Unknown callback '{func_name}'")
 
         if self.model.state == "s_FINAL":
-            self.model.end_time = datetime.now()
+            self.model.end_time = self.model.clock.now()
             total_time = self.model.end_time - self.model.start_time
             logging.info(f"SceneManager | Total time: {total_time}")
             logging.info(f"SceneManager | Metrics: {self.model.metrics}")
@@ -835,57 +1177,148 @@ class SceneManager(StateMachine):
                 self.exit_callback()
 
 
-        logging.info(f"Time to enter scene: {datetime.now().__sub__(srt_time).microseconds / 1000} ms")
+        self._prefetchBots(state)
+
+        enter_ms = (datetime.now() - srt_time).total_seconds() * 1000
+        self.scene_enter_ms.append((state.id, enter_ms))
+        logging.info(f"Time to enter scene: {enter_ms:.1f} ms")
+        if self.recorder:
+            self.recorder.record("scene", scene=state.id, enter_ms=enter_ms)
 
 
     def on_exit_state(self, event, state):
         logging.info(f"SceneManager | exiting '{state.id}' state to '{event}'")
         self._stopBots(event)
+        self._releaseBots([bot for bot in self.model.bots.values() if bot not in self._ending_bots])
         self.model.bots = {}
 
         if self.model.state == "s_PREROLL_init":
-            self.model.start_time = datetime.now()
+            self.model.start_time = self.model.clock.now()
+
+
+    def _get_bot_definition(self, character):
+        display_name   = character['display_name']
+        persona_name   = character['persona_name']
+        behavior_name  = character['behavior']
+        few_shots_name = character['few_shots'] if 'few_shots' in character else ""
+        llm_name       = character['llm_name'] if 'llm_name' in character else self.llm_name
+        return (display_name, persona_name, behavior_name, few_shots_name, llm_name)
+
+
+    def _create_bot(self, definition):
+        bot = self.character_pool.acquire(definition)
+        if bot is not None:
+            logging.info(f"Reusing character '{definition[0]}' with persona '{definition[1]}', behavior '{definition[2]}'")
+            return bot
 
+        display_name, persona_name, behavior_name, few_shots_name, llm_name = definition
+        persona        = self.persona_dict[persona_name] if persona_name in self.persona_dict else None
+        few_shots      = self.few_shots_dict[few_shots_name] if few_shots_name in self.few_shots_dict else None
+        logging.info(f"Creating character '{display_name}' with persona '{persona_name}', behavior '{behavior_name}', LLM '{llm_name}'")
+        # logging.debug(f"Persona:\n'{persona}'")
+        # logging.debug(f"Few-shots:\n'{few_shots}'")
 
-    def _populate_bots(self):
+        try:
+            behaviour_yaml = self.behavior_yamls[behavior_name]
+        except KeyError as e:
+            logging.error(f"Behavior '{behavior_name}' not found")
+            raise e
+
+        bot = StateMachineCharacter(
+            self,
+            display_name=display_name,
+            persona_name=persona_name,
+            persona=persona,
+            few_shots=few_shots,
+            llm_name=llm_name,
+            behaviour_name=behavior_name,
+            behaviour_yaml=behaviour_yaml,
+            auto_speak=self.auto_speak,
+            default_overrides=self.default_overrides,
+            events=self.character_pool.get_events(behavior_name, behaviour_yaml, self.default_overrides)
+        )
+        bot.definition = definition
+        return bot
+
+
+    def _releaseBots(self, bots):
+        for bot in bots:
+            self.character_pool.release(bot.definition, bot)
+
+
+    def _cancelPrebuiltBots(self):
+        for future in self._prebuilt_bots.values():
+            self._discardPrebuiltBots(future)
+        self._prebuilt_bots = {}
+
+
+    def _discardPrebuiltBots(self, future):
+        """Release the characters of an unused prebuild to the pool, once it is built."""
+        generation = self.character_pool.generation
+
+        def release(future):
+            if not future.cancelled() and future.exception() is None:
+                for bot in future.result().values():
+                    self.character_pool.release(bot.definition, bot, generation)
+
+        if not future.cancel():
+            future.add_done_callback(release)
+
+
+    def _prefetchBots(self, state):
+        """Build the characters of the scenes the current scene exits to, in the background."""
+        self._cancelPrebuiltBots()
+        if self.prefetch_executor is None:
+            return
+
+        def build(scene):
+            bots = {}
+            for character in self.scene_params[scene]['characters']:
+                definition = self._get_bot_definition(character)
+                bots[definition] = self._create_bot(definition)
+            return bots
+
+        # Only the exits of the scene, not the manual fault transition every scene has.
+        for target in {params['target'] for params in self.transition_index.get(state.id, {}).get("automatic", []) if params['target'] != state.id}:
+            self._prebuilt_bots[target] = self.prefetch_executor.submit(build, target)
+
+
+    def _take_prebuilt_bots(self, scene):
+        future = self._prebuilt_bots.pop(scene, None)
+        if future is None:
+            return {}
+        if not future.done():
+            self._discardPrebuiltBots(future)
+            return {}
+        try:
+            return future.result()
+        except Exception as e:
+            logging.warning(f"SceneManager | Cannot prebuild the characters of '{scene}': {e}")
+            return {}
+
+
+    def _populate_bots(self, scene):
+        prebuilt = self._take_prebuilt_bots(scene)
         for character in self.model.scene_params['characters']:
-            display_name   = character['display_name']
-            persona_name   = character['persona_name']
-            behavior_name  = character['behavior']
-            persona        = self.persona_dict[persona_name] if persona_name in self.persona_dict else None
-            few_shots_name = character['few_shots'] if 'few_shots' in character else ""
-            few_shots      = self.few_shots_dict[few_shots_name] if few_shots_name in self.few_shots_dict else None
-            llm_name       = character['llm_name'] if 'llm_name' in character else self.llm_name
-            logging.info(f"Creating character '{display_name}' with persona '{persona_name}', behavior '{behavior_name}', LLM '{llm_name}'")
-            # logging.debug(f"Persona:\n'{persona}'")
-            # logging.debug(f"Few-shots:\n'{few_shots}'")
+            definition = self._get_bot_definition(character)
+            display_name, persona_name = definition[:2]
 
-            try:
-                behaviour_yaml = self.behavior_yamls[behavior_name]
-            except KeyError as e:
-                logging.error(f"Behavior '{behavior_name}' not found")
-                raise e
-            
             assert persona_name not in self.model.bots, f"Bot '{persona_name}' already defined"
             assert persona_name not in self.model.users, f"User '{persona_name}' already defined"
             assert display_name != "Patient", "Patient is a reserved name"
-            self.model.bots[display_name] = StateMachineCharacter(
-                self,
-                display_name=display_name,
-                persona_name=persona_name,
-                persona=persona,
-                few_shots=few_shots,
-                llm_name=llm_name,
-                behaviour_name=behavior_name,
-                behaviour_yaml=behaviour_yaml,
-                auto_speak=self.auto_speak,
-                default_overrides=self.default_overrides
-            )
+            bot = prebuilt.pop(definition, None)
+            if bot is not None:
+                logging.info(f"Using prebuilt character '{display_name}' with persona '{persona_name}'")
+            else:
+                bot = self._create_bot(definition)
+            self.model.bots[display_name] = bot
 
             self.model.add_bot_instantiation_to_chat_history(self.model.bots[display_name])
             
             self.model.bots[display_name].e_init()
 
+        self._releaseBots(prebuilt.values())
+
 
     def _advanceBots(self):
         logging.debug(f"Advancing bots")
@@ -931,18 +1364,57 @@ class SceneManager(StateMachine):
     def _stopBots(self, event):
         for bot in self.model.bots.values():
             logging.info(f"Stopping bot {bot.display_name}")
+            bot.cancel_response()
+            bot.cancel_speculation()
             # event = "end" if event == "e_automatic" else event
             try:
                 bot.e_stop(scene_event=event)
             except TransitionNotAllowed as e:
                 logging.info(f"SceneManager | no more transitions for {bot.display_name}")
+            # The end prompts still being answered are collected by the next scene.
+            if not bot.collect_response() and bot.is_generating():
+                self._ending_bots.append(bot)
+
+
+    def _speculateBots(self, user_name, text=None):
+        if not self.speculative or user_name not in self.model.users:
+            return
+        user = self.model.users[user_name]
+        for bot in self.model.bots.values():
+            bot.speculate(user.display_name, user.persona_name, text)
+
+
+    def _collectResponses(self):
+        for character in list(self.model.bots.values()) + list(self.model.users.values()):
+            if type(character) == StateMachineCharacter:
+                character.collect_response()
+
+        self._collectEndingBots()
+
+
+    def _collectEndingBots(self, wait=False):
+        """Speak the end responses of the characters of the previous scenes that arrived, and release the characters done speaking."""
+        for bot in list(self._ending_bots):
+            bot.collect_response(wait)
+            if not bot.is_speaking() and not bot.pending_responses():
+                self._ending_bots.remove(bot)
+                self._releaseBots([bot])
+
+
+    def _getBot(self, display_name):
+        """The character speaking as `display_name`, a character of the previous scenes saying its end response first."""
+        for bot in self._ending_bots:
+            if bot.display_name == display_name and bot.data._speaking:
+                return bot
+        return self.model.bots.get(display_name, None)
+
 
     def _on_update(self):
+        self._collectResponses()
         self._process_messages()
 
 
     def set_listening(self, listening):
-        global client
 
         # if not self.use_hub:
         #     # This is only when there use_hub is False. If we use a hub with speech recognition,
@@ -951,13 +1423,14 @@ class SceneManager(StateMachine):
         if self.model.scene_params['force_mute']:
             listening = False
 
-        if any([bot.is_speaking() for bot in self.model.bots.values()]):
+        # Bots generating a response keep listening until they speak.
+        if any([bot.data._speaking for bot in self.model.bots.values()]):
             listening = False
 
         self.model.listening = listening
             
-        if client:
-            client.send_message("av", json.dumps({"av-command": "stt-control", "data": {"listening": listening}}))
+        if self.client:
+            self.client.send_message("av", json.dumps({"av-command": "stt-control", "data": {"listening": listening}}))
             logging.info(f"Set listening to {self.model.listening}")
             # if not self.model.listening:
             #     logging.info(f"Sending think message")
@@ -1007,6 +1480,9 @@ class SceneManager(StateMachine):
                 elif msg.message_data['action'] == "speak":
                     self._speakBots()
 
+                elif msg.message_data['action'] == "speculate":
+                    self._speculateBots(msg.message_data['user'], msg.message_data.get('message', None))
+
                 elif msg.message_data['action'] == "emotion-recognition":
                     # TODO(piotr) Updated self.emotion_user
                     user_emotion = msg.message_data['message']
@@ -1032,12 +1508,93 @@ class SceneManager(StateMachine):
                 raise Exception(f"Unknown command {msg.command}")
 
 
-    def _setup_message_hub(self):
-        global client
-        if client:
-            logging.warning(f"MessageHub already enabled")
+    def _setup_hot_reload(self):
+        # Reloaded files are swapped into per-instance copies, the class level
+        # dictionaries are shared by every SceneManager built from the same script.
+        self.scene_params      = self.scene_params.copy()
+        self.persona_dict      = dict(self.persona_dict)
+        self.behavior_paths    = dict(self.behavior_paths)
+        self.behavior_yamls    = dict(self.behavior_yamls)
+        self.few_shots_dict    = dict(self.few_shots_dict)
+        self.custom_prompts    = dict(self.custom_prompts)
+        self.placeholders      = dict(self.placeholders)
+        self.prompt_compiler   = PromptCompiler(self.placeholders)
+
+        self.script_watcher = ScriptWatcher(self.script_dir)
+        self.script_watcher.start()
+
+
+    def _apply_script_changes(self):
+        changes = self.script_watcher.pop_changes()
+        for change in changes:
+            try:
+                self._apply_script_change(change)
+            except Exception as e:
+                logging.error(f"SceneManager | Cannot apply {change}: {e}")
+
+        # Characters built before the changes would not use them.
+        if changes:
+            self._cancelPrebuiltBots()
+            self.character_pool.clear()
+
+
+    def _apply_script_change(self, change):
+        if change.category == "behaviors":
+            errors = validate_behavior_yaml(change.name, change.data)
+            if errors:
+                for error in errors:
+                    logging.error(f"Invalid behavior {change.path}: {error}")
+                return
+            self.behavior_yamls[change.name] = change.data
+            self.behavior_paths[change.name] = change.path
+
+        elif change.category == "persona":
+            self.persona_dict[change.name] = change.data
+
+        elif change.category == "few-shots":
+            self.few_shots_dict[change.name] = change.data
+
+        elif change.category == "placeholders":
+            self.placeholders["_" + change.name] = change.data
+            self.prompt_compiler.clear()
+
+        elif change.category == "set-prompts":
+            self.custom_prompts[change.data['name']] = change.data
+            self.inferred_values_manager.add_custom_prompt(change.data)
+            self._automatic_dependencies = {}
+
+        elif change.category == "overrides":
+            errors = validate_overrides_yaml(change.name, change.data)
+            if errors:
+                for error in errors:
+                    logging.error(f"Invalid overrides {change.path}: {error}")
+                return
+            self.default_overrides = change.data or {}
+
+        elif change.category == "scenes":
+            scene_name = get_scene_name(change.path)
+            if scene_name not in self.scene_params:
+                logging.warning(f"SceneManager | New scene '{scene_name}' is only loaded on restart")
+                return
+            state_def = get_state_def(
+                change.path,
+                change.data,
+                list(self.behavior_yamls.keys()),
+                list(self.persona_dict.keys()),
+                list(self.few_shots_dict.keys())
+            )
+            self.scene_params[scene_name] = get_scene_params(state_def)
+            logging.info(f"SceneManager | Changes to the exits of '{scene_name}' are only applied on restart")
+
         else:
-            client = MessageHubClient("http://127.0.0.1:8005")
+            logging.warning(f"SceneManager | {change} can only be applied on restart")
+            return
+
+        logging.info(f"SceneManager | Reloaded {change}")
+
+
+    def _setup_message_hub(self):
+        self.client = self.hub_client or get_hub_client(self.hub_url)
 
         def on_words_in(channel, data):
             logging.info(f"Received words-in message: {data}")
@@ -1046,7 +1603,18 @@ class SceneManager(StateMachine):
                 name = data["entity"]
                 text = data["text"]
 
-                if name == "user":
+                if name == "user" and data.get("partial", False):
+                    # Partial transcript while the user is still speaking.
+                    if self.speculative:
+                        self.msg_in.put(MessageIn({
+                            "command": MessageIn.CMD.EVENT,
+                            "data": {
+                                "action": "speculate",
+                                "user": "Patient",
+                                "message": text
+                            }
+                        }))
+                elif name == "user":
                     self.msg_in.put(MessageIn({
                         "command": MessageIn.CMD.MESSAGE,
                         "data": {
@@ -1094,9 +1662,11 @@ class SceneManager(StateMachine):
                 elif name == "stt-enabled":
                     logging.info("stt-enabled")
                     self.model.listening = True
+                    self.notify()
                 elif name == "stt-disabled":
                     logging.info("stt-disabled")
                     self.model.listening = False
+                    self.notify()
                 else:
                     pass
                     # logging.warning(f"Unknown av-command '{name}'")
@@ -1125,9 +1695,9 @@ class SceneManager(StateMachine):
 
         if self.use_hub:
             logging.info(f"Setting up callbacks")
-            client.set_callback("words-in", on_words_in)
-            client.set_callback("av", on_av)
-            client.set_callback("typeform", on_typeform)
+            self.client.set_callback("words-in", self._recorded_hub_callback(on_words_in))
+            self.client.set_callback("av", self._recorded_hub_callback(on_av))
+            self.client.set_callback("typeform", self._recorded_hub_callback(on_typeform))
 
 
         if self.wait_for_speak_callback:
@@ -1135,7 +1705,15 @@ class SceneManager(StateMachine):
             pass
 
         
-        client.send_message("av", json.dumps({"av-command": "stt-control", "data": {"listening": False}}))
+        self.client.send_message("av", json.dumps({"av-command": "stt-control", "data": {"listening": False}}))
+
+    def _recorded_hub_callback(self, func):
+        # Replays call the hub callbacks with the recorded messages.
+        def callback(channel, data):
+            if self.recorder:
+                self.recorder.record("hub", channel=channel, data=data)
+            func(channel, data)
+        return callback
 
     def _get_pretty_chat_history(self):
         messages = []
@@ -0,0 +1,223 @@
+import copy
+import json
+import keyword
+import logging
+import re
+from collections import defaultdict, deque
+from pathlib import Path
+
+from state_machine.prompt_template import PLACEHOLDER_EXPR
+from state_machine.scene_loader import SCENE_NAME_EXPR, get_state_def, load_scenes
+from state_machine.script_bundle import compile_script
+from state_machine.timers import get_scene_timeouts
+
+
+INDEX_FILE_NAME = ".transition_index.json"
+INITIAL_SCENE   = "s_PREROLL_init"
+FAULT_SCENE     = "s_unknown_fault"
+
+# Placeholders filled in by `SceneManagerData.replace_placeholders` and `Character.replace_placeholders`.
+BUILTIN_PLACEHOLDERS = [
+    "_DATE", "_TIME", "_CHAT_HISTORY", "_CHAT_HISTORY_LAST", "_EMOTION_USER",
+    "_ISSUE", "_HALLUCINATION", "_HALLUCINATION_DEEPFAKE",
+    "_PERSONA", "_FEW_SHOTS", "_EMOTION_ELIZA",
+]
+
+CONDITION_NAME_EXPR = re.compile(r'[A-Za-z_][A-Za-z_0-9]*')
+
+
+def build_transition_index(transition_defs, automatic_defs):
+    """Map each source scene to its ordered automatic conditions and its manual events."""
+    index = defaultdict(lambda: {"automatic": [], "manual": []})
+    for params in automatic_defs:
+        index[params['source']]["automatic"].append({
+            "condition": params['condition'],
+            "target"   : params['target']
+        })
+    for event, params_list in transition_defs.items():
+        for params in params_list:
+            if event not in index[params['source']]["manual"]:
+                index[params['source']]["manual"].append(event)
+    return dict(index)
+
+
+def save_transition_index(path, index, fingerprint, start_scene=None, default_condition=None):
+    with open(path, "w") as f:
+        json.dump({
+            "fingerprint"      : fingerprint,
+            "start_scene"      : start_scene,
+            "default_condition": default_condition,
+            "transitions"      : index
+        }, f, indent=1)
+
+
+def load_transition_index(path, fingerprint, start_scene=None, default_condition=None):
+    """Load a transition index, or return `None` if it was built for other script files or options."""
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Cannot read transition index {path}: {e}")
+        return None
+
+    if (data.get("fingerprint")       != fingerprint or
+        data.get("start_scene")       != start_scene or
+        data.get("default_condition") != default_condition):
+        return None
+    return data["transitions"]
+
+
+def get_known_conditions(custom_prompts):
+    from state_machine.scenemanager import SceneManager, SceneManagerData
+    return set(dir(SceneManagerData)) | set(dir(SceneManager)) | set(custom_prompts)
+
+
+def get_condition_names(condition):
+    names = CONDITION_NAME_EXPR.findall(condition)
+    return [name for name in names if not keyword.iskeyword(name)]
+
+
+def find_placeholders(obj):
+    """All placeholders found in the strings of a parsed script file."""
+    if isinstance(obj, str):
+        return set(PLACEHOLDER_EXPR.findall(obj))
+    if isinstance(obj, dict):
+        obj = list(obj.values())
+    if isinstance(obj, list):
+        return set().union(*[find_placeholders(o) for o in obj])
+    return set()
+
+
+def get_reachable(start, edges):
+    reachable, queue = set(), deque([start])
+    while queue:
+        scene_name = queue.popleft()
+        if scene_name in reachable:
+            continue
+        reachable.add(scene_name)
+        queue.extend(edges.get(scene_name, []))
+    return reachable
+
+
+def analyze_script(script_dir, typeform_path="output/typeform.json"):
+    """Check a script directory without running it.
+
+    Returns the report and the transition index of the full script, the index is
+    `None` when the scene graph is invalid.
+    """
+    bundle = compile_script(script_dir)
+
+    behaviors    = bundle.data("behaviors")
+    personas     = bundle.data("persona")
+    few_shots    = bundle.data("few-shots")
+    set_prompts  = { data['name'] : data for data in bundle.data("set-prompts").values()}
+    fake_texts   = bundle.data("fake_texts").get("static_fake_texts", {})
+    placeholders = { "_" + name : text for name, text in bundle.data("placeholders").items()}
+
+    scenes = {}
+    for path, data in bundle.get("scenes").values():
+        match = SCENE_NAME_EXPR.match(path.stem)
+        if match:
+            scenes[match.group(2)] = (path, data)
+
+    report = {
+        "script_dir"            : Path(script_dir).as_posix(),
+        "fingerprint"           : bundle.fingerprint(),
+        "scenes"                : len(scenes),
+        "file_errors"           : bundle.errors,
+        "scene_errors"          : {},
+        "invalid_targets"       : [],
+        "unknown_conditions"    : defaultdict(list),
+        "undefined_placeholders": defaultdict(list),
+    }
+
+    # Scene graph
+    edges   = {}
+    used_behaviors, used_personas, used_few_shots = set(), set(), set()
+    known_conditions = get_known_conditions(set_prompts)
+    for scene_name, (path, data) in scenes.items():
+        exits = data.get('exits', None) or []
+        edges[scene_name] = [exit['target'] for exit in exits]
+
+        try:
+            timeouts = get_scene_timeouts(data['scene'], exits)
+        except ValueError as e:
+            report["scene_errors"][scene_name] = str(e)
+            timeouts = {}
+
+        for exit in exits:
+            if exit['target'] not in scenes:
+                report["invalid_targets"].append({"scene": scene_name, "target": exit['target']})
+            for name in get_condition_names(exit['condition'] or ""):
+                if name not in known_conditions and name not in timeouts:
+                    report["unknown_conditions"][name].append(scene_name)
+
+        for character in data.get('characters', None) or []:
+            used_behaviors.add(character.get('behavior'))
+            used_personas.add(character.get('persona_name'))
+            used_few_shots.add(character.get('few_shots'))
+
+        try:
+            get_state_def(path, copy.deepcopy(data), list(behaviors), list(personas), list(few_shots))
+        except Exception as e:
+            report["scene_errors"][scene_name] = str(e)
+
+    final_scenes = [name for name, (_, data) in scenes.items() if data['scene'].get('final', False)]
+    # Every scene but the first and last ones can be sent to the fault scene by the operator.
+    fault_edges  = { name : [FAULT_SCENE] for name in scenes if name not in [INITIAL_SCENE, FAULT_SCENE, "s_FINAL"]}
+    reachable    = get_reachable(INITIAL_SCENE, { name : edges[name] + fault_edges.get(name, []) for name in scenes})
+    reversed_edges = defaultdict(list)
+    for source, targets in edges.items():
+        for target in targets:
+            reversed_edges[target].append(source)
+    can_finish = set().union(*[get_reachable(name, reversed_edges) for name in final_scenes])
+
+    report["reachable"]       = sorted(reachable & scenes.keys())
+    report["unreachable"]     = sorted(scenes.keys() - reachable)
+    report["dead_ends"]       = sorted((scenes.keys() & reachable) - can_finish)
+    report["unused_behaviors"] = sorted(behaviors.keys() - used_behaviors)
+    report["unused_personas"]  = sorted(personas.keys() - used_personas)
+    report["unused_few_shots"] = sorted(few_shots.keys() - used_few_shots)
+
+    # Placeholders
+    known_placeholders = set(BUILTIN_PLACEHOLDERS) | placeholders.keys() | { "_" + key for key in fake_texts.keys()}
+    try:
+        with open(typeform_path) as f:
+            known_placeholders |= { v[1] for v in json.load(f).values()}
+    except (OSError, ValueError):
+        pass
+
+    for category in ["behaviors", "set-prompts", "placeholders", "persona", "few-shots", "overrides"]:
+        for name, (path, data) in bundle.get(category).items():
+            for placeholder in sorted(find_placeholders(data) - known_placeholders):
+                report["undefined_placeholders"][placeholder].append(f"{category}/{path.name}")
+
+    report["unknown_conditions"]     = dict(report["unknown_conditions"])
+    report["undefined_placeholders"] = dict(report["undefined_placeholders"])
+
+    # Transition index
+    index = None
+    if not report["invalid_targets"] and INITIAL_SCENE in scenes:
+        _, transition_defs, automatic_defs = load_scenes(
+            script_dir,
+            None,
+            list(behaviors),
+            list(personas),
+            list(few_shots),
+            scene_files={ path : copy.deepcopy(data) for path, data in scenes.values()},
+            topology_only=True
+        )
+        index = build_transition_index(transition_defs, automatic_defs)
+
+    return report, index
+
+
+# Report entries that make the scene manager fail, the others are only logged at runtime.
+REPORT_ERRORS   = ["file_errors", "scene_errors", "invalid_targets", "unknown_conditions"]
+REPORT_WARNINGS = ["unreachable", "dead_ends", "undefined_placeholders"]
+
+
+def has_errors(report):
+    return any(report[key] for key in REPORT_ERRORS)
@@ -0,0 +1,214 @@
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+from pathlib import Path
+
+from state_machine.helpers import LoggerUtils
+from state_machine.yaml_loader import parse_yaml_contents
+
+
+BUNDLE_VERSION   = 3
+BUNDLE_FILE_NAME = ".script_bundle.pickle"
+
+# Category -> (sub-directory, glob pattern, file kind)
+SCRIPT_SOURCES = {
+    "behaviors"   : ("behaviors",    "*.yaml",                  "yaml"),
+    "persona"     : ("persona",      "*.txt",                   "text"),
+    "few-shots"   : ("few-shots",    "*.txt",                   "text"),
+    "set-prompts" : ("set-prompts",  "prompt_*.yaml",           "yaml"),
+    "placeholders": ("placeholders", "*.txt",                   "text"),
+    "fake_texts"  : ("fake_texts",   "static_fake_texts.json",  "json"),
+    "overrides"   : ("overrides",    "default_overrides.yaml",  "yaml"),
+    "scenes"      : ("scenes",       "*.yaml",                  "yaml"),
+}
+
+
+def hash_content(content: bytes) -> str:
+    return hashlib.sha1(content).hexdigest()
+
+
+def get_validator_version(validator):
+    """Hash of the source of the module defining `validator`.
+
+    Cached verdicts are only used with the validator version that gave them,
+    so that a change of the validators (e.g. the behavior schema) is applied
+    to every file, not only to the files that changed.
+    """
+    module = inspect.getmodule(validator)
+    try:
+        source = inspect.getsource(module or validator)
+    except (OSError, TypeError):
+        source = getattr(validator, "__qualname__", repr(validator))
+    return hash_content(source.encode("utf-8"))
+
+
+def parse_content(path, kind, content: bytes):
+    if kind == "yaml":
+        return parse_yaml_contents({path: content})[path]
+
+    text = content.decode("utf-8")
+    if kind == "json":
+        return json.loads(text)
+    else:
+        return text
+
+
+class ScriptBundle:
+    """Parsed and validated contents of a script directory.
+
+    Every file is stored with its content hash, so that a bundle loaded from
+    disk only re-parses (and re-validates) the files that changed since it was
+    compiled.
+    """
+
+    def __init__(self, script_dir, bundle_path=None):
+        self.script_dir  = Path(script_dir)
+        self.bundle_path = Path(bundle_path) if bundle_path else Path(script_dir, BUNDLE_FILE_NAME)
+        self.entries     = {}
+        self.reparsed    = []
+        self.errors      = {}
+
+
+    def _read_cache(self):
+        try:
+            with open(self.bundle_path, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("version") != BUNDLE_VERSION:
+                logging.info(f"Script bundle version changed, recompiling '{self.script_dir}'")
+                return {}
+            return cached["entries"]
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f"Cannot read script bundle {self.bundle_path}: {e}")
+            return {}
+
+
+    def _write_cache(self):
+        # Written aside and renamed, other processes may be reading the bundle.
+        tmp_path = Path(f"{self.bundle_path}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"version": BUNDLE_VERSION, "entries": self.entries}, f)
+            os.replace(tmp_path, self.bundle_path)
+        except OSError as e:
+            logging.warning(f"Cannot write script bundle {self.bundle_path}: {e}")
+
+
+    def _candidates(self):
+        for category, (sub_dir, pattern, kind) in SCRIPT_SOURCES.items():
+            for path in sorted(Path(self.script_dir, sub_dir).glob(pattern)):
+                yield category, kind, path
+
+
+    def compile(self, validators=None, use_cache=True):
+        """Load the script directory, re-parsing only files whose content changed.
+
+        `validators` maps a category to a callable `(name, data)` returning the
+        list of errors found in the data. Validation only runs for re-parsed
+        files, the verdict of unchanged files is taken from the cache if it was
+        given by the same version of the validator. Errors are collected in
+        `self.errors`.
+        """
+        validators = validators or {}
+        versions   = {category: get_validator_version(validator) for category, validator in validators.items()}
+        cached     = self._read_cache() if use_cache else {}
+
+        self.entries  = {}
+        self.reparsed = []
+        self.errors   = {}
+        changed = []
+        for category, kind, path in self._candidates():
+            key  = path.relative_to(self.script_dir).as_posix()
+            stat = path.stat()
+            entry = cached.get(key)
+            content = None
+
+            if entry and not (entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size):
+                with open(path, "rb") as f:
+                    content = f.read()
+                if entry["hash"] == hash_content(content):
+                    entry["mtime"] = stat.st_mtime_ns
+                else:
+                    entry = None
+
+            if entry:
+                if category in validators and (entry["errors"] is None or entry.get("validator") != versions[category]):
+                    entry["errors"]    = validators[category](path.stem, entry["data"])
+                    entry["validator"] = versions[category]
+                    self.reparsed.append(key)
+                self.entries[key] = entry
+                if entry["errors"]:
+                    self.errors[key] = entry["errors"]
+                continue
+
+            if content is None:
+                with open(path, "rb") as f:
+                    content = f.read()
+            changed.append((key, category, kind, path, stat, content))
+
+        # YAML is the bulk of the parsing work, parse all changed YAML files in one batch.
+        parsed_yaml = parse_yaml_contents({ path: content for _, _, kind, path, _, content in changed if kind == "yaml"})
+
+        for key, category, kind, path, stat, content in changed:
+            data = parsed_yaml[path] if kind == "yaml" else parse_content(path, kind, content)
+            errors = validators[category](path.stem, data) if category in validators else None
+            if errors:
+                self.errors[key] = errors
+
+            self.entries[key] = {
+                "category" : category,
+                "hash"     : hash_content(content),
+                "mtime"    : stat.st_mtime_ns,
+                "size"     : stat.st_size,
+                "data"     : data,
+                "errors"   : errors,
+                "validator": versions.get(category, None),
+            }
+            self.reparsed.append(key)
+
+        if self.reparsed or set(cached.keys()) != set(self.entries.keys()):
+            self._write_cache()
+
+        logging.info(f"Compiled script bundle '{self.script_dir}': {len(self.entries)} files, {len(self.reparsed)} re-parsed\n{LoggerUtils.HR}")
+        return self
+
+
+    def get(self, category):
+        """Return `{stem: (path, data)}` for every file of a category."""
+        return {
+            Path(key).stem: (Path(self.script_dir, key), entry["data"])
+            for key, entry in self.entries.items() if entry["category"] == category
+        }
+
+
+    def data(self, category):
+        return {name: data for name, (_, data) in self.get(category).items()}
+
+
+    def fingerprint(self):
+        """Hash of all file hashes, changes whenever any script file changes."""
+        digest = hashlib.sha1()
+        for key in sorted(self.entries.keys()):
+            digest.update(key.encode("utf-8"))
+            digest.update(self.entries[key]["hash"].encode("utf-8"))
+        return digest.hexdigest()
+
+
+
+def compile_script(script_dir, validators=None, use_cache=True):
+    return ScriptBundle(script_dir).compile(validators, use_cache)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Compile a script directory into a bundle')
+    parser.add_argument('script_dir', type=Path, help='Path to the script directory')
+    parser.add_argument('--force', action='store_true', help='Ignore the existing bundle')
+    args = parser.parse_args()
+
+    logging.basicConfig(level="INFO")
+    compile_script(args.script_dir, use_cache=not args.force)
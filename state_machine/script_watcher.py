@@ -0,0 +1,83 @@
+import logging
+import queue
+import threading
+from pathlib import Path
+
+from state_machine.helpers import get_log_session, set_log_session
+from state_machine.script_bundle import SCRIPT_SOURCES, parse_content
+
+
+class ScriptChange:
+    def __init__(self, category, name, path, data):
+        self.category = category
+        self.name     = name
+        self.path     = path
+        self.data     = data
+
+    def __str__(self):
+        return f"ScriptChange: {self.category}/{self.name} ({self.path})"
+
+
+
+class ScriptWatcher(threading.Thread):
+    """Poll a script directory and re-parse the files that change.
+
+    Parsed files are queued as `ScriptChange`s, the owner applies them with
+    `pop_changes()` at a safe point (between two `SceneManager.update()` frames).
+    """
+
+    def __init__(self, script_dir, interval=1.0):
+        super().__init__(daemon=True)
+        self.script_dir = Path(script_dir)
+        self.interval   = interval
+        self.changes    = queue.Queue()
+
+        self._stop_event  = threading.Event()
+        self._mtimes      = self._scan()
+        self._log_session = get_log_session()
+
+
+    def _scan(self):
+        mtimes = {}
+        for category, (sub_dir, pattern, kind) in SCRIPT_SOURCES.items():
+            for path in Path(self.script_dir, sub_dir).glob(pattern):
+                try:
+                    mtimes[path] = (category, kind, path.stat().st_mtime_ns)
+                except FileNotFoundError:
+                    pass
+        return mtimes
+
+
+    def run(self):
+        set_log_session(self._log_session)
+        logging.info(f"Watching script directory '{self.script_dir}'")
+        while not self._stop_event.wait(self.interval):
+            mtimes = self._scan()
+            for path, (category, kind, mtime) in mtimes.items():
+                previous = self._mtimes.get(path)
+                if previous and previous[2] == mtime:
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        data = parse_content(path, kind, f.read())
+                except Exception as e:
+                    logging.error(f"Cannot reload '{path}': {e}")
+                    continue
+                logging.info(f"Script file changed: '{path}'")
+                self.changes.put(ScriptChange(category, path.stem, path, data))
+
+            for path in self._mtimes.keys() - mtimes.keys():
+                logging.warning(f"Script file removed: '{path}', it stays loaded until restart")
+
+            self._mtimes = mtimes
+
+
+    def pop_changes(self):
+        changes = []
+        while not self.changes.empty():
+            changes.append(self.changes.get())
+        return changes
+
+
+    def stop(self):
+        self._stop_event.set()
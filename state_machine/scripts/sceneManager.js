@@ -723,10 +723,12 @@ class SceneManager {
         this.socketAddress = apiBaseUrl;
         this.apiBaseUrl   = apiBaseUrl;
         this.apiPhotoUrl  = "http://127.0.0.1:8025";
+        // Session of the scene manager, e.g. `/?session=booth-2`.
+        this.session      = new URLSearchParams(location.search).get('session') || 'default';
 
         this.status = new Status();
 
-        this.socket = io.connect(this.socketAddress);
+        this.socket = io.connect(this.socketAddress, { query: { session: this.session } });
         this.socket.on('connect', this.onConnect.bind(this));
         this.socket.on('stream-status', this.onStatus.bind(this));
 
@@ -746,9 +748,13 @@ class SceneManager {
         this.status.update(status);
     }
 
+    apiUrl(path) {
+        return `${this.apiBaseUrl}${path}?session=${encodeURIComponent(this.session)}`;
+    }
+
     async fetchStatus() {
         try {
-            const response = await fetch(`${this.apiBaseUrl}/status`);
+            const response = await fetch(this.apiUrl('/status'));
             const data     = await response.json();
             this.updateStatus(data);
         } catch (error) {
@@ -759,7 +765,7 @@ class SceneManager {
 
     async sendRestart() {
         try {
-            const response     = await fetch(`${this.apiBaseUrl}/restart`);
+            const response     = await fetch(this.apiUrl('/restart'));
             const responseData = await response.json();
             this.updateStatus(responseData);
         } catch (error) {
@@ -770,7 +776,7 @@ class SceneManager {
 
     async sendEvent(action, data = {}) {
         try {
-            const response = await fetch(`${this.apiBaseUrl}/message`, {
+            const response = await fetch(this.apiUrl('/message'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -801,7 +807,7 @@ class SceneManager {
 
     async sendMessage(username, message) {
         try {
-            const response = await fetch(`${this.apiBaseUrl}/message`, {
+            const response = await fetch(this.apiUrl('/message'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
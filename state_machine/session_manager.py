@@ -0,0 +1,153 @@
+import logging
+import re
+import threading
+import uuid
+from pathlib import Path
+
+from state_machine.helpers import LoggerUtils
+
+
+DEFAULT_SESSION = "default"
+
+# Session ids are also the names of their output directories.
+SESSION_ID_EXPR = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_valid_session_id(session_id):
+    return isinstance(session_id, str) and SESSION_ID_EXPR.fullmatch(session_id) is not None
+
+
+class SessionManager:
+    """Scene managers of the sessions hosted by the process, each running in its own thread.
+
+    The sessions share the compiled script (see `get_scene_manager`), the LLM
+    clients and the emotion model. The output of a session other than the
+    default one is written in `<output_root>/<session_id>`. A session is built
+    without holding the lock, so that the requests of the other sessions are
+    not blocked while the script is compiled.
+    """
+
+    def __init__(self, thread_factory, output_root, max_sessions=16):
+        self.thread_factory = thread_factory
+        self.output_root    = Path(output_root)
+        self.max_sessions   = max_sessions
+        self.sessions       = {}
+        # Sessions being built, their id is taken but they are not in `sessions` yet.
+        self._pending       = set()
+        self._lock          = threading.RLock()
+        self._published     = threading.Condition(self._lock)
+
+
+    def _reserve(self, session_id, replace=False):
+        """Take the id of a new session, called with the lock held. Returns the session it replaces.
+
+        Raises `ValueError` if the id cannot be taken.
+        """
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session id '{session_id}'")
+        if session_id in self._pending:
+            raise ValueError(f"Session '{session_id}' is being created")
+        if session_id in self.sessions and not replace:
+            raise ValueError(f"Session '{session_id}' already exists")
+        if session_id not in self.sessions and len(self.sessions) + len(self._pending) >= self.max_sessions:
+            raise ValueError(f"Too many sessions ({self.max_sessions})")
+        self._pending.add(session_id)
+        return self.sessions.pop(session_id, None)
+
+
+    def _release(self, session_id, sm_thread=None):
+        """Publish the thread of a reserved session, or give its id back without one."""
+        with self._lock:
+            self._pending.discard(session_id)
+            if sm_thread is not None:
+                self.sessions[session_id] = sm_thread
+            self._published.notify_all()
+
+
+    def _start(self, session_id, kwargs):
+        """Build the scene manager of a reserved session without holding the lock, then publish and start it."""
+        try:
+            if session_id != DEFAULT_SESSION:
+                kwargs['output_root'] = Path(self.output_root, session_id)
+                kwargs['output_root'].mkdir(parents=True, exist_ok=True)
+
+            logging.info(f"Creating session '{session_id}'\n{LoggerUtils.HR}")
+            sm_thread = self.thread_factory(session_id, **kwargs)
+            sm_thread.session_id     = session_id
+            sm_thread.session_kwargs = kwargs
+        except BaseException:
+            self._release(session_id)
+            raise
+
+        self._release(session_id, sm_thread)
+        sm_thread.start()
+        return sm_thread
+
+
+    def create(self, session_id=None, **kwargs):
+        """Start a session, `kwargs` override the options of the scene manager (e.g. `hub_url`)."""
+        session_id = session_id or uuid.uuid4().hex[:8]
+        with self._lock:
+            self._reserve(session_id)
+        self._start(session_id, kwargs)
+        return session_id
+
+
+    def get(self, session_id=DEFAULT_SESSION, create=True):
+        """The thread of a session, the default session is started on first use."""
+        with self._lock:
+            while session_id in self._pending:
+                self._published.wait()
+            sm_thread = self.sessions.get(session_id, None)
+            start = sm_thread is None and create and session_id == DEFAULT_SESSION
+            if start:
+                self._reserve(session_id)
+        if start:
+            sm_thread = self._start(session_id, {})
+        if sm_thread is None:
+            raise KeyError(f"Unknown session '{session_id}'")
+        return sm_thread
+
+
+    def stop(self, session_id):
+        with self._lock:
+            sm_thread = self.sessions.pop(session_id, None)
+        if sm_thread is None:
+            raise KeyError(f"Unknown session '{session_id}'")
+        self._stop(session_id, sm_thread)
+        return sm_thread
+
+
+    def _stop(self, session_id, sm_thread):
+        logging.info(f"Stopping session '{session_id}'")
+        sm_thread.stop()
+        sm_thread.join()
+
+
+    def restart(self, session_id=DEFAULT_SESSION):
+        with self._lock:
+            sm_thread = self._reserve(session_id, replace=True)
+        if sm_thread is not None:
+            try:
+                self._stop(session_id, sm_thread)
+            except BaseException:
+                self._release(session_id)
+                raise
+        self._start(session_id, sm_thread.session_kwargs if sm_thread is not None else {})
+        return session_id
+
+
+    def stop_all(self):
+        for session_id in list(self.sessions.keys()):
+            self.stop(session_id)
+
+
+    def json(self):
+        with self._lock:
+            return {
+                session_id: {
+                    "state"      : sm_thread.sm.current_state.id,
+                    "running"    : sm_thread._running,
+                    "output-path": sm_thread.sm.output_path,
+                } for session_id, sm_thread in self.sessions.items()
+            }
@@ -0,0 +1,135 @@
+import logging
+import statistics
+import time
+from collections import Counter
+from pathlib import Path
+
+from llms import llm
+from state_machine import scenemanager
+from state_machine.helpers import LoggerUtils
+
+
+LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s [%(filename)s:%(lineno)s]'
+
+
+class ErrorCollector(logging.Handler):
+    """Keep the error messages logged during a simulation."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.errors = []
+
+    def emit(self, record):
+        self.errors.append(record.getMessage())
+
+
+def get_latency_stats(seconds):
+    if not seconds:
+        return {"calls": 0}
+    seconds = sorted(seconds)
+    return {
+        "calls" : len(seconds),
+        "mean"  : statistics.mean(seconds),
+        "median": statistics.median(seconds),
+        "p95"   : seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))],
+        "max"   : seconds[-1],
+    }
+
+
+def run_simulation(output_path, user_behaviour, persona_name, user_name="Patient", llm_name=None, few_shots='', max_duration=1800, **kwargs):
+    """Run a simulation without the web interface, until the final scene or `max_duration` seconds.
+
+    `kwargs` are passed to `get_scene_manager` (`script_dir`, `start_scene`, ...).
+    Returns the report of the run: status, duration, scene path, LLM latencies and errors.
+    """
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    collector = ErrorCollector()
+    logging.getLogger().addHandler(collector)
+
+    report = {
+        "user_behaviour": user_behaviour,
+        "persona_name"  : persona_name,
+        "output_path"   : output_path.as_posix(),
+        "status"        : "error",
+        "duration"      : 0.0,
+        "frames"        : 0,
+        "scene_path"    : [],
+        "llm"           : get_latency_stats([]),
+        "llm_errors"    : 0,
+        "errors"        : collector.errors,
+    }
+
+    srt_time = time.monotonic()
+    sm = None
+    try:
+        llm_name = llm_name or llm.LLM.default_name()
+        kwargs.update({
+            "use_hub"                : False,
+            "wait_for_speak_callback": False,
+            "auto_speak"             : True,
+            "mode"                   : "simulation",
+            "llm_name"               : llm_name,
+        })
+        logging.info(f"Running headless simulation\n{LoggerUtils.pretty_format_args(kwargs)}\n{LoggerUtils.HR}")
+
+        model = scenemanager.SceneManagerData()
+        sm = scenemanager.get_scene_manager(model, output_path=output_path, **kwargs)
+        sm.add_bot_user(user_name, persona_name, user_behaviour, llm_name, few_shots)
+
+        # Same loop as `SMThread.run`, without the frame rate limit.
+        deadline = srt_time + max_duration
+        while not sm.current_state.final:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logging.warning(f"Simulation timed out in '{sm.current_state.id}' after {max_duration}s")
+                break
+            sm.wakeup_event.wait(min(sm.get_wakeup_timeout(), remaining))
+            sm.wakeup_event.clear()
+            sm.update()
+
+        report["status"] = "complete" if sm.current_state.final else "timeout"
+
+    except Exception as e:
+        logging.exception(f"Simulation failed: {e}")
+
+    finally:
+        report["duration"] = time.monotonic() - srt_time
+        if sm is not None:
+            sm.close()
+            report["frames"]     = sm.model.frames
+            report["scene_path"] = list(sm.scene_path)
+            report["llm"]        = get_latency_stats([call["seconds"] for call in sm.llm_calls if call["error"] is None])
+            report["llm_errors"] = sum(1 for call in sm.llm_calls if call["error"] is not None)
+        logging.getLogger().removeHandler(collector)
+
+    return report
+
+
+def summarize_simulations(reports):
+    """Aggregate the reports of `run_simulation`."""
+    durations = [report["duration"] for report in reports if report["status"] == "complete"]
+    paths     = Counter(" > ".join(report["scene_path"]) for report in reports if report["scene_path"])
+    scenes    = Counter(scene for report in reports for scene in report["scene_path"])
+
+    # Latencies of all runs, weighted by their number of calls.
+    calls = sum(report["llm"]["calls"] for report in reports)
+    return {
+        "runs"      : len(reports),
+        "status"    : dict(Counter(report["status"] for report in reports)),
+        "duration"  : {
+            "mean": statistics.mean(durations) if durations else None,
+            "min" : min(durations) if durations else None,
+            "max" : max(durations) if durations else None,
+        },
+        "llm"       : {
+            "calls" : calls,
+            "errors": sum(report["llm_errors"] for report in reports),
+            "mean"  : sum(report["llm"]["mean"] * report["llm"]["calls"] for report in reports if report["llm"]["calls"]) / calls if calls else None,
+            "max"   : max((report["llm"]["max"] for report in reports if report["llm"]["calls"]), default=None),
+        },
+        "errors"    : sum(len(report["errors"]) for report in reports),
+        "scene_paths": dict(paths.most_common()),
+        "scene_visits": dict(scenes.most_common()),
+    }
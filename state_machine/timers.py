@@ -0,0 +1,111 @@
+import heapq
+import re
+import threading
+
+from .clock import Clock
+
+
+# Timeout conditions of `SceneManagerData` and their duration in seconds.
+TIMEOUT_CONDITIONS = {
+    "tiny_timeout"   : 1,
+    "timeout_2"      : 2,
+    "timeout_3"      : 3,
+    "timeout_preroll": 7,
+    "timeout_exit"   : 10,
+    "short_timeout"  : 30,
+    "long_timeout"   : 45,
+}
+
+# `timeout_<N>` conditions, with N in seconds.
+TIMEOUT_NAME_EXPR = re.compile(r'\btimeout_(\d+)\b')
+CONDITION_NAME_EXPR = re.compile(r'[A-Za-z_][A-Za-z_0-9]*')
+
+
+def get_scene_timeouts(scene, exits):
+    """Timeouts used by the exit conditions of a scene, `{name: seconds}`.
+
+    Durations come from the `timeouts` mapping of the scene, then from
+    `TIMEOUT_CONDITIONS`, then from the `timeout_<N>` name.
+    """
+    declared = scene.get('timeouts', None) or {}
+    for name, seconds in declared.items():
+        if not isinstance(seconds, (int, float)) or seconds < 0:
+            raise ValueError(f"Invalid timeout '{name}': {seconds}")
+
+    timeouts = {}
+    for exit in exits or []:
+        for name in CONDITION_NAME_EXPR.findall(exit.get('condition', None) or ""):
+            if name in declared:
+                timeouts[name] = declared[name]
+            elif name in TIMEOUT_CONDITIONS:
+                timeouts[name] = TIMEOUT_CONDITIONS[name]
+            elif TIMEOUT_NAME_EXPR.fullmatch(name):
+                timeouts[name] = int(TIMEOUT_NAME_EXPR.fullmatch(name).group(1))
+    return timeouts
+
+
+
+class TimerWheel:
+    """Named deadlines kept in a heap.
+
+    `advance()` is called once per frame and marks the timers whose deadline
+    passed as fired, conditions then only check `expired(name)`.
+    `next_deadline()` tells the update thread how long it can sleep.
+    """
+
+    def __init__(self, clock=None):
+        self.clock      = clock or Clock()
+        self._heap      = []
+        self._deadlines = {}
+        self._fired     = set()
+        self._lock      = threading.Lock()
+        # Incremented whenever `expired()` can return a different value.
+        self.version    = 0
+
+
+    def arm(self, name, seconds, now=None):
+        now = self.clock.monotonic() if now is None else now
+        with self._lock:
+            deadline = now + seconds
+            self._deadlines[name] = deadline
+            self._fired.discard(name)
+            heapq.heappush(self._heap, (deadline, name))
+            self.version += 1
+
+
+    def clear(self):
+        with self._lock:
+            self._heap      = []
+            self._deadlines = {}
+            self._fired     = set()
+            self.version   += 1
+
+
+    def advance(self, now=None):
+        """Fire the timers whose deadline passed, returning their names."""
+        now = self.clock.monotonic() if now is None else now
+        fired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, name = heapq.heappop(self._heap)
+                # Skip the entries of timers re-armed since they were pushed.
+                if self._deadlines.get(name, None) == deadline:
+                    self._fired.add(name)
+                    fired.append(name)
+                    self.version += 1
+        return fired
+
+
+    def is_armed(self, name):
+        return name in self._deadlines
+
+
+    def expired(self, name):
+        return name in self._fired
+
+
+    def next_deadline(self):
+        with self._lock:
+            while self._heap and self._deadlines.get(self._heap[0][1], None) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
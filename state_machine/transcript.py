@@ -0,0 +1,113 @@
+import logging
+import threading
+
+from .chat_history import TRANSCRIPT_FOOTER, TRANSCRIPT_HEADER
+
+
+# Rough token count of a text, without loading the tokenizer of each LLM.
+CHARS_PER_TOKEN = 4
+
+SUMMARY_HEADER = '--- Summary of the earlier conversation ---\n\n'
+
+SUMMARY_PROMPT = """You are keeping notes on a conversation between a therapist and a patient.
+
+Summary of the conversation so far:
+{summary}
+
+Next part of the conversation:
+{transcript}
+
+Update the summary with the next part of the conversation, in at most {max_words} words.
+Keep the names, facts, feelings and promises the conversation may come back to. Answer with the summary only."""
+
+
+
+class TranscriptProvider:
+    """Transcripts of the chat history that fit in a token budget.
+
+    Without a budget, `get()` returns the whole transcript. With one, the last
+    `keep_turns` chat lines are kept verbatim and the older ones are replaced
+    by a summary. `summarize(prompt)` brings the summary up to date every
+    `summary_every` chat lines, on `executor` when it is given, and the lines
+    it does not cover yet stay verbatim until then. The oldest verbatim lines
+    are left out when they do not fit in the budget.
+    """
+
+    def __init__(self, chat_history, summarize, keep_turns=20, summary_every=10, summary_words=150, executor=None):
+        if keep_turns < 1 or summary_every < 1:
+            raise Exception(f"Invalid transcript options: keep {keep_turns} turns, summary every {summary_every} turns")
+        self.chat_history  = chat_history
+        self.summarize     = summarize
+        self.keep_turns    = keep_turns
+        self.summary_every = summary_every
+        self.summary_words = summary_words
+        self.executor      = executor
+
+        self.summary       = None
+        # Number of chat lines covered by `summary`.
+        self.summary_lines = 0
+        self._summarizing  = False
+        self._lock         = threading.Lock()
+
+
+    def _update_summary(self, prompt, start, end):
+        try:
+            response = self.summarize(prompt)
+        except Exception as e:
+            logging.error(f"Transcript | Summary of chat lines {start} to {end} failed: {e}")
+            response = None
+
+        with self._lock:
+            self._summarizing = False
+            if response and self.summary_lines == start:
+                self.summary       = response.strip()
+                self.summary_lines = end
+                logging.info(f"Transcript | Summarized chat lines {start} to {end}")
+
+
+    def _maybe_summarize(self):
+        """Summarize the chat lines older than the last `keep_turns`, once `summary_every` of them are not covered."""
+        end = self.chat_history.lines - self.keep_turns
+        with self._lock:
+            if self._summarizing or end - self.summary_lines < self.summary_every:
+                return
+            summary, start = self.summary, self.summary_lines
+            self._summarizing = True
+
+        prompt = SUMMARY_PROMPT.format(
+            summary    = summary or "(The conversation just started.)",
+            transcript = self.chat_history.render_lines(start, end).strip(),
+            max_words  = self.summary_words,
+        )
+        if self.executor is None:
+            self._update_summary(prompt, start, end)
+            return
+        try:
+            self.executor.submit(self._update_summary, prompt, start, end)
+        except RuntimeError as e:
+            # The executor is shut down with the session.
+            with self._lock:
+                self._summarizing = False
+            logging.warning(f"Transcript | Summary not started: {e}")
+
+
+    def get(self, budget=None, limit=None):
+        """Transcript of the chat history in at most `budget` tokens.
+
+        With `limit`, only the last `limit` chat lines are given, without summary.
+        """
+        if budget is None:
+            return self.chat_history.transcript(limit)
+
+        max_chars = budget * CHARS_PER_TOKEN
+        if limit:
+            return self.chat_history.transcript(limit, max_chars=max_chars)
+
+        self._maybe_summarize()
+        with self._lock:
+            summary, summary_lines = self.summary, self.summary_lines
+
+        prefix = f"{SUMMARY_HEADER}{summary}\n\n" if summary else ""
+        if len(prefix) + len(TRANSCRIPT_HEADER) + len(TRANSCRIPT_FOOTER) > max_chars:
+            prefix, summary_lines = "", 0
+        return prefix + self.chat_history.transcript(first_line=summary_lines, max_chars=max_chars - len(prefix))
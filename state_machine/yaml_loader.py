@@ -0,0 +1,69 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+# Below this number of files the start-up cost of a process pool outweighs parsing.
+MIN_PARALLEL_FILES = 32
+
+
+def using_libyaml():
+    return SafeLoader.__name__ == "CSafeLoader"
+
+
+def safe_load(stream):
+    """`yaml.safe_load` using the libyaml C loader when it is available."""
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def _parse(path, content):
+    try:
+        return safe_load(content), None
+    except yaml.YAMLError as e:
+        return None, str(e)
+
+
+def _parse_chunk(chunk):
+    return [_parse(path, content) for path, content in chunk]
+
+
+def parse_yaml_contents(contents, max_workers=None, min_parallel=MIN_PARALLEL_FILES):
+    """Parse `{path: bytes}` into `{path: data}`, in a process pool for large batches.
+
+    Raises `yaml.YAMLError` naming the first file that failed to parse.
+    """
+    items = list(contents.items())
+    if len(items) < min_parallel:
+        results = [_parse(path, content) for path, content in items]
+    else:
+        max_workers = max_workers or os.cpu_count() or 1
+        chunks = [items[i::max_workers] for i in range(max_workers)]
+        results = [None] * len(items)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for i, chunk_results in enumerate(executor.map(_parse_chunk, chunks)):
+                results[i::max_workers] = chunk_results
+
+    parsed = {}
+    for (path, _), (data, error) in zip(items, results):
+        if error:
+            logging.error(f"Error parsing YAML file {path}: {error}")
+            raise yaml.YAMLError(f"{path}: {error}")
+        parsed[path] = data
+    return parsed
+
+
+def load_yaml_files(paths, max_workers=None, min_parallel=MIN_PARALLEL_FILES):
+    """Read and parse YAML files into `{path: data}`."""
+    contents = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            contents[Path(path)] = f.read()
+    return parse_yaml_contents(contents, max_workers, min_parallel)
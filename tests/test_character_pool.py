@@ -0,0 +1,51 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+from llms.registry import override_llms
+from state_machine import scenemanager
+from state_machine.clock import VirtualClock
+
+
+SCRIPT_DIR = Path(__file__).parent.parent / "scripts" / "friendly-fires"
+
+
+@pytest.fixture(autouse=True)
+def stub_llm():
+    override_llms("stub-template")
+    yield
+    override_llms(None)
+
+
+@pytest.fixture
+def sm(tmp_path):
+    model = scenemanager.SceneManagerData(VirtualClock())
+    sm = scenemanager.get_scene_manager(model, tmp_path, SCRIPT_DIR, None,
+        mode="simulation", use_hub=False, wait_for_speak_callback=False, auto_speak=True,
+        llm_workers=0, prefetch_bots=False, speculative=False, hot_reload=False)
+    yield sm
+    sm.close()
+
+
+def get_entered_states(caplog, bot):
+    messages = [record.getMessage() for record in caplog.records]
+    return [message.split("'")[1] for message in messages if f"{bot.display_name} | Entering '" in message]
+
+
+def test_reset_character_enters_init_like_a_new_one(sm, caplog):
+    definition = sm._get_bot_definition(sm.scene_params["s_INTRO_smalltalk"]["characters"][0])
+
+    caplog.set_level(logging.DEBUG)
+    bot = sm._create_bot(definition)
+    assert get_entered_states(caplog, bot) == ["s_init"]
+    bot.e_init()
+    assert bot.current_state.id != "s_init"
+    sm._releaseBots([bot])
+
+    caplog.clear()
+    reused = sm._create_bot(definition)
+    assert reused is bot
+    assert reused.current_state.id == "s_init"
+    assert get_entered_states(caplog, reused) == ["s_init"]
+    assert reused.data.speak_counter == 0
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+
+from llms.registry import override_llms
+from state_machine import scenemanager
+from state_machine.clock import VirtualClock
+from state_machine.replay import run_until
+from state_machine.scene_loader import LazySceneParams
+
+
+SCRIPT_DIR = Path(__file__).parent.parent / "scripts" / "friendly-fires"
+
+
+@pytest.fixture(autouse=True)
+def stub_llm():
+    override_llms("stub-template")
+    yield
+    override_llms(None)
+
+
+def run_session(output_path, lazy_scenes, turns=40):
+    """Scene path of a simulated session of `turns` user messages on a virtual clock."""
+    Path(output_path).mkdir(parents=True)
+    clock = VirtualClock()
+    model = scenemanager.SceneManagerData(clock)
+    sm = scenemanager.get_scene_manager(model, output_path, SCRIPT_DIR, None,
+        mode="simulation", use_hub=False, wait_for_speak_callback=False, auto_speak=True,
+        llm_workers=0, prefetch_bots=False, speculative=False, hot_reload=False, seed=1, lazy_scenes=lazy_scenes)
+    try:
+        sm.add_web_user("Patient", "Test Patient")
+        run_until(sm, clock, 1.0)
+        for turn in range(turns):
+            if sm.current_state.final:
+                break
+            sm.put_message({"command": "chat", "data": {"user": "Patient", "message": f"This is what I have to say at turn {turn}."}})
+            run_until(sm, clock, clock.monotonic() + 5.0)
+        return sm.scene_path
+    finally:
+        sm.close()
+
+
+def test_lazy_scene_params_resolve_on_first_access():
+    calls = []
+    params = LazySceneParams({name: (lambda name=name: calls.append(name) or {"name": name}) for name in ["a", "b"]})
+    assert "b" in params and len(params) == 2
+    assert params["b"] == {"name": "b"}
+    assert params["b"] == {"name": "b"}
+    assert calls == ["b"]
+    assert [value["name"] for value in params.values()] == ["a", "b"]
+    assert calls == ["b", "a"]
+
+
+def test_lazy_scenes_play_like_eager_scenes(tmp_path):
+    eager = run_session(tmp_path / "eager", lazy_scenes=False)
+    lazy  = run_session(tmp_path / "lazy", lazy_scenes=True)
+    assert lazy == eager
@@ -0,0 +1,93 @@
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from llms.registry import override_llms
+from state_machine import scenemanager
+from state_machine.clock import VirtualClock
+from state_machine.recorder import RECORDING_FILE_NAME, load_recording
+from state_machine.replay import replay_session, run_until
+
+
+SCRIPT_DIR = Path(__file__).parent.parent / "scripts" / "friendly-fires"
+
+
+@pytest.fixture(autouse=True)
+def stub_llm():
+    override_llms("stub-template")
+    yield
+    override_llms(None)
+
+
+def record_session(output_path, turns, llm_workers):
+    """Record a simulated session of `turns` user messages on a virtual clock, returns the recording path."""
+    Path(output_path).mkdir(parents=True)
+    clock = VirtualClock()
+    model = scenemanager.SceneManagerData(clock)
+    sm = scenemanager.get_scene_manager(model, output_path, SCRIPT_DIR, None,
+        mode="simulation", use_hub=False, wait_for_speak_callback=False, auto_speak=True,
+        llm_workers=llm_workers, prefetch_bots=False, speculative=False, hot_reload=False, record=True)
+    try:
+        sm.add_web_user("Patient", "Test Patient")
+        run_until(sm, clock, 1.0)
+        for turn in range(turns):
+            if sm.current_state.final:
+                break
+            sm.put_message({"command": "chat", "data": {"user": "Patient", "message": f"This is what I have to say at turn {turn}."}})
+            run_until(sm, clock, clock.monotonic() + 5.0)
+            # The virtual clock does not wait for the workers.
+            time.sleep(0.01)
+        run_until(sm, clock, clock.monotonic() + 600.0)
+    finally:
+        sm.close()
+    return Path(output_path, RECORDING_FILE_NAME)
+
+
+def write_recording(path, header, events):
+    with open(path, "w", encoding="utf-8") as f:
+        for event in [header] + events:
+            f.write(json.dumps(event) + "\n")
+
+
+def replay(recording, output_path):
+    Path(output_path).mkdir(parents=True)
+    return replay_session(recording, output_path)
+
+
+def test_replay_of_inline_recording(tmp_path):
+    recording = record_session(tmp_path / "record", 60, llm_workers=0)
+    report = replay(recording, tmp_path / "replay")
+    assert report["recorded_scene_path"]
+    assert not report["diverged"]
+    assert report["llm"]["misses"] == 0
+
+
+def test_replay_of_recording_with_workers(tmp_path):
+    recording = record_session(tmp_path / "record", 60, llm_workers=4)
+    report = replay(recording, tmp_path / "replay")
+    assert report["scene_path"][-1] == report["recorded_scene_path"][-1]
+
+
+def test_replay_of_interrupted_session(tmp_path):
+    # The calls still running when a session is cut off are not recorded.
+    header, events = load_recording(record_session(tmp_path / "record", 60, llm_workers=4))
+    last_calls = [index for index, event in enumerate(events) if event["type"] == "llm"][-3:]
+    events = [event for index, event in enumerate(events) if index < last_calls[0] or event["type"] != "llm"]
+    write_recording(tmp_path / "interrupted.jsonl", header, events)
+
+    report = replay(tmp_path / "interrupted.jsonl", tmp_path / "replay")
+    assert report["llm"]["unanswered"] > 0
+    assert report["scene_path"]
+
+
+def test_replay_reaches_last_scene_after_timeout(tmp_path):
+    # The virtual time of a replay drifts from the recording, the last timeout fires a little later.
+    header, events = load_recording(record_session(tmp_path / "record", 60, llm_workers=0))
+    assert events[-1]["type"] == "scene"
+    events[-1]["t"] -= 0.5
+    write_recording(tmp_path / "drifted.jsonl", header, events)
+
+    report = replay(tmp_path / "drifted.jsonl", tmp_path / "replay")
+    assert not report["diverged"]